@@ -3,6 +3,8 @@ import pickle
 from re import S
 import psycopg2
 
+from EP_FileUtilities import replace_file
+
 # =============================================================================
 # Find Heating Type for Commercial Buildings 
 # =============================================================================
@@ -339,8 +341,7 @@ def upload_to_buildingids(conn_information, sim_results_folderpath):
     updated_row = str(buildingid) + ',' + updated_row_split[1] + ',' + updated_row_split[2] + ',' + updated_row_split[3] + ',' + updated_row_split[4]
     lines[row_number] = updated_row
     
-    with open(sim_information_filepath, 'w') as file:
-        file.writelines(lines)
+    replace_file(sim_information_filepath, lambda file: file.writelines(lines))
     
     return buildingid
 
@@ -7,9 +7,13 @@ import dateutil
 from dateutil.parser import isoparse
 import csv
 import time
+import threading
 
 import datetime as dt 
 
+from EP_DataCache import invalidate_building
+from EP_FileUtilities import replace_file
+
 # Reviewed 
 
 # =============================================================================
@@ -183,8 +187,17 @@ def already_uploaded(simulation_settings, buildingid, variable=None, subvariable
 # =============================================================================
 # Update Time Series Data CSV
 # =============================================================================
+
+# Serializes the read-modify-write updates of TimeSeriesData_Information.csv by the upload threads of pipelined_data_generation
+TIMESERIESDATA_INFORMATION_LOCK = threading.Lock()
+
 def update_timeseriesdata_information_csv(buildingid, variablename, field, new_value, subvariablename=None):
     
+    with TIMESERIESDATA_INFORMATION_LOCK:
+        return _update_timeseriesdata_information_csv(buildingid, variablename, field, new_value, subvariablename)
+
+def _update_timeseriesdata_information_csv(buildingid, variablename, field, new_value, subvariablename=None):
+    
     if subvariablename is None: subvariablename = 'NA'
     
     # Define the path to the CSV file
@@ -219,15 +232,13 @@ def update_timeseriesdata_information_csv(buildingid, variablename, field, new_v
         new_lines.append(new_line)
 
         # Write the new line to the CSV
-        with open(filepath, 'w') as file:
-            file.writelines("\n".join(new_lines) + "\n")  # Ensure proper newline formatting
+        replace_file(filepath, lambda file: file.writelines("\n".join(new_lines) + "\n"))  # Ensure proper newline formatting
         
         # Call the function recursively to now update the newly added line
-        return update_timeseriesdata_information_csv(buildingid, variablename, field, new_value, subvariablename)
+        return _update_timeseriesdata_information_csv(buildingid, variablename, field, new_value, subvariablename)
     
     # Write the updated lines back to the CSV file
-    with open(filepath, 'w') as file:
-        file.writelines("\n".join(new_lines) + "\n")  # Ensure proper newline formatting
+    replace_file(filepath, lambda file: file.writelines("\n".join(new_lines) + "\n"))  # Ensure proper newline formatting
 
     return
 
@@ -389,6 +400,8 @@ def upload_variable_timeseriesdata(conn_information, buildingid, variablename, s
                         end_time = time.time()
                         elapsed_time = convert_seconds_to_hhmmss(end_time - start_time)
                         update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Time', elapsed_time, systemnodename_value)
+    
+    invalidate_building(buildingid)
                                 
 # =============================================================================
 # Upload Time Series Data from Pickle File
@@ -1,33 +1,356 @@
 import os
+import io
+import importlib.util
+import json
 import pickle
 from re import S
 import psycopg2
-from flask import Flask
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+from flask import Flask, Response, request, stream_with_context
+
+from EP_DataRetrieval import build_timeseriesdata_query, build_eiotabledata_query, apply_resample, stream_query
 
 # =============================================================================
-# Initialize Server
+# Stream Query Results over HTTP
 # =============================================================================  
 
-def initialize_server(app_name, host='0.0.0.0', port=None):
-    app = Flask(app_name)
+# Mimetype of each supported streaming format
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+# Arrow type of the non-text columns returned by the retrieval queries, every other column is a string
+STREAM_ARROW_TYPES = {'timeseriesdataid': 'int64', 'eiotabledataid': 'int64', 'buildingid': 'int64', 'value': 'float64', 'floatvalue': 'float64'}
+
+def encode_stream(chunks, output_format, select_columns=None):
+    """
+    Encodes a stream of DataFrame chunks into NDJSON, CSV or Arrow IPC stream bytes, one piece per chunk.
+
+    Args:
+        chunks (iterable): DataFrames as yielded by EP_DataRetrieval.stream_query.
+        output_format (str): 'ndjson', 'csv' or 'arrow'.
+        select_columns (list of str, optional): Column names of the query. For 'arrow' they fix the stream schema 
+                                                (see STREAM_ARROW_TYPES), so that a chunk whose text column is all 
+                                                None does not change it. Without them the first chunk's schema is used.
+
+    Yields:
+        bytes: The encoded chunk. Only one chunk is held in memory at a time.
+    """
     
-    # Set default port if not provided
-    if port is None:
-        port = int(os.environ.get("PORT", 5000))
+    if output_format == 'arrow':
+        import pyarrow as pa
+        
+        sink = io.BytesIO()
+        writer = None
+        schema = None
+        if select_columns is not None:
+            schema = pa.schema([(c, pa.type_for_alias(STREAM_ARROW_TYPES.get(c, 'string'))) for c in select_columns])
+        
+        for df in chunks:
+            batch = pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+            if schema is None: schema = batch.schema
+            if writer is None: writer = pa.ipc.new_stream(sink, schema)
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+        
+        # An empty result is still a valid stream when the schema is known
+        if writer is None and schema is not None: writer = pa.ipc.new_stream(sink, schema)
+        if writer is not None:
+            writer.close()
+            yield sink.getvalue()
+        
+        return
+    
+    first_chunk = True
+    for df in chunks:
+        if output_format == 'csv':
+            yield df.to_csv(index=False, header=first_chunk).encode('utf-8')
+        else:
+            records = df.to_json(orient='records', lines=True, date_format='iso')
+            if not records.endswith('\n'): records += '\n'
+            yield records.encode('utf-8')
+        first_chunk = False
+
+def create_app(app_name, conn_information=None, min_connections=1, max_connections=10):
+    """
+    Creates the Flask application that serves the retrieval functions over HTTP.
+
+    Endpoints:
+        /                 : Health check.
+        /timeseriesdata   : Filters of retrieve_timeseriesdata as query parameters (buildingid, startdatetime, 
+                            enddatetime, timeresolution, variable, subvariabletype, subvariable, resample, aggregation).
+        /eiotabledata     : Filters of retrieve_eiotabledata as query parameters (buildingid, tablename, zonename, variablename).
+    
+    Both data endpoints also accept `format` ('ndjson' default, 'csv' or 'arrow', which requires pyarrow) and 
+    `chunksize` (rows per chunk, default 50000). Responses are chunked: rows are read through a server-side cursor 
+    on a pooled connection and encoded one chunk at a time, so the full result set is never held in server memory.
+
+    Args:
+        app_name (str): Name of the Flask application.
+        conn_information (str, optional): The connection string or information required to connect to the PostgreSQL 
+                                          database. If None, only the health check is served.
+        min_connections (int): Connections kept open in the pool.
+        max_connections (int): Maximum number of concurrent database connections.
+
+    Returns:
+        Flask: The application.
+    """
+    
+    app = Flask(app_name)
     
     # Additional setup or routes can be added here
     @app.route('/')
     def home():
         return "Server Running"
     
-    # Run the server
-    app.run(host=host, port=port)
+    if conn_information is None:
+        return app
+    
+    pool = ThreadedConnectionPool(min_connections, max_connections, conn_information)
+    app.config['CONNECTION_POOL'] = pool
+    
+    def stream_response(query, params, select_columns):
+        
+        output_format = request.args.get('format', 'ndjson')
+        chunksize = request.args.get('chunksize', 50000, type=int)
+        
+        if output_format not in STREAM_MIMETYPES:
+            return Response(json.dumps({'error': 'format must be one of ' + ', '.join(STREAM_MIMETYPES)}), status=400, mimetype='application/json')
+        
+        if output_format == 'arrow' and importlib.util.find_spec('pyarrow') is None:
+            return Response(json.dumps({'error': 'arrow format requires pyarrow on the server'}), status=400, mimetype='application/json')
+        
+        def generate():
+            conn = pool.getconn()
+            chunks = stream_query(conn_information, query, params, select_columns, chunksize=chunksize, conn=conn)
+            try:
+                yield from encode_stream(chunks, output_format, select_columns)
+            finally:
+                # Close the cursor and end the transaction (stream_query's finally) before the connection is reused
+                chunks.close()
+                pool.putconn(conn)
+        
+        return Response(stream_with_context(generate()), mimetype=STREAM_MIMETYPES[output_format])
+    
+    @app.route('/timeseriesdata')
+    def timeseriesdata():
+        args = request.args
+        query, params, select_columns = build_timeseriesdata_query(args.get('buildingid', type=int), args.get('startdatetime'), args.get('enddatetime'), 
+                                                                   args.get('timeresolution'), args.get('variable'), args.get('subvariabletype'), args.get('subvariable'))
+        try:
+            query, params, select_columns = apply_resample(query, params, select_columns, args.get('resample'), args.get('aggregation', 'mean'))
+        except ValueError as e:
+            return Response(json.dumps({'error': str(e)}), status=400, mimetype='application/json')
+        
+        return stream_response(query, params, select_columns)
+    
+    @app.route('/eiotabledata')
+    def eiotabledata():
+        args = request.args
+        query, params, select_columns = build_eiotabledata_query(args.get('buildingid', type=int), args.get('tablename'), args.get('zonename'), args.get('variablename'))
+        
+        return stream_response(query, params, select_columns)
+    
+    return app
+
+# =============================================================================
+# Initialize Server
+# =============================================================================  
+
+def initialize_server(app_name, host='0.0.0.0', port=None, conn_information=None, max_connections=10):
+    """
+    Starts the Flask server. If conn_information is given, the retrieval endpoints of create_app are served 
+    from one warm, connection-pooled process that several analysts can share.
+    """
+    
+    app = create_app(app_name, conn_information, max_connections=max_connections)
+    
+    # Set default port if not provided
+    if port is None:
+        port = int(os.environ.get("PORT", 5000))
+    
+    # Run the server, threaded so several clients can stream at once
+    app.run(host=host, port=port, threaded=True)
+
+# =============================================================================
+# Schema Bootstrap
+# =============================================================================  
+
+# Current schema version. Add a new entry to SCHEMA_MIGRATIONS and bump this
+# number whenever the tables, indexes or constraints change.
+SCHEMA_VERSION = 3
+
+SCHEMA_MIGRATIONS = {
+    1: [
+        """
+        CREATE TABLE IF NOT EXISTS buildingids (
+            buildingid SERIAL PRIMARY KEY,
+            buildingcategory TEXT,
+            buildingtype TEXT,
+            buildingstandard TEXT,
+            buildingstandardyear TEXT,
+            buildinglocation TEXT,
+            buildingheatingtype TEXT,
+            buildingfoundationtype TEXT,
+            buildingclimatezone TEXT,
+            buildingprototype TEXT,
+            buildingconfiguration TEXT
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS timeseriesdata (
+            timeseriesdataid SERIAL PRIMARY KEY,
+            buildingid INTEGER REFERENCES buildingids(buildingid),
+            datetime TEXT,
+            timeresolution TEXT,
+            variablename TEXT,
+            schedulename TEXT, 
+            zonename TEXT, 
+            surfacename TEXT,
+            systemnodename TEXT,
+            value REAL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS eiotabledata (
+            eiotabledataid SERIAL PRIMARY KEY,
+            buildingid INTEGER REFERENCES buildingids(buildingid),
+            tablename TEXT,
+            zonename TEXT,
+            variablename TEXT,
+            stringvalue TEXT,
+            floatvalue REAL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS timeseriesdata_building_variable_datetime_idx ON timeseriesdata (buildingid, variablename, datetime);",
+        "CREATE INDEX IF NOT EXISTS eiotabledata_building_table_idx ON eiotabledata (buildingid, tablename);",
+    ],
+    # In-database aggregation: zone -> aggregation zone mapping and aggregated results
+    2: [
+        """
+        CREATE TABLE IF NOT EXISTS aggregationzones (
+            buildingid INTEGER REFERENCES buildingids(buildingid),
+            aggregationconfig TEXT,
+            aggregationzonename TEXT,
+            zonename TEXT,
+            PRIMARY KEY (buildingid, aggregationconfig, zonename)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS aggregatedtimeseriesdata (
+            aggregatedtimeseriesdataid SERIAL PRIMARY KEY,
+            buildingid INTEGER REFERENCES buildingids(buildingid),
+            aggregationconfig TEXT,
+            aggregationtype TEXT,
+            aggregationzonename TEXT,
+            datetime TEXT,
+            timeresolution TEXT,
+            variablename TEXT,
+            value REAL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS aggregatedtimeseriesdata_building_config_idx ON aggregatedtimeseriesdata (buildingid, aggregationconfig, aggregationtype, variablename, datetime);",
+    ],
+    # Normalization statistics per variable across the catalog, the sketch is kept so results can be merged later
+    3: [
+        """
+        CREATE TABLE IF NOT EXISTS variablestatistics (
+            variablename TEXT,
+            timeresolution TEXT,
+            buildingcount INTEGER,
+            valuecount BIGINT,
+            mean DOUBLE PRECISION,
+            std DOUBLE PRECISION,
+            minvalue DOUBLE PRECISION,
+            maxvalue DOUBLE PRECISION,
+            quantiles TEXT,
+            sketch TEXT,
+            updatedon TIMESTAMP DEFAULT now(),
+            PRIMARY KEY (variablename, timeresolution)
+        );
+        """,
+    ],
+}
+
+# Connection strings whose schema has already been bootstrapped by this process
+_initialized_schemas = set()
+
+def initialize_database_schema(conn_information):
+    """
+    Creates every table, index and constraint used by the application and applies pending schema migrations.
+
+    All statements run inside a single transaction using CREATE ... IF NOT EXISTS, so calling this on an 
+    already initialized database costs one round trip. The applied version is recorded in the `schemaversion` 
+    table. An advisory lock keeps concurrent processes from bootstrapping at the same time. The bootstrap 
+    only runs once per process for each connection string.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+
+    Returns:
+        int: The schema version of the database after bootstrapping.
+    """
+    
+    if conn_information in _initialized_schemas:
+        return SCHEMA_VERSION
+    
+    conn = psycopg2.connect(conn_information)
+    cur = conn.cursor()
+    
+    try:
+        # Serialize bootstrapping across processes, released at the end of the transaction
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('ep_datamanagement_schema'));")
+        
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schemaversion (
+                version INTEGER PRIMARY KEY,
+                appliedon TIMESTAMP DEFAULT now()
+            );
+            """)
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schemaversion;")
+        current_version = cur.fetchone()[0]
+        
+        # Apply pending migrations in order
+        for version in sorted(SCHEMA_MIGRATIONS):
+            if version > current_version:
+                for statement in SCHEMA_MIGRATIONS[version]:
+                    cur.execute(statement)
+                cur.execute("INSERT INTO schemaversion (version) VALUES (%s);", (version,))
+                current_version = version
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    
+    _initialized_schemas.add(conn_information)
+    
+    return current_version
 
 # =============================================================================
 # Check Table Exists
 # =============================================================================  
 
 def check_table_exists(conn_information, schema_name, tablename):
+    """
+    Checks whether a table exists and, if it does, whether it is empty.
+
+    Emptiness is probed with EXISTS (SELECT 1 ... LIMIT 1), which stops at the first row instead of 
+    counting the whole table.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        schema_name (str): The schema containing the table.
+        tablename (str): The name of the table.
+
+    Returns:
+        tuple: (table_exists, is_empty). is_empty is None if the table does not exist.
+    """
+    
     conn = psycopg2.connect(conn_information)
     cur = conn.cursor()
     
@@ -41,11 +364,14 @@ def check_table_exists(conn_information, schema_name, tablename):
     );
     """
     
-    # Query to count the number of rows in the table
-    check_empty_query = """
-    SELECT COUNT(*) 
-    FROM {schema}.{table};
-    """.format(schema=schema_name, table=tablename)
+    # Query to check if the table has at least one row
+    check_empty_query = sql.SQL("""
+    SELECT EXISTS (
+        SELECT 1 
+        FROM {schema}.{table}
+        LIMIT 1
+    );
+    """).format(schema=sql.Identifier(schema_name), table=sql.Identifier(tablename))
     
     # Execute the query to check if the table exists
     cur.execute(check_table_query, (schema_name, tablename))
@@ -57,8 +383,7 @@ def check_table_exists(conn_information, schema_name, tablename):
     # Only check if the table is empty if it exists
     if table_exists:
         cur.execute(check_empty_query)
-        row_count = cur.fetchone()[0]
-        is_empty = (row_count == 0)
+        is_empty = not cur.fetchone()[0]
     
     # Clean up
     cur.close()
@@ -16,110 +16,682 @@
 
 # External Modules
 import os
+import time
+import numpy as np
 import pandas as pd
 import pickle
 from re import S
 import psycopg2
-import copy
+from psycopg2.extras import execute_values
+import scipy.sparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Custom Modules
+from Database_Creator import initialize_database_schema
+from EP_EquipmentLevels import compute_equipment_levels, get_eio_columns
+from EP_FileUtilities import replace_file
+
+# =============================================================================
+# Aggregation Settings
+# =============================================================================
+
+# Supported aggregation types and the zone property used as weight (None = equal weights)
+AGGREGATION_WEIGHTS = {'Average': None, 'AreaWeighted': 'Floor Area', 'VolumeWeighted': 'Volume', 'Sum': None}
+
+# =============================================================================
+# Get Zone Floor Areas and Volumes from EIO Data
+# =============================================================================
+
+def get_zone_geometry(eio_outputfile_dict):
+    """
+    Extracts the floor area and volume of every zone from the processed EIO output.
+
+    Args:
+        eio_outputfile_dict (dict): The dictionary produced by EP_DataGenerator.Process_Eio_OutputFile.
+
+    Returns:
+        pandas.DataFrame: Indexed by upper-case zone name, with float columns 'Floor Area' and 'Volume'.
+    """
+    
+    zone_information = eio_outputfile_dict['Zone Information']
+    
+    columns = get_eio_columns(zone_information)
+    
+    zone_geometry = pd.DataFrame({
+        'Floor Area': pd.to_numeric(zone_information[columns['Floor Area']], errors='coerce').to_numpy(dtype=np.float64),
+        'Volume': pd.to_numeric(zone_information[columns['Volume']], errors='coerce').to_numpy(dtype=np.float64)},
+        index=zone_information[columns['Zone Name']].astype(str).str.strip().str.upper())
+    
+    return zone_geometry
+
+# =============================================================================
+# Build Zone to Aggregation Zone Weight Matrix
+# =============================================================================
+
+def build_aggregation_weight_matrix(zone_names, aggregation_zone_list, aggregation_type, zone_geometry=None):
+    """
+    Builds the sparse zone -> aggregation zone weight matrix.
+
+    Entry (i, j) is the weight of zone i in aggregation zone j. For 'Average', 'AreaWeighted' and 
+    'VolumeWeighted' each column sums to 1, so X @ W gives the weighted mean for a (time x zone) array X. 
+    For 'Sum' the weights are 1. Zones that are not in any aggregation zone have empty rows.
+
+    Args:
+        zone_names (list): Zone names defining the row order.
+        aggregation_zone_list (list of list): Zone names in each aggregation zone.
+        aggregation_type (str): One of AGGREGATION_WEIGHTS.
+        zone_geometry (pandas.DataFrame, optional): Output of get_zone_geometry, required for area and volume weighting.
+
+    Returns:
+        scipy.sparse.csr_matrix: Shape (len(zone_names), len(aggregation_zone_list)).
+    """
+    
+    if aggregation_type not in AGGREGATION_WEIGHTS:
+        raise ValueError("aggregation_type must be one of " + str(list(AGGREGATION_WEIGHTS)) + ", got " + repr(aggregation_type))
+    
+    weight_column = AGGREGATION_WEIGHTS[aggregation_type]
+    zone_position = {name.strip().upper(): i for i, name in enumerate(zone_names)}
+    
+    rows, cols = [], []
+    for j, aggregation_zone in enumerate(aggregation_zone_list):
+        for zone_name in aggregation_zone:
+            i = zone_position.get(zone_name.strip().upper())
+            if i is not None:
+                rows.append(i)
+                cols.append(j)
+    
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    
+    if weight_column is None:
+        weights = np.ones(len(rows), dtype=np.float64)
+    else:
+        if zone_geometry is None:
+            raise ValueError(aggregation_type + " aggregation requires zone_geometry")
+        zone_weights = zone_geometry[weight_column].reindex([name.strip().upper() for name in zone_names]).to_numpy()
+        weights = np.nan_to_num(zone_weights[rows])
+    
+    weight_matrix = scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(len(zone_names), len(aggregation_zone_list)))
+    
+    if aggregation_type != 'Sum':
+        weight_matrix = normalize_weight_columns(weight_matrix)
+    
+    return weight_matrix
+
+def normalize_weight_columns(weight_matrix):
+    """
+    Scales each column of a sparse weight matrix to sum to 1. Empty columns stay empty.
+    """
+    
+    column_sums = np.asarray(weight_matrix.sum(axis=0)).ravel()
+    scale = np.divide(1.0, column_sums, out=np.zeros_like(column_sums), where=column_sums != 0)
+    
+    return scipy.sparse.csr_matrix(weight_matrix @ scipy.sparse.diags(scale))
+
+# =============================================================================
+# Split Variable Columns into Key and Variable
+# =============================================================================
+
+def split_column_names(columns):
+    """
+    Splits EnergyPlus output column names of the form 'KEY:Variable Name [unit](TimeStep)' into their keys.
+
+    Returns:
+        list: Upper-case key (zone, surface, node or schedule name) of each column.
+    """
+    
+    return [str(column).split(':')[0].strip().upper() for column in columns]
 
 # =============================================================================
 # Aggregate Building from Pickle 
-# # =============================================================================
+# =============================================================================
         
-def aggregate_building(completed_simulation_folderpath, aggregation_zone_name, aggregation_zone_list, aggregation_type):
- 
-    # If Aggregation Folder does not exist, create it
-    
-    aggregation_folderpath = os.path.join(completed_simulation_folderpath, 'Sim_Aggregated_Data')
-    if not os.path.exists(aggregation_folderpath): os.makedirs(aggregation_folderpath)
-     
-    # Load the building pickle file
-    pickle_filepath = os.path.join(completed_simulation_folderpath, 'Sim_Processed_Data', 'IDF_OutputVariables_DictDF.pickle')
-    with open(pickle_filepath, "rb") as file: data = pickle.load(file)
-     
-    # Get Associated Areas and Volumes of each Zone
-     
-    # =============================================================================
-    # Initialize Aggregation_DF and Aggregation_DF_Equipment
-    # =============================================================================
+def aggregate_building(completed_simulation_folderpath, aggregation_zone_name, aggregation_zone_list, aggregation_type, save=True, incremental=False, update_information=True):
+    """
+    Aggregates the zone-level variables of one simulated building into aggregation zones.
 
-    # Creating Equipment List
-    Equipment_List = ['People', 'Lights', 'ElectricEquipment', 'GasEquipment', 'OtherEquipment', 'HotWaterEquipment', 'SteamEquipment']
+    For every zone-based variable the (time x zone) array is multiplied once by the sparse zone -> aggregation zone 
+    weight matrix (see build_aggregation_weight_matrix). If a variable is missing for some zones, the weights of 
+    each aggregation zone are renormalized over the zones that are present. Building-level variables (Facility, 
+    Site, Schedule, Surface and System Node) are carried over unchanged.
 
-    # Initializing Aggregation_DF
-    Aggregation_DF = pd.DataFrame()
+    Args:
+        completed_simulation_folderpath (str): Simulation results folder with ProcessedData/IDF_OutputVariables_DictDF.pickle 
+                                               and ProcessedData/Eio_OutputFile.pickle (see EP_DataGenerator).
+        aggregation_zone_name (str): Name stem of the aggregation zones, e.g. 'Aggregation_Zone' gives 
+                                     'Aggregation_Zone_1', 'Aggregation_Zone_2', ...
+        aggregation_zone_list (list of list): Zone names in each aggregation zone.
+        aggregation_type (str): 'Average', 'AreaWeighted', 'VolumeWeighted' or 'Sum'.
+        save (bool): If True, also write the result to Sim_Aggregated_Data/<aggregation_zone_name>_<aggregation_type>.npz 
+                     and record its last timestamp in Aggregation_Information.csv.
+        incremental (bool): If True and a saved result exists, only the timesteps after its last timestamp are aggregated 
+                            and appended to it, so extending a run costs time proportional to the new data. Falls back to 
+                            a full aggregation if the variables have changed since the saved result.
+        update_information (bool): If False, the last timestamp is not written to Aggregation_Information.csv. Worker 
+                                   processes leave that to the parent, see aggregate_building_task.
 
-    # FOR LOOP: For each Variable 
-    for key, value in data:
+    Returns:
+        dict: Array-backed aggregation result with keys
+            - 'DateTime_List': datetime64 array of length T.
+            - 'Aggregation_Zone_Names': array of the A aggregation zone names.
+            - 'Variable_Names': array of the V aggregated variable names.
+            - 'Aggregated_Values': float32 array of shape (V, T, A), NaN where no zone of an aggregation zone reports the variable.
+            - 'Building_Variable_Names': array of the B carried-over column names ('Variable | Column').
+            - 'Building_Values': float32 array of shape (T, B).
+            - 'Equipment_Names': array of the E equipment types found in the EIO nominal gains tables.
+            - 'Aggregated_Equipment_Levels': float32 array (E, T, A), '<Equipment>_Level' summed over the zones of each aggregation zone.
+            - 'Aggregated_Schedule_Values': float32 array (E, T, A), 'Schedule_Value_<Equipment>', the aggregated level divided 
+              by the aggregated nominal level.
+    """
+    
+    # Load the building pickle files
+    processed_folderpath = os.path.join(completed_simulation_folderpath, 'ProcessedData')
+    with open(os.path.join(processed_folderpath, 'IDF_OutputVariables_DictDF.pickle'), "rb") as file: data = pickle.load(file)
+    with open(os.path.join(processed_folderpath, 'Eio_OutputFile.pickle'), "rb") as file: eio_outputfile_dict = pickle.load(file)
+    
+    # Incremental mode: keep only the timesteps after the last aggregated one
+    previous_result = None
+    if incremental and os.path.exists(get_aggregation_filepath(completed_simulation_folderpath, aggregation_zone_name, aggregation_type)):
+        previous_result = load_aggregation_result(completed_simulation_folderpath, aggregation_zone_name, aggregation_type)
+        if len(previous_result['DateTime_List']) > 0:
+            new_rows = np.flatnonzero(pd.to_datetime(data['DateTime_List']).to_numpy() > previous_result['DateTime_List'][-1])
+            data = {key: (value.iloc[new_rows] if isinstance(value, pd.DataFrame) else [value[i] for i in new_rows]) for key, value in data.items()}
+        else:
+            previous_result = None
+    
+    # Get Associated Areas and Volumes of each Zone
+    zone_geometry = get_zone_geometry(eio_outputfile_dict)
+    zone_names = list(zone_geometry.index)
+    
+    weight_matrix = build_aggregation_weight_matrix(zone_names, aggregation_zone_list, aggregation_type, zone_geometry)
+    zone_position = {name: i for i, name in enumerate(zone_names)}
+    
+    datetime_list = pd.to_datetime(data['DateTime_List']).to_numpy()
+    aggregation_zone_names = np.array([aggregation_zone_name + '_' + str(i + 1) for i in range(len(aggregation_zone_list))])
+    
+    variable_names, aggregated_values = [], []
+    building_variable_names, building_values = [], []
+    
+    for variablename, variable_df in data.items():
         
-        # IF LOOP: For the Variable Name Schedule_Value_
-        if (key == 'Schedule_Value_'): # Create Schedule Columns which are needed
+        if variablename == 'DateTime_List':
+            continue
         
-            # FOR LOOP: For each element in Equipment_List
-            for element in Equipment_List:
-                
-                # Creating Current_EIO_Dict_Key
-                Current_EIO_Dict_Key = element + ' ' + '_Internal_Gains_Nominal.csv'
-                
-                # IF LOOP: To check if Current_EIO_Dict_Key is present in Eio_OutputFile_Dict
-                if (Current_EIO_Dict_Key in list(data.keys())):           
-                
-                    # Creating key1 for column Name
-                    key1 = key + element
-                
-                    # Initializing Aggregation_Dict with None
-                    Aggregation_DF[key1] = None    
+        values = variable_df.to_numpy(dtype=np.float32)
         
-        else: # For all other Columns
+        if not variablename.startswith('Zone'):
+            building_variable_names.extend(variablename + ' | ' + str(c) for c in variable_df.columns)
+            building_values.append(values)
+            continue
         
-            # Initializing Aggregation_Dict with None
-            Aggregation_DF[key] = None
-
-    # Initializing Aggregation_DF_Equipment
-    Aggregation_DF_Equipment = pd.DataFrame()        
-            
-    # FOR LOOP: For each element in Equipment_List
-    for element in Equipment_List:
+        # Rows of the weight matrix for the zones that report this variable
+        column_zones = split_column_names(variable_df.columns)
+        known_columns = [k for k, zone in enumerate(column_zones) if zone in zone_position]
+        variable_weights = weight_matrix[[zone_position[column_zones[k]] for k in known_columns]]
         
-        # Creating Current_EIO_Dict_Key
-        Current_EIO_Dict_Key = element + ' ' + '_Internal_Gains_Nominal.csv'
+        # Aggregation zones with no reporting zone are undefined rather than 0
+        present = np.asarray(variable_weights.sum(axis=0)).ravel() != 0
         
-        # IF LOOP: To check if Current_EIO_Dict_Key is present in Eio_OutputFile_Dict
-        if (Current_EIO_Dict_Key in list(data.keys())): # Key present in Eio_OutputFile_Dict            
+        if aggregation_type != 'Sum':
+            variable_weights = normalize_weight_columns(variable_weights)
         
-            # Creating key1 for column Name
-            key1 =  element + '_Level'
+        # (time x zone) @ (zone x aggregation zone), one product per variable
+        aggregated = np.asarray(variable_weights.T.dot(values[:, known_columns].T).T, dtype=np.float32)
+        aggregated[:, ~present] = np.nan
         
-            # Initializing Aggregation_Dict with None
-            Aggregation_DF_Equipment[key1] = None
-
-    # =============================================================================
-    # Initialize Aggregation_Dict 
-    # =============================================================================
+        variable_names.append(variablename)
+        aggregated_values.append(aggregated)
     
-        DateTime_List = data['DateTime_List']
+    # Equipment levels are extensive, they are summed over each aggregation zone
+    equipment_names = np.array([], dtype=str)
+    aggregated_equipment_levels = np.empty((0, len(datetime_list), len(aggregation_zone_list)), dtype=np.float32)
+    aggregated_schedule_values = np.empty((0, len(datetime_list), len(aggregation_zone_list)), dtype=np.float32)
+    
+    if 'Schedule Value' in data:
+        equipment = compute_equipment_levels(data['Schedule Value'], eio_outputfile_dict, zone_names)
+        membership_matrix = build_aggregation_weight_matrix(zone_names, aggregation_zone_list, 'Sum')
         
-        Aggregation_Zone_NameStem = 'Aggregation_Zone'
+        equipment_names = equipment['Equipment_Names']
+        aggregated_equipment_levels = np.asarray([membership_matrix.T.dot(levels.T).T for levels in equipment['Equipment_Levels']], dtype=np.float32).reshape(len(equipment_names), len(datetime_list), len(aggregation_zone_list))
+        aggregated_nominal = membership_matrix.T.dot(equipment['Nominal_Levels'].T).T
+        aggregated_schedule_values = np.divide(aggregated_equipment_levels, aggregated_nominal[:, np.newaxis, :], out=np.full_like(aggregated_equipment_levels, np.nan), where=aggregated_nominal[:, np.newaxis, :] != 0)
+    
+    aggregation_result = {
+        'DateTime_List': datetime_list,
+        'Aggregation_Zone_Names': aggregation_zone_names,
+        'Variable_Names': np.array(variable_names),
+        'Aggregated_Values': np.stack(aggregated_values) if aggregated_values else np.empty((0, len(datetime_list), len(aggregation_zone_list)), dtype=np.float32),
+        'Building_Variable_Names': np.array(building_variable_names),
+        'Building_Values': np.hstack(building_values) if building_values else np.empty((len(datetime_list), 0), dtype=np.float32),
+        'Equipment_Names': equipment_names,
+        'Aggregated_Equipment_Levels': aggregated_equipment_levels,
+        'Aggregated_Schedule_Values': aggregated_schedule_values}
+    
+    if previous_result is not None:
+        aggregation_result = append_aggregation_result(previous_result, aggregation_result)
+        if aggregation_result is None:
+            return aggregate_building(completed_simulation_folderpath, aggregation_zone_name, aggregation_zone_list, aggregation_type, save=save, incremental=False, update_information=update_information)
+    
+    if save:
+        save_aggregation_result(completed_simulation_folderpath, aggregation_zone_name, aggregation_type, aggregation_result)
+        if update_information and len(aggregation_result['DateTime_List']) > 0:
+            last_datetime = pd.Timestamp(aggregation_result['DateTime_List'][-1]).strftime('%Y-%m-%d %H:%M:%S')
+            update_aggregation_information(completed_simulation_folderpath, aggregation_zone_name, aggregation_type, 'Last Aggregated Datetime', last_datetime)
+    
+    return aggregation_result
 
-        # Initializing Aggregation_Dict
-        Aggregation_Dict = {'DateTime_List': DateTime_List}
+# =============================================================================
+# Append Newly Aggregated Timesteps
+# =============================================================================
 
-        # Initializing Counter
-        Counter = 0
+# Time axis of each array in an aggregation result
+AGGREGATION_TIME_AXES = {'DateTime_List': 0, 'Aggregated_Values': 1, 'Building_Values': 0, 'Aggregated_Equipment_Levels': 1, 'Aggregated_Schedule_Values': 1}
 
-        # FOR LOOP: For each element in Aggregation_Zone_List
-        for element in aggregation_zone_list:
-        
-            # Incrementing Counter
-            Counter = Counter + 1
-        
-            # Creating Aggregated Zone name 1 : For the Aggregated Time Series
-            Aggregated_Zone_Name_1 = Aggregation_Zone_NameStem + "_" + str(Counter)
-        
-            # Creating Aggregated Zone name 2 : For the Aggregated Equipment 
-            Aggregated_Zone_Name_2 = Aggregation_Zone_NameStem + "_Equipment_" + str(Counter)    
+def append_aggregation_result(previous_result, new_result):
+    """
+    Appends the timesteps of new_result to previous_result along the time axis.
+
+    Returns:
+        dict or None: The combined result, or None if the two results do not have the same keys (e.g. a result 
+                      saved before the equipment keys existed), aggregation zones, variables, building columns and equipment.
+    """
+    
+    if set(previous_result) != set(new_result):
+        return None
+    
+    for key in previous_result:
+        if key not in AGGREGATION_TIME_AXES and not np.array_equal(previous_result[key], new_result[key]):
+            return None
+    
+    combined_result = dict(previous_result)
+    for key, axis in AGGREGATION_TIME_AXES.items():
+        combined_result[key] = np.concatenate([previous_result[key], new_result[key]], axis=axis)
+    
+    return combined_result
+
+# =============================================================================
+# Save and Load Aggregation Results
+# =============================================================================
+
+def get_aggregation_filepath(completed_simulation_folderpath, aggregation_zone_name, aggregation_type):
+    """
+    Returns the filepath of the stored aggregation result for one building and aggregation configuration.
+    """
+    
+    return os.path.join(completed_simulation_folderpath, 'Sim_Aggregated_Data', aggregation_zone_name + '_' + aggregation_type + '.npz')
+
+def save_aggregation_result(completed_simulation_folderpath, aggregation_zone_name, aggregation_type, aggregation_result):
+    """
+    Writes an aggregation result to Sim_Aggregated_Data as an .npz file with one array per key.
+
+    Returns:
+        str: The filepath of the saved result.
+    """
+    
+    # If Aggregation Folder does not exist, create it
+    aggregation_filepath = get_aggregation_filepath(completed_simulation_folderpath, aggregation_zone_name, aggregation_type)
+    if not os.path.exists(os.path.dirname(aggregation_filepath)): os.makedirs(os.path.dirname(aggregation_filepath))
+    
+    np.savez(aggregation_filepath, **aggregation_result)
+    
+    return aggregation_filepath
+
+def load_aggregation_result(completed_simulation_folderpath, aggregation_zone_name, aggregation_type):
+    """
+    Loads an aggregation result saved by save_aggregation_result.
+
+    Returns:
+        dict: The aggregation result, see aggregate_building.
+    """
+    
+    aggregation_filepath = get_aggregation_filepath(completed_simulation_folderpath, aggregation_zone_name, aggregation_type)
+    
+    with np.load(aggregation_filepath) as arrays:
+        return {key: arrays[key] for key in arrays.files}
+
+# =============================================================================
+# Upload Aggregation Zone Mapping
+# =============================================================================
+
+def upload_aggregation_zones(conn_information, buildingid, aggregation_config, aggregation_zone_name, aggregation_zone_list):
+    """
+    Stores the zone -> aggregation zone mapping of one building and configuration in the aggregationzones table, 
+    replacing any previous mapping for that configuration.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        buildingid (int): The building the mapping applies to.
+        aggregation_config (str): Name of the aggregation configuration, e.g. 'Perimeter_Core'.
+        aggregation_zone_name (str): Name stem of the aggregation zones (see aggregate_building).
+        aggregation_zone_list (list of list): Zone names in each aggregation zone.
+
+    Returns:
+        None
+    """
+    
+    initialize_database_schema(conn_information)
+    
+    rows = [(buildingid, aggregation_config, aggregation_zone_name + '_' + str(j + 1), zone_name.strip().upper()) 
+            for j, aggregation_zone in enumerate(aggregation_zone_list) for zone_name in aggregation_zone]
+    
+    with psycopg2.connect(conn_information) as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM aggregationzones WHERE buildingid = %s AND aggregationconfig = %s", (buildingid, aggregation_config))
+            execute_values(cur, "INSERT INTO aggregationzones (buildingid, aggregationconfig, aggregationzonename, zonename) VALUES %s", rows)
+    
+    conn.close()
+
+# =============================================================================
+# Aggregate Building inside the Database
+# =============================================================================
+
+def aggregate_building_in_database(conn_information, buildingid, aggregation_config, aggregation_type, variables=None, startdatetime=None, enddatetime=None, incremental=False):
+    """
+    Aggregates the zone-level time series of one building inside PostgreSQL and stores the result in aggregatedtimeseriesdata.
+
+    timeseriesdata is joined with the aggregationzones mapping (see upload_aggregation_zones) and, for area or volume 
+    weighting, with the zone floor areas or volumes in eiotabledata, then grouped by aggregation zone, variable and 
+    timestamp. Only the reduced rows are written, no zone-level data leaves the server. Previously aggregated rows for 
+    the same building, configuration, type, variables and time range are replaced.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        buildingid (int): The building to aggregate.
+        aggregation_config (str): Name of the stored aggregation configuration.
+        aggregation_type (str): 'Average', 'AreaWeighted', 'VolumeWeighted' or 'Sum'.
+        variables (list of str, optional): Zone variables to aggregate. Default is all.
+        startdatetime, enddatetime (str, optional): Restrict the aggregation to this time range (inclusive).
+        incremental (bool, optional): Only aggregate timesteps after the last aggregated timestamp of this building, 
+                                      configuration and type, and append them instead of replacing. Default is False.
+
+    Returns:
+        int: The number of aggregated rows written.
+    """
+    
+    if aggregation_type not in AGGREGATION_WEIGHTS:
+        raise ValueError("aggregation_type must be one of " + str(list(AGGREGATION_WEIGHTS)) + ", got " + repr(aggregation_type))
+    
+    initialize_database_schema(conn_information)
+    
+    weight_column = AGGREGATION_WEIGHTS[aggregation_type]
+    
+    # Filters shared by the DELETE and the INSERT
+    filters = ""
+    filter_params = []
+    if incremental:
+        last_datetime = get_last_aggregated_datetime(conn_information, buildingid, aggregation_config, aggregation_type)
+        if last_datetime is not None:
+            filters += " AND datetime > %s"
+            filter_params.append(last_datetime)
+    if variables:
+        filters += " AND variablename = ANY(%s)"
+        filter_params.append(list(variables))
+    if startdatetime:
+        filters += " AND datetime >= %s"
+        filter_params.append(str(startdatetime))
+    if enddatetime:
+        filters += " AND datetime <= %s"
+        filter_params.append(str(enddatetime))
+    
+    delete_query = "DELETE FROM aggregatedtimeseriesdata WHERE buildingid = %s AND aggregationconfig = %s AND aggregationtype = %s" + filters
+    delete_params = [buildingid, aggregation_config, aggregation_type] + filter_params
+    
+    if weight_column is None:
+        weight_join = ""
+        weight_params = []
+        value_expression = "SUM(t.value)" if aggregation_type == 'Sum' else "AVG(t.value)"
+    else:
+        # EIO variables carry their unit, e.g. 'Floor Area {m2}'
+        weight_join = """
+            JOIN (
+                SELECT upper(trim(zonename)) AS zonename, MAX(floatvalue) AS weight
+                FROM eiotabledata
+                WHERE buildingid = %s AND tablename = 'Zone Information' AND variablename LIKE %s
+                GROUP BY 1
+            ) AS w ON w.zonename = a.zonename
+            """
+        weight_params = [buildingid, weight_column + '%']
+        value_expression = "SUM(t.value * w.weight) / NULLIF(SUM(w.weight), 0)"
+    
+    insert_query = f"""
+        INSERT INTO aggregatedtimeseriesdata (buildingid, aggregationconfig, aggregationtype, aggregationzonename, datetime, timeresolution, variablename, value)
+        SELECT t.buildingid, a.aggregationconfig, %s, a.aggregationzonename, t.datetime, t.timeresolution, t.variablename, ({value_expression})::real
+        FROM (
+            SELECT buildingid, datetime, timeresolution, variablename, upper(trim(zonename)) AS zonename, value
+            FROM timeseriesdata
+            WHERE buildingid = %s AND zonename <> 'NA'{filters}
+        ) AS t
+        JOIN aggregationzones AS a ON a.buildingid = t.buildingid AND a.aggregationconfig = %s AND a.zonename = t.zonename
+        {weight_join}
+        GROUP BY t.buildingid, a.aggregationconfig, a.aggregationzonename, t.datetime, t.timeresolution, t.variablename
+        """
+    insert_params = [aggregation_type, buildingid] + filter_params + [aggregation_config] + weight_params
+    
+    # Replace and insert in one transaction
+    with psycopg2.connect(conn_information) as conn:
+        with conn.cursor() as cur:
+            cur.execute(delete_query, delete_params)
+            cur.execute(insert_query, insert_params)
+            row_count = cur.rowcount
+    
+    conn.close()
+    
+    return row_count
+
+# =============================================================================
+# Get Last Aggregated Datetime in the Database
+# =============================================================================
+
+def get_last_aggregated_datetime(conn_information, buildingid, aggregation_config, aggregation_type):
+    """
+    Returns the last aggregated timestamp of a building, configuration and type in aggregatedtimeseriesdata, 
+    or None if nothing has been aggregated yet.
+    """
+    
+    conn = psycopg2.connect(conn_information)
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(datetime) FROM aggregatedtimeseriesdata WHERE buildingid = %s AND aggregationconfig = %s AND aggregationtype = %s", 
+                (buildingid, aggregation_config, aggregation_type))
+    last_datetime = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    
+    return last_datetime
+
+# =============================================================================
+# Retrieve Aggregated Time Series Data
+# =============================================================================
+
+def retrieve_aggregatedtimeseriesdata(conn_information, buildingid, aggregation_config, aggregation_type, aggregation_zone_name=None, variable=None, startdatetime=None, enddatetime=None):
+    """
+    Retrieves aggregated time series written by aggregate_building_in_database.
+
+    Returns:
+        pandas.DataFrame: Columns aggregationzonename, variablename, datetime, timeresolution and value, 
+                          ordered by aggregation zone, variable and datetime.
+    """
+    
+    select_columns = ['aggregationzonename', 'variablename', 'datetime', 'timeresolution', 'value']
+    
+    query = f"SELECT {', '.join(select_columns)} FROM aggregatedtimeseriesdata WHERE buildingid = %s AND aggregationconfig = %s AND aggregationtype = %s"
+    params = [buildingid, aggregation_config, aggregation_type]
+    
+    if aggregation_zone_name:
+        query += " AND aggregationzonename = %s"
+        params.append(aggregation_zone_name)
+    if variable:
+        query += " AND variablename = %s"
+        params.append(variable)
+    if startdatetime:
+        query += " AND datetime >= %s"
+        params.append(str(startdatetime))
+    if enddatetime:
+        query += " AND datetime <= %s"
+        params.append(str(enddatetime))
+    
+    query += " ORDER BY aggregationzonename, variablename, datetime"
+    
+    conn = psycopg2.connect(conn_information)
+    cur = conn.cursor()
+    cur.execute(query, params)
+    data = cur.fetchall()
+    cur.close()
+    conn.close()
+    
+    return pd.DataFrame(data, columns=select_columns)
+
+# =============================================================================
+# Aggregate One Building and Configuration (Worker Task)
+# =============================================================================
+
+def aggregate_building_task(completed_simulation_folderpath, aggregation_config, incremental=False):
+    """
+    Runs aggregate_building for one building and configuration inside a worker process.
+
+    The result is written to Sim_Aggregated_Data by the worker and only its filepath, timing and last timestamp are 
+    returned, so the arrays are never sent back to the parent process. Aggregation_Information.csv is only written 
+    by the parent, the workers would otherwise overwrite each other's updates.
+
+    Args:
+        completed_simulation_folderpath (str): Simulation results folder of the building.
+        aggregation_config (dict): With keys 'aggregation_zone_name', 'aggregation_zone_list' and 'aggregation_type'.
+        incremental (bool): Passed to aggregate_building.
+
+    Returns:
+        dict: 'folderpath', 'aggregation_zone_name', 'aggregation_type', 'status' ('Complete' or the error message), 
+              'seconds', 'filepath' and 'last_datetime' (None if nothing was aggregated).
+    """
+    
+    start_time = time.time()
+    filepath = None
+    last_datetime = None
+    
+    try:
+        aggregation_result = aggregate_building(completed_simulation_folderpath, aggregation_config['aggregation_zone_name'], aggregation_config['aggregation_zone_list'], aggregation_config['aggregation_type'], save=True, incremental=incremental, update_information=False)
+        if len(aggregation_result['DateTime_List']) > 0:
+            last_datetime = pd.Timestamp(aggregation_result['DateTime_List'][-1]).strftime('%Y-%m-%d %H:%M:%S')
+        filepath = get_aggregation_filepath(completed_simulation_folderpath, aggregation_config['aggregation_zone_name'], aggregation_config['aggregation_type'])
+        status = 'Complete'
+    except Exception as e:
+        status = 'Failed: ' + str(e).replace(',', ';').replace('\n', ' ')
+    
+    return {'folderpath': completed_simulation_folderpath, 
+            'aggregation_zone_name': aggregation_config['aggregation_zone_name'], 
+            'aggregation_type': aggregation_config['aggregation_type'], 
+            'status': status, 
+            'seconds': time.time() - start_time, 
+            'filepath': filepath,
+            'last_datetime': last_datetime}
+
+# =============================================================================
+# Update Aggregation Information CSV
+# =============================================================================
+
+def update_aggregation_information(completed_simulation_folderpath, aggregation_zone_name, aggregation_type, field, newvalue):
+    """
+    Updates one field of the row for a building and aggregation configuration in Aggregation_Information.csv, 
+    adding the row (and the file) if it does not exist yet.
+
+    Args:
+        completed_simulation_folderpath (str): Simulation results folder of the building.
+        aggregation_zone_name (str): Name stem of the aggregation configuration.
+        aggregation_type (str): Aggregation type of the configuration.
+        field (str): 'Aggregation Status', 'Aggregation Time' or 'Last Aggregated Datetime'.
+        newvalue (str): The new value.
+
+    Returns:
+        None
+    """
+    
+    aggregation_information_filepath = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles', 'Aggregation_Information.csv')
+    
+    header = 'Completed Simulation FolderPath,Aggregation Zone Name,Aggregation Type,Aggregation Status,Aggregation Time,Last Aggregated Datetime\n'
+    field_to_index = {'Aggregation Status': 3, 'Aggregation Time': 4, 'Last Aggregated Datetime': 5}
+    
+    if os.path.exists(aggregation_information_filepath):
+        with open(aggregation_information_filepath, 'r') as file:
+            lines = file.readlines()
+    else:
+        lines = []
+    
+    if not lines:
+        lines = [header]
+    
+    # Pad rows and header written by older versions to the current number of columns
+    lines[0] = header
+    number_of_fields = len(header.split(','))
+    
+    line_found = False
+    for i in range(1, len(lines)):
+        line_fields = lines[i].rstrip('\n').split(',')
+        line_fields += ['NA'] * (number_of_fields - len(line_fields))
+        if line_fields[0] == completed_simulation_folderpath and line_fields[1] == aggregation_zone_name and line_fields[2] == aggregation_type:
+            line_fields[field_to_index[field]] = newvalue
+            lines[i] = ','.join(line_fields) + '\n'
+            line_found = True
+    
+    if not line_found:
+        line_fields = [completed_simulation_folderpath, aggregation_zone_name, aggregation_type] + ['NA'] * (number_of_fields - 3)
+        line_fields[field_to_index[field]] = newvalue
+        lines.append(','.join(line_fields) + '\n')
+    
+    replace_file(aggregation_information_filepath, lambda file: file.writelines(lines))
+
+# =============================================================================
+# Aggregate All Buildings in Parallel
+# =============================================================================
+
+def aggregate_all_buildings(aggregation_configs, max_workers=None, max_tasks_per_child=1, sim_information_filepath=None, incremental=False):
+    """
+    Aggregates every completed simulation in Simulation_Information.csv for every aggregation configuration, 
+    using a process pool with one task per building and configuration.
+
+    Each worker loads one building, aggregates it and writes the result straight to that building's 
+    Sim_Aggregated_Data folder. Workers are replaced after max_tasks_per_child tasks, which bounds their memory 
+    to roughly one building at a time. Per-task timing and status are printed and logged in Aggregation_Information.csv.
+
+    On Windows the calling script must guard this call with `if __name__ == '__main__':`.
+
+    Args:
+        aggregation_configs (list of dict): Each with keys 'aggregation_zone_name', 'aggregation_zone_list' and 'aggregation_type'.
+        max_workers (int, optional): Number of worker processes. Default is the number of CPUs.
+        max_tasks_per_child (int, optional): Tasks per worker process before it is replaced. Default is 1.
+        sim_information_filepath (str, optional): Defaults to Generated_Textfiles/Simulation_Information.csv.
+        incremental (bool, optional): Only aggregate and append timesteps newer than each saved result. Default is False.
+
+    Returns:
+        list: The result dictionary of every task (see aggregate_building_task).
+    """
+    
+    if sim_information_filepath is None:
+        sim_information_filepath = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles', 'Simulation_Information.csv')
+    
+    with open(sim_information_filepath, 'r') as file:
+        lines = file.readlines()
+        lines = lines[1:] # Exclude Column Headers
+    
+    # Only buildings whose simulation finished have processed data to aggregate
+    folderpaths = [line.split(',')[3] for line in lines if line.strip().split(',')[4] in ('Complete', 'Uploaded')]
+    
+    results = []
+    start_time = time.time()
+    
+    with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=max_tasks_per_child) as executor:
         
-            # Appending empty Aggregation_DF to Aggregation_Dict
-            Aggregation_Dict[Aggregated_Zone_Name_1] = copy.deepcopy(Aggregation_DF)
+        futures = [executor.submit(aggregate_building_task, folderpath, config, incremental) for folderpath in folderpaths for config in aggregation_configs]
         
-            Aggregation_Dict[Aggregated_Zone_Name_2] = copy.deepcopy(Aggregation_DF_Equipment)
\ No newline at end of file
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            
+            print("Aggregated: " + os.path.basename(result['folderpath']) + " " + result['aggregation_zone_name'] + " " + result['aggregation_type'] + 
+                  " - " + result['status'] + " in " + f"{result['seconds']:.1f}" + " s\n")
+            
+            update_aggregation_information(result['folderpath'], result['aggregation_zone_name'], result['aggregation_type'], 'Aggregation Status', result['status'])
+            update_aggregation_information(result['folderpath'], result['aggregation_zone_name'], result['aggregation_type'], 'Aggregation Time', f"{result['seconds']:.3f}")
+            if result['last_datetime'] is not None:
+                update_aggregation_information(result['folderpath'], result['aggregation_zone_name'], result['aggregation_type'], 'Last Aggregated Datetime', result['last_datetime'])
+    
+    print("Aggregated " + str(len(results)) + " tasks in " + f"{time.time() - start_time:.1f}" + " s\n")
+    
+    return results
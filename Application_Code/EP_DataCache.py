@@ -0,0 +1,382 @@
+# =============================================================================
+# Import Required Modules
+# =============================================================================
+
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Custom Modules
+from EP_DataRetrieval import retrieve_timeseriesdata, retrieve_eiotabledata
+from EP_FileUtilities import replace_file
+
+# =============================================================================
+# Cache Settings
+# =============================================================================
+
+# Maximum number of results kept in the in-memory LRU tier
+CACHE_MEMORY_ENTRIES = 32
+
+# Maximum total size of the on-disk tier, least recently used entries are evicted beyond this
+CACHE_DISK_MAX_BYTES = 2 * 1024 ** 3
+
+# On-disk tier, one columnar .npz file (one array per column) and one .json sidecar per entry
+CACHE_FOLDERPATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Generated_Data', 'Retrieval_Cache'))
+
+# Per building time of the last upload, shared by all processes through the cache folder
+INVALIDATION_FILEPATH = os.path.join(CACHE_FOLDERPATH, 'Invalidations.json')
+
+# Lock file serializing the updates of Invalidations.json across processes, taken over if older than this (s)
+INVALIDATION_LOCK_FILEPATH = INVALIDATION_FILEPATH + '.lock'
+INVALIDATION_LOCK_STALE_SECONDS = 30
+
+# Retrieval parameters that only change how a result is transferred, not the result, left out of the cache key
+CACHE_KEY_IGNORED_PARAMETERS = ['copy_format']
+
+# In-memory tier: key -> (created time, buildingids, DataFrame), shared by the pipeline and Flask threads
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+# Serializes invalidations by the threads of one process (e.g. the upload stage of pipelined_data_generation)
+_invalidation_lock = threading.Lock()
+
+# =============================================================================
+# Normalize Query Parameters into a Cache Key
+# =============================================================================
+
+def normalize_value(value):
+    """
+    Convert a query parameter into a canonical JSON-serializable form.
+
+    Lists, tuples and sets are sorted so that equivalent queries share a cache entry, datetimes are converted
+    to their 'YYYY-MM-DD HH:MM:SS' string and NumPy scalars to Python scalars.
+    """
+
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        return sorted((normalize_value(v) for v in value), key=str)
+    if isinstance(value, (datetime.datetime, datetime.date, pd.Timestamp)):
+        return str(pd.Timestamp(value))
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
+
+def make_cache_key(function_name, conn_information, parameters):
+    """
+    Build the cache key of a retrieval call from its function name, database and normalized parameters.
+
+    Args:
+        function_name (str): Name of the retrieval function.
+        conn_information (str): The connection string of the database that is queried.
+        parameters (dict): Keyword arguments of the retrieval call, except CACHE_KEY_IGNORED_PARAMETERS.
+
+    Returns:
+        str: A hexadecimal SHA-1 digest.
+    """
+
+    normalized = {name: normalize_value(value) for name, value in parameters.items() if value is not None and name not in CACHE_KEY_IGNORED_PARAMETERS}
+    payload = json.dumps([function_name, conn_information, normalized], sort_keys=True, default=str)
+
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+# =============================================================================
+# Upload-Driven Invalidation
+# =============================================================================
+
+def load_invalidations():
+    """
+    Returns the per building time of the last invalidation as a dictionary {buildingid (str): time}.
+    """
+
+    if not os.path.exists(INVALIDATION_FILEPATH):
+        return {}
+
+    try:
+        with open(INVALIDATION_FILEPATH, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def is_stale(created, buildingids, invalidations):
+    """
+    Checks whether a cache entry created at `created` has been invalidated by an upload.
+
+    An entry without building filter (buildingids is None) spans all buildings and is stale after any upload.
+    """
+
+    if buildingids is None:
+        return any(invalidated >= created for invalidated in invalidations.values())
+
+    return any(invalidations.get(str(buildingid), 0) >= created for buildingid in buildingids)
+
+def acquire_invalidation_lock():
+    """
+    Creates INVALIDATION_LOCK_FILEPATH exclusively, waiting while another process holds it. A lock file older than 
+    INVALIDATION_LOCK_STALE_SECONDS is left over from a crashed process and is taken over.
+    """
+
+    while True:
+        try:
+            os.close(os.open(INVALIDATION_LOCK_FILEPATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(INVALIDATION_LOCK_FILEPATH) > INVALIDATION_LOCK_STALE_SECONDS:
+                    os.remove(INVALIDATION_LOCK_FILEPATH)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.01)
+
+def release_invalidation_lock():
+    """
+    Removes the lock file created by acquire_invalidation_lock.
+    """
+
+    try:
+        os.remove(INVALIDATION_LOCK_FILEPATH)
+    except OSError:
+        pass
+
+def invalidate_building(buildingid):
+    """
+    Invalidate every cached result that may contain data of a building. Called by the uploaders whenever new
+    rows are written for that building.
+
+    Args:
+        buildingid (int or list of int): The building(s) that received new data.
+
+    Returns:
+        None
+    """
+
+    buildingids = buildingid if isinstance(buildingid, (list, tuple, set, np.ndarray)) else [buildingid]
+    buildingids = [str(normalize_value(b)) for b in buildingids]
+
+    now = time.time()
+
+    # Record the invalidation for other processes, the read-modify-write is locked across threads and processes
+    if not os.path.exists(CACHE_FOLDERPATH): os.makedirs(CACHE_FOLDERPATH, exist_ok=True)
+    with _invalidation_lock:
+        acquire_invalidation_lock()
+        try:
+            invalidations = load_invalidations()
+            for b in buildingids: invalidations[b] = now
+            replace_file(INVALIDATION_FILEPATH, lambda file: json.dump(invalidations, file))
+        finally:
+            release_invalidation_lock()
+
+    # Drop matching in-memory entries
+    with _memory_lock:
+        for key in list(_memory_cache):
+            created, entry_buildingids, _ = _memory_cache[key]
+            if is_stale(created, entry_buildingids, invalidations):
+                del _memory_cache[key]
+
+    # Drop matching on-disk entries
+    for filename in os.listdir(CACHE_FOLDERPATH):
+        if filename.endswith('.json') and filename != os.path.basename(INVALIDATION_FILEPATH):
+            metadata = read_disk_metadata(filename[:-5])
+            if metadata is None or is_stale(metadata['created'], metadata['buildingids'], invalidations):
+                remove_disk_entry(filename[:-5])
+
+# =============================================================================
+# On-Disk Columnar Tier
+# =============================================================================
+
+def read_disk_metadata(key):
+    """
+    Returns the sidecar metadata of an on-disk entry, or None if it does not exist or is unreadable.
+    """
+
+    try:
+        with open(os.path.join(CACHE_FOLDERPATH, key + '.json'), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def remove_disk_entry(key):
+    """
+    Removes the data and metadata files of an on-disk entry if present.
+    """
+
+    for extension in ('.npz', '.json'):
+        try:
+            os.remove(os.path.join(CACHE_FOLDERPATH, key + extension))
+        except OSError:
+            pass
+
+def write_disk_entry(key, created, buildingids, df):
+    """
+    Stores a DataFrame as one array per column in `<key>.npz` with its metadata in `<key>.json`, then evicts
+    least recently used entries until the tier fits in CACHE_DISK_MAX_BYTES. Both files are written with
+    replace_file, the metadata last, so that an interrupted write leaves no entry or the previous one.
+    """
+
+    if not os.path.exists(CACHE_FOLDERPATH): os.makedirs(CACHE_FOLDERPATH, exist_ok=True)
+
+    arrays = {'column_' + str(i): df[c].to_numpy() for i, c in enumerate(df.columns)}
+    replace_file(os.path.join(CACHE_FOLDERPATH, key + '.npz'), lambda file: np.savez(file, **arrays), mode='wb')
+
+    metadata = {'created': created, 'buildingids': buildingids, 'columns': [str(c) for c in df.columns]}
+    replace_file(os.path.join(CACHE_FOLDERPATH, key + '.json'), lambda file: json.dump(metadata, file))
+
+    evict_disk_entries()
+
+def read_disk_entry(key):
+    """
+    Loads an on-disk entry and marks it as recently used. Returns (metadata, DataFrame), or None if it does not
+    exist or cannot be read, e.g. left damaged by a crash or removed by another process meanwhile.
+    """
+
+    data_filepath = os.path.join(CACHE_FOLDERPATH, key + '.npz')
+    metadata = read_disk_metadata(key)
+
+    if metadata is None or not os.path.exists(data_filepath):
+        return None
+
+    try:
+        with np.load(data_filepath, allow_pickle=True) as arrays:
+            df = pd.DataFrame({c: arrays['column_' + str(i)] for i, c in enumerate(metadata['columns'])}, columns=metadata['columns'])
+
+        # Modification time doubles as last access time for eviction
+        os.utime(data_filepath)
+    except Exception as error:
+        print("Unreadable cache entry " + key + ", treated as a miss: " + str(error))
+        remove_disk_entry(key)
+        return None
+
+    return metadata, df
+
+def evict_disk_entries():
+    """
+    Deletes the least recently used on-disk entries until their total size is at most CACHE_DISK_MAX_BYTES.
+    """
+
+    entries = []
+    for filename in os.listdir(CACHE_FOLDERPATH):
+        if filename.endswith('.npz'):
+            stat = os.stat(os.path.join(CACHE_FOLDERPATH, filename))
+            entries.append((stat.st_mtime, stat.st_size, filename[:-4]))
+
+    total_bytes = sum(size for _, size, _ in entries)
+
+    for _, size, key in sorted(entries):
+        if total_bytes <= CACHE_DISK_MAX_BYTES:
+            break
+        remove_disk_entry(key)
+        total_bytes -= size
+
+# =============================================================================
+# Cached Call
+# =============================================================================
+
+def cached_call(function, conn_information, buildingids, **parameters):
+    """
+    Return the result of a retrieval function from the cache, running and storing it on a miss.
+
+    Lookup order is the in-memory LRU, then the on-disk tier, then the database. Entries invalidated by an
+    upload for one of their buildings are treated as misses. Parameters in CACHE_KEY_IGNORED_PARAMETERS are
+    passed to the function but do not take part in the key.
+
+    Args:
+        function (callable): Retrieval function returning a DataFrame.
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        buildingids (list or None): Buildings the result depends on, None if it spans all buildings.
+        **parameters: Keyword arguments of the retrieval function.
+
+    Returns:
+        pandas.DataFrame: The (possibly cached) result. Treat it as read-only, it is shared with the cache.
+    """
+
+    key = make_cache_key(function.__name__, conn_information, parameters)
+    if buildingids is not None: buildingids = sorted({int(normalize_value(b)) for b in buildingids})
+    invalidations = load_invalidations()
+
+    # In-memory tier
+    with _memory_lock:
+        if key in _memory_cache:
+            created, entry_buildingids, df = _memory_cache[key]
+            if not is_stale(created, entry_buildingids, invalidations):
+                _memory_cache.move_to_end(key)
+                return df
+            del _memory_cache[key]
+
+    # On-disk tier
+    entry = read_disk_entry(key)
+    if entry is not None:
+        metadata, df = entry
+        if not is_stale(metadata['created'], metadata['buildingids'], invalidations):
+            store_memory_entry(key, metadata['created'], metadata['buildingids'], df)
+            return df
+        remove_disk_entry(key)
+
+    # Miss, query the database
+    created = time.time()
+    df = function(conn_information, **parameters)
+
+    store_memory_entry(key, created, buildingids, df)
+    write_disk_entry(key, created, buildingids, df)
+
+    return df
+
+def store_memory_entry(key, created, buildingids, df):
+    """
+    Adds an entry to the in-memory LRU tier, evicting the least recently used entry beyond CACHE_MEMORY_ENTRIES.
+    """
+
+    with _memory_lock:
+        _memory_cache[key] = (created, buildingids, df)
+        _memory_cache.move_to_end(key)
+
+        while len(_memory_cache) > CACHE_MEMORY_ENTRIES:
+            _memory_cache.popitem(last=False)
+
+def clear_cache(memory=True, disk=True):
+    """
+    Empties the in-memory and/or on-disk cache tiers.
+    """
+
+    if memory:
+        with _memory_lock:
+            _memory_cache.clear()
+
+    if disk and os.path.exists(CACHE_FOLDERPATH):
+        for filename in os.listdir(CACHE_FOLDERPATH):
+            if filename.endswith('.npz') or (filename.endswith('.json') and filename != os.path.basename(INVALIDATION_FILEPATH)):
+                os.remove(os.path.join(CACHE_FOLDERPATH, filename))
+
+# =============================================================================
+# Cached Retrieval Functions
+# =============================================================================
+
+def cached_retrieve_timeseriesdata(conn_information, buildingid=None, startdatetime=None, enddatetime=None, timeresolution=None, variable=None, subvariabletype=None, subvariable=None, copy_format=None, resample=None, aggregation='mean'):
+    """
+    Cached version of retrieve_timeseriesdata. Takes the same arguments and returns the same DataFrame.
+
+    Example:
+    --------
+    df = cached_retrieve_timeseriesdata(conn_info, buildingid=1, variable='Zone Air Temperature', resample='hour')
+    """
+
+    buildingids = [buildingid] if buildingid else None
+
+    return cached_call(retrieve_timeseriesdata, conn_information, buildingids, buildingid=buildingid, startdatetime=startdatetime, enddatetime=enddatetime, 
+                       timeresolution=timeresolution, variable=variable, subvariabletype=subvariabletype, subvariable=subvariable, 
+                       copy_format=copy_format, resample=resample, aggregation=aggregation)
+
+def cached_retrieve_eiotabledata(conn_information, buildingid=None, tablename=None, zonename=None, variablename=None):
+    """
+    Cached version of retrieve_eiotabledata. Takes the same arguments and returns the same DataFrame.
+    """
+
+    buildingids = [buildingid] if buildingid else None
+
+    return cached_call(retrieve_eiotabledata, conn_information, buildingids, buildingid=buildingid, tablename=tablename, zonename=zonename, variablename=variablename)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+In-process capture of output variables through the EnergyPlus Python API (pyenergyplus). The values are read
+from the variable handles every zone timestep into preallocated NumPy arrays, without going through
+eplusout.csv, pandas and pickle. EP_DataManager falls back to simulate_variable when can_capture is False.
+
+"""
+
+# =============================================================================
+# Import Required Modules
+# =============================================================================
+
+# External Modules
+import os
+import csv
+import numpy as np
+import pandas as pd
+
+# pyenergyplus ships with EnergyPlus (>= 9.3), its folder must be on sys.path
+try:
+    from pyenergyplus.api import EnergyPlusAPI
+except ImportError:
+    EnergyPlusAPI = None
+
+# Custom Modules
+from EP_DataGenerator import prepare_variable_idf, organize_output_files
+
+# =============================================================================
+# Capture Settings
+# =============================================================================
+
+# Value of exchange.kind_of_sim during the weather file run period, design days and sizing are not captured
+KIND_OF_SIM_RUN_PERIOD_WEATHER = 3
+
+def api_available():
+    """
+    Returns True if the EnergyPlus Python API can be imported.
+    """
+
+    return EnergyPlusAPI is not None
+
+def can_capture(simulation_settings):
+    """
+    Returns True if capture_variable can replace simulate_variable: pyenergyplus is available and the reporting
+    frequency is 'timestep', the only one captured. Otherwise the op.simulate path is used.
+    """
+
+    return api_available() and str(simulation_settings["sim_output_variable_reporting_frequency"]).lower() == 'timestep'
+
+# =============================================================================
+# Output Variable Handles
+# =============================================================================
+
+def get_variable_keys(api, state, variablename):
+    """
+    Lists the keys (zones, surfaces, schedules, ...) for which an output variable is available in a running simulation.
+
+    Args:
+        api (EnergyPlusAPI): The API instance.
+        state: The EnergyPlus state, with api_data_fully_ready.
+        variablename (str): The output variable, e.g. 'Zone Mean Air Temperature'.
+
+    Returns:
+        list: Keys as reported by EnergyPlus, in the order of list_available_api_data_csv.
+    """
+
+    api_data = api.exchange.list_available_api_data_csv(state)
+    if isinstance(api_data, bytes): api_data = api_data.decode('utf-8', errors='replace')
+
+    keys = []
+    for fields in csv.reader(api_data.splitlines()):
+        if len(fields) >= 3 and fields[0].strip() == 'OutputVariable' and fields[1].strip().upper() == variablename.upper():
+            if fields[2].strip() not in keys: keys.append(fields[2].strip())
+
+    return keys
+
+# =============================================================================
+# Capture One Variable
+# =============================================================================
+
+def count_capture_steps(simulation_settings):
+    """
+    Number of zone timesteps of the run period, used to preallocate the capture buffers.
+    """
+
+    days = (simulation_settings["sim_end_datetime"].date() - simulation_settings["sim_start_datetime"].date()).days + 1
+
+    return days * 24 * int(60/simulation_settings["sim_timestep"])
+
+def capture_variable(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename):
+    """
+    Simulates one output variable in-process and captures its values for all keys into NumPy arrays.
+
+    The IDF is prepared like in simulate_variable, the Output:Variable object makes EnergyPlus register the
+    variable for all keys. A callback at the end of each zone timestep (after zone reporting) skips warmup and
+    sizing, looks up the variable handles on its first call and writes one row into buffers preallocated for the
+    run period (grown if the run period turns out longer). No CSV is produced (ReadVarsESO is not run).
+
+    The values are those at the zone timestep, i.e. "sim_output_variable_reporting_frequency" 'timestep'. For
+    system timestep variables it is the value of the last system timestep instead of the zone timestep average.
+
+    Args:
+        simulation_settings (dict): Simulation settings.
+        idf_filepath (str): The edited IDF file, see make_edited_idf.
+        weather_filepath (str): The EPW file.
+        sim_results_folderpath (str): Results folder of the simulation.
+        variablename (str): The output variable.
+
+    Returns:
+        tuple: (capture, eiofilepath). capture is a dict with
+            - 'Date_Time': array of 'MM/DD  HH:MM:SS' strings (end of timestep, as in eplusout.csv).
+            - 'Keys': array of the K keys.
+            - 'Values': float64 array (T, K).
+    """
+
+    if not api_available():
+        raise ImportError("pyenergyplus is not available, add the EnergyPlus installation folder to sys.path")
+
+    Edited_IDFFile_Path = prepare_variable_idf(simulation_settings, idf_filepath, sim_results_folderpath, variablename)
+
+    api = EnergyPlusAPI()
+    state = api.state_manager.new_state()
+    exchange = api.exchange
+
+    capture_steps = count_capture_steps(simulation_settings)
+    buffers = {'rows': 0, 'keys': None, 'handles': None, 'values': None,
+               'timestamps': np.zeros((capture_steps, 4), dtype=np.int16)} # Month, day, hour, minute
+
+    def on_zone_timestep(state):
+
+        if not exchange.api_data_fully_ready(state) or exchange.warmup_flag(state) or exchange.kind_of_sim(state) != KIND_OF_SIM_RUN_PERIOD_WEATHER:
+            return
+
+        # Handles are only valid once the simulation has set up its output variables
+        if buffers['handles'] is None:
+            keys = get_variable_keys(api, state, variablename)
+            handles = [exchange.get_variable_handle(state, variablename, key) for key in keys]
+            buffers['keys'] = [key for key, handle in zip(keys, handles) if handle >= 0]
+            buffers['handles'] = [handle for handle in handles if handle >= 0]
+            buffers['values'] = np.full((capture_steps, len(buffers['handles'])), np.nan)
+
+        row = buffers['rows']
+        if row == len(buffers['values']):
+            buffers['values'] = np.concatenate([buffers['values'], np.full_like(buffers['values'], np.nan)])
+            buffers['timestamps'] = np.concatenate([buffers['timestamps'], np.zeros_like(buffers['timestamps'])])
+
+        for k, handle in enumerate(buffers['handles']):
+            buffers['values'][row, k] = exchange.get_variable_value(state, handle)
+        buffers['timestamps'][row] = (exchange.month(state), exchange.day_of_month(state), exchange.hour(state), exchange.minutes(state))
+        buffers['rows'] = row + 1
+
+    api.runtime.callback_end_zone_timestep_after_zone_reporting(state, on_zone_timestep)
+    if hasattr(api.runtime, 'set_console_output_status'): api.runtime.set_console_output_status(state, False)
+
+    exit_code = api.runtime.run_energyplus(state, ['-x', '-d', sim_results_folderpath, '-w', weather_filepath, Edited_IDFFile_Path])
+    api.state_manager.delete_state(state)
+
+    organize_output_files(sim_results_folderpath)
+    os.remove(Edited_IDFFile_Path)
+
+    if exit_code != 0:
+        raise RuntimeError("EnergyPlus exited with code " + str(exit_code) + ", see " + os.path.join(sim_results_folderpath, 'OutputFiles', 'eplusout.err'))
+
+    rows = buffers['rows']
+    timestamps = buffers['timestamps'][:rows].astype(np.int64)
+
+    # hour() is the hour the timestep started in and minutes() the minute it ended at (1-60), e.g. 24:00:00
+    hours = timestamps[:, 2] + (timestamps[:, 3] == 60)
+    minutes = timestamps[:, 3] % 60
+    date_time = np.array([' %02d/%02d  %02d:%02d:00' % (month, day, hour, minute) for (month, day), hour, minute in zip(timestamps[:, :2], hours, minutes)])
+
+    capture = {
+        'Date_Time': date_time,
+        'Keys': np.array(buffers['keys'] if buffers['keys'] is not None else []),
+        'Values': buffers['values'][:rows] if buffers['values'] is not None else np.empty((0, 0))}
+
+    eiofilepath = os.path.join(sim_results_folderpath, 'eplusout.eio')
+
+    return capture, eiofilepath
+
+# =============================================================================
+# Store and Convert Captures
+# =============================================================================
+
+def save_capture(sim_results_folderpath, variablename, capture):
+    """
+    Saves a capture as one array per field in TimeSeriesData/<variablename>.npz. Process_TimeSeriesData reads it
+    into the processed pickle together with the CSVs of simulate_variable.
+
+    Returns:
+        str: Filepath of the .npz file.
+    """
+
+    capture_filepath = os.path.join(sim_results_folderpath, 'TimeSeriesData', variablename.replace(' ', '_') + '.npz')
+    np.savez(capture_filepath, **capture)
+
+    return capture_filepath
+
+def load_capture(capture_filepath):
+    """
+    Loads a capture saved by save_capture.
+    """
+
+    with np.load(capture_filepath) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+def capture_to_df(capture, variablename):
+    """
+    Converts a capture into the wide eplusout.csv layout, i.e. 'Date/Time' and one 'KEY:Variable Name [](TimeStep)'
+    column per key, as expected by timeseriesdata_format_df.
+    """
+
+    columns = [str(key) + ':' + variablename + ' [](TimeStep)' for key in capture['Keys']]
+
+    df = pd.DataFrame(capture['Values'], columns=columns)
+    df.insert(0, 'Date/Time', capture['Date_Time'])
+
+    return df
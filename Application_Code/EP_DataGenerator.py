@@ -22,9 +22,18 @@ import re
 import shutil
 import datetime
 import pickle
+import json
+import time
+import hashlib
+import tempfile
+import codecs
+from concurrent.futures import ThreadPoolExecutor
 
 from datetime import datetime as dt, timedelta
 
+# Custom Modules
+from EP_FileUtilities import replace_file
+
 # =============================================================================
 # Format Datetime Correctly 
 # =============================================================================
@@ -70,11 +79,157 @@ def format_datetime(simulation_year, datetime_str):
     
     return formatted_datetime
 
+# =============================================================================
+# Simulation Control Settings
+# =============================================================================
+
+# Optional simulation_settings keys read by make_edited_idf, defaults leave the IDF unchanged:
+# "sim_sizing": 'default' runs sizing as in the IDF, 'skip' turns all sizing off (the IDF must be hard-sized), 
+#               'reuse' hard-sizes the IDF from cached design-day results and then skips sizing.
+# "sim_warmup_days": (minimum, maximum) number of warmup days written to the Building object.
+# "sim_warmup_tolerances": (loads, temperature) warmup convergence tolerances written to the Building object.
+SIZING_CONTROL_FIELDS = ['do_zone_sizing_calculation', 'do_system_sizing_calculation', 'do_plant_sizing_calculation', 'run_simulation_for_sizing_periods']
+
+# =============================================================================
+# Sizing Reuse
+# =============================================================================
+
+def get_sizing_results(idf_filepath, weather_filepath, sizing_cache_folderpath):
+    """
+    Returns the autosized component values of an IDF, from the sizing cache or from a design-day only simulation.
+
+    Results are cached per IDF content (SHA-1) as <hash>.json, so every simulation of the same prototype after 
+    the first reuses them. The design-day run turns zone, system and plant sizing on, so that IDFs with sizing 
+    turned off still report their component sizes.
+
+    Args:
+        idf_filepath (str): The original IDF file.
+        weather_filepath (str): The weather file, passed to EnergyPlus for the design-day run.
+        sizing_cache_folderpath (str): Folder of the sizing cache.
+
+    Returns:
+        list: [object type, object name, field description, value] per 'Component Sizing Information' line of the .eio file.
+    """
+    
+    with open(idf_filepath, 'rb') as file:
+        idf_hash = hashlib.sha1(file.read()).hexdigest()
+    
+    sizing_cache_filepath = os.path.join(sizing_cache_folderpath, idf_hash + '.json')
+    if os.path.exists(sizing_cache_filepath):
+        with open(sizing_cache_filepath, 'r') as file:
+            return json.load(file)
+    
+    # Design-day only run, in a folder of its own since simulations of the same IDF may size it at the same time
+    if not os.path.exists(sizing_cache_folderpath): os.makedirs(sizing_cache_folderpath)
+    sizing_folderpath = tempfile.mkdtemp(prefix=idf_hash + '_', dir=sizing_cache_folderpath)
+    
+    sizing_idf = op.Epm.load(idf_filepath)
+    set_simulation_control(sizing_idf, {'do_zone_sizing_calculation': 'Yes', 'do_system_sizing_calculation': 'Yes', 'do_plant_sizing_calculation': 'Yes', 
+                                        'run_simulation_for_sizing_periods': 'Yes', 'run_simulation_for_weather_file_run_periods': 'No'})
+    sizing_idf_filepath = os.path.join(sizing_folderpath, os.path.basename(idf_filepath))
+    sizing_idf.save(sizing_idf_filepath)
+    
+    op.simulate(sizing_idf_filepath, weather_filepath, base_dir_path=sizing_folderpath)
+    
+    sizing_results = []
+    with open(os.path.join(sizing_folderpath, 'eplusout.eio'), 'r') as file:
+        for line in file:
+            # Component Sizing Information, <Type>, <Name>, Design Size <Field> [<Units>], <Value>
+            if line.startswith(' Component Sizing Information') or line.startswith('Component Sizing Information'):
+                line_split = [field.strip() for field in line.split(',')]
+                if len(line_split) >= 5 and line_split[3].startswith('Design Size'):
+                    sizing_results.append([line_split[1], line_split[2], line_split[3], float(line_split[4])])
+    
+    shutil.rmtree(sizing_folderpath, ignore_errors=True)
+    
+    # Concurrent runs of the same IDF write the same results
+    replace_file(sizing_cache_filepath, lambda file: json.dump(sizing_results, file))
+    
+    return sizing_results
+
+def get_sizing_cache_folderpath(sim_results_folderpath):
+    """
+    Returns the sizing cache folder shared by the simulations next to a results folder.
+    """
+    
+    return os.path.abspath(os.path.join(sim_results_folderpath, '..', 'Sizing_Cache'))
+
+def apply_hard_sizing(idf, sizing_results):
+    """
+    Replaces 'autosize' fields of an opyplus Epm with cached sizing results, in place.
+
+    The field is found from the .eio description, e.g. 'Design Size Rated Air Flow Rate [m3/s]' -> 'rated_air_flow_rate'. 
+    Results whose object or field cannot be matched are skipped.
+
+    Returns:
+        int: The number of hard-sized fields.
+    """
+    
+    hard_sized = 0
+    
+    for object_type, object_name, field_description, value in sizing_results:
+        field_name = re.sub(r'\[.*?\]|\{.*?\}', '', field_description.replace('Design Size', '', 1)).strip()
+        field_key = re.sub(r'[^a-z0-9]+', '_', field_name.lower()).strip('_')
+        
+        try:
+            table = getattr(idf, object_type.replace(':', '_'))
+            for record in table.select(lambda record: str(record['name']).upper() == object_name.upper()):
+                if str(record[field_key]).lower() == 'autosize':
+                    record[field_key] = value
+                    hard_sized += 1
+        except Exception:
+            continue
+    
+    return hard_sized
+
+def has_autosized_fields(idf_filepath):
+    """
+    Checks whether an IDF file still contains 'autosize' fields, ignoring comments.
+    """
+    
+    with open(idf_filepath, 'r', errors='replace') as file:
+        for line in file:
+            if re.search(r'\bautosize\b', line.split('!')[0], re.IGNORECASE):
+                return True
+    
+    return False
+
+def set_simulation_control(idf, values):
+    """
+    Sets fields of the SimulationControl object of an opyplus Epm, adding the object if the IDF has none.
+    """
+    
+    simulation_controls = idf.SimulationControl.select()
+    
+    if len(simulation_controls) == 0:
+        idf.SimulationControl.add(**values)
+    else:
+        simulation_control = simulation_controls.one()
+        for field, value in values.items():
+            simulation_control[field] = value
+
 # =============================================================================
 # Make Edited IDF File
 # =============================================================================
 
-def make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath):
+def make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath, weather_filepath=None):
+    """
+    Copies an IDF file to the temporary folder and applies the simulation settings to it.
+
+    Besides RunPeriod and Timestep, the optional "sim_sizing", "sim_warmup_days" and "sim_warmup_tolerances" 
+    settings (see SIZING_CONTROL_FIELDS) shorten short runs, where design-day sizing and full warmup can cost 
+    more than the run period itself. With "sim_sizing" = 'reuse' sizing is only skipped if every autosized field 
+    could be hard-sized, otherwise it runs as usual.
+
+    Args:
+        simulation_settings (dict): Simulation settings.
+        sim_results_folderpath (str): Results folder of the simulation.
+        idf_filepath (str): The original IDF file.
+        weather_filepath (str, optional): Weather file, required for "sim_sizing" = 'reuse'.
+
+    Returns:
+        str: Filepath of the edited IDF file.
+    """
     
     # Copying IDF to Temporary Folder
     temp_folderpath = os.path.abspath(os.path.join(sim_results_folderpath, '..', 'Temporary_Folder')) #DEBUG Sim results folderpath is incorrect
@@ -96,6 +251,25 @@ def make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath):
     temp_idf_timestep = temp_idf.TimeStep.one()
     temp_idf_timestep['number_of_timesteps_per_hour'] = int(60/simulation_settings["sim_timestep"])
     
+    # Editing Warmup
+    if simulation_settings.get("sim_warmup_days") is not None:
+        temp_idf_building = temp_idf.Building.one()
+        temp_idf_building['minimum_number_of_warmup_days'] = simulation_settings["sim_warmup_days"][0]
+        temp_idf_building['maximum_number_of_warmup_days'] = simulation_settings["sim_warmup_days"][1]
+    if simulation_settings.get("sim_warmup_tolerances") is not None:
+        temp_idf_building = temp_idf.Building.one()
+        temp_idf_building['loads_convergence_tolerance_value'] = simulation_settings["sim_warmup_tolerances"][0]
+        temp_idf_building['temperature_convergence_tolerance_value'] = simulation_settings["sim_warmup_tolerances"][1]
+    
+    # Editing Sizing
+    sim_sizing = simulation_settings.get("sim_sizing", 'default')
+    if sim_sizing == 'reuse':
+        sizing_cache_folderpath = get_sizing_cache_folderpath(sim_results_folderpath)
+        if not os.path.exists(sizing_cache_folderpath): os.makedirs(sizing_cache_folderpath)
+        apply_hard_sizing(temp_idf, get_sizing_results(idf_filepath, weather_filepath, sizing_cache_folderpath))
+    if sim_sizing == 'skip':
+        set_simulation_control(temp_idf, {field: 'No' for field in SIZING_CONTROL_FIELDS})
+    
     # Getting Current Schedule
     current_schedule_compact = temp_idf.Schedule_Compact
     current_schedule_compact_records_dict = current_schedule_compact._records
@@ -103,6 +277,15 @@ def make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath):
     # Save Edited IDF
     temp_idf.save(temp_idf_filepath)
     
+    # Only skip sizing once nothing is left to autosize
+    if sim_sizing == 'reuse':
+        if has_autosized_fields(temp_idf_filepath):
+            print("Sizing Not Reused, Autosized Fields Remain: " + os.path.basename(idf_filepath) + '\n')
+        else:
+            temp_idf = op.Epm.load(temp_idf_filepath)
+            set_simulation_control(temp_idf, {field: 'No' for field in SIZING_CONTROL_FIELDS})
+            temp_idf.save(temp_idf_filepath)
+    
     # Appending Special IDF File into Edited IDF File
     special_idf_filepath = os.path.join(os.path.dirname(__file__), 'Special.idf')
     with open(special_idf_filepath, "r") as idf_from: data = idf_from.read()
@@ -113,30 +296,82 @@ def make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath):
     return temp_idf_filepath
 
 # =============================================================================
-# Simulate Variable 
+# Benchmark Simulation Settings
 # =============================================================================
 
-def simulate_variable(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename): # DEBUG: Changed header, will need to update everywhere the function in used. 
-    
+def benchmark_simulation_settings(simulation_settings, fast_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename):
     """
-    Simulate a variable using the given IDF and weather files, and save the output variable to a CSV file.
-    
-    Parameters:
-    sim_results_folderpath (str): The folder path where the simulation results are stored. Has subfolders:
-        - 'TimeSeriesData' for time series data in CSV format.
-        - 'ProcessedData' for processed data in pickle format.
-        - 'OutputFiles' for additional output files. 
-        - 'Temporary_Folder' for temporary files
+    Simulates one variable with the default settings and with shortened sizing/warmup settings, and reports 
+    the speedup and how far the results drift.
 
-    This function performs the following steps:
-    1. Loads the IDF file and retrieves the Output:Variable object.
-    2. Updates the Output:Variable object with the specified parameters.
-    3. Saves the modified IDF file to a specified output folder.
-    4. Runs the EnergyPlus simulation using the modified IDF and weather files.
-    5. Deletes the modified IDF file after the simulation is complete.
+    With "sim_sizing" = 'reuse' the sizing cache is filled before the timed runs, so that the speedup is the one 
+    of every simulation after the first. The one-time design-day run is reported as 'sizing_seconds' (0 if the 
+    IDF was already cached).
+
+    Args:
+        simulation_settings (dict): Baseline simulation settings.
+        fast_settings (dict): Settings overriding the baseline, e.g. {"sim_sizing": 'reuse', "sim_warmup_days": (1, 6)}.
+        idf_filepath (str): The original IDF file.
+        weather_filepath (str): The weather file.
+        sim_results_folderpath (str): Results folder, the runs use its 'Benchmark_Default' and 'Benchmark_Fast' subfolders.
+        variablename (str): The output variable to compare.
 
     Returns:
+        dict: 'sizing_seconds', 'default_seconds', 'fast_seconds', 'speedup', 'max_abs_drift', 'mean_abs_drift' and 
+              'max_relative_drift' (relative to the largest baseline magnitude of each column).
+    """
     
+    results = {'sizing_seconds': 0.0}
+    
+    # Warm the sizing cache used by the fast run
+    if dict(simulation_settings, **fast_settings).get("sim_sizing") == 'reuse':
+        sizing_cache_folderpath = get_sizing_cache_folderpath(os.path.join(sim_results_folderpath, 'Benchmark_Fast'))
+        start_time = time.time()
+        get_sizing_results(idf_filepath, weather_filepath, sizing_cache_folderpath)
+        results['sizing_seconds'] = time.time() - start_time
+    
+    for name, settings in (('default', simulation_settings), ('fast', dict(simulation_settings, **fast_settings))):
+        run_folderpath = os.path.join(sim_results_folderpath, 'Benchmark_' + name.capitalize())
+        
+        start_time = time.time()
+        edited_idf_filepath = make_edited_idf(settings, run_folderpath, idf_filepath, weather_filepath)
+        timeseriesdata_csv_filepath, eiofilepath = simulate_variable(settings, edited_idf_filepath, weather_filepath, run_folderpath, variablename)
+        results[name + '_seconds'] = time.time() - start_time
+        
+        results[name + '_df'] = pd.read_csv(timeseriesdata_csv_filepath).drop(columns=['Date/Time'])
+    
+    default_values = results.pop('default_df').to_numpy(dtype=np.float64)
+    fast_values = results.pop('fast_df').to_numpy(dtype=np.float64)
+    drift = np.abs(fast_values - default_values)
+    scale = np.maximum(np.abs(default_values).max(axis=0), 1e-12)
+    
+    results['speedup'] = results['default_seconds'] / results['fast_seconds']
+    results['max_abs_drift'] = float(drift.max())
+    results['mean_abs_drift'] = float(drift.mean())
+    results['max_relative_drift'] = float((drift / scale).max())
+    
+    print("Benchmark: " + os.path.basename(idf_filepath) + " - one-time sizing " + f"{results['sizing_seconds']:.1f}" + " s\n")
+    print("Benchmark: " + os.path.basename(idf_filepath) + " - speedup " + f"{results['speedup']:.2f}" + "x, max drift " + 
+          f"{results['max_abs_drift']:.4g}" + " (" + f"{100 * results['max_relative_drift']:.2f}" + " %)\n")
+    
+    return results
+
+# =============================================================================
+# Simulate Variable 
+# =============================================================================
+
+def prepare_variable_idf(simulation_settings, idf_filepath, sim_results_folderpath, variablename):
+    """
+    Creates the folder structure of a simulation and saves a copy of the IDF reporting only one output variable.
+
+    Args:
+        simulation_settings (dict): Simulation settings, uses "sim_output_variable_reporting_frequency".
+        idf_filepath (str): The edited IDF file, see make_edited_idf.
+        sim_results_folderpath (str): Results folder of the simulation.
+        variablename (str): The output variable, reported for all keys ('*').
+
+    Returns:
+        str: Filepath of the IDF in the simulation's Temporary_Folder.
     """
     
     # Create Folder structure for Simulation Results, if it does not exist
@@ -155,22 +390,60 @@ def simulate_variable(simulation_settings, idf_filepath, weather_filepath, sim_r
     OutputVariable_QuerySet['reporting_frequency'] = simulation_settings["sim_output_variable_reporting_frequency"]
     OutputVariable_QuerySet['variable_name'] = variablename
     
-    # Saving Edited IDF File in Temporary Folder
-    Edited_IDFFile_Path = os.path.abspath(os.path.join(idf_filepath, '..', 'Edited_IDFFile.idf'))
+    # Saving Edited IDF File in the simulation's own Temporary Folder, so that simulations can run in parallel
+    Edited_IDFFile_Path = os.path.join(sim_results_folderpath, 'Temporary_Folder', 'Edited_IDFFile.idf')
     Edited_IDFFile.save(Edited_IDFFile_Path)
     
+    return Edited_IDFFile_Path
+
+def organize_output_files(sim_results_folderpath):
+    """
+    Moves the EnergyPlus output files of a simulation folder into its OutputFiles subfolder.
+    """
+    
+    for filename in os.listdir(sim_results_folderpath):
+        source_filepath = os.path.join(sim_results_folderpath, filename)
+        destination_filepath = os.path.join(sim_results_folderpath, 'OutputFiles', filename)
+        # Only EnergyPlus output files, the TimeSeriesData, ProcessedData, ... subfolders stay in place
+        if os.path.isfile(source_filepath): shutil.move(source_filepath, destination_filepath)
+
+def simulate_variable(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename, run_simulation=None): # DEBUG: Changed header, will need to update everywhere the function in used. 
+    
+    """
+    Simulate a variable using the given IDF and weather files, and save the output variable to a CSV file.
+    
+    Parameters:
+    sim_results_folderpath (str): The folder path where the simulation results are stored. Has subfolders:
+        - 'TimeSeriesData' for time series data in CSV format.
+        - 'ProcessedData' for processed data in pickle format.
+        - 'OutputFiles' for additional output files. 
+        - 'Temporary_Folder' for temporary files
+
+    This function performs the following steps:
+    1. Loads the IDF file and retrieves the Output:Variable object.
+    2. Updates the Output:Variable object with the specified parameters.
+    3. Saves the modified IDF file to a specified output folder.
+    4. Runs the EnergyPlus simulation using the modified IDF and weather files.
+    5. Deletes the modified IDF file after the simulation is complete.
+    
+    run_simulation (callable, optional): Runs EnergyPlus as run_simulation(idf_filepath, weather_filepath, base_dir_path=...). 
+        Default is op.simulate. Used to act on the outputs while EnergyPlus runs, see tail_eso_rows.
+
+    Returns:
+    
+    """
+    
+    Edited_IDFFile_Path = prepare_variable_idf(simulation_settings, idf_filepath, sim_results_folderpath, variablename)
+    
     # Run Building Simulation to obtain current output variable
-    op.simulate(Edited_IDFFile_Path, weather_filepath, base_dir_path=sim_results_folderpath)
+    if run_simulation is None: run_simulation = op.simulate
+    run_simulation(Edited_IDFFile_Path, weather_filepath, base_dir_path=sim_results_folderpath)
 
     # Organize Output Files
     timeseriesdata_csv_filepath = os.path.join(sim_results_folderpath, 'TimeSeriesData', variablename).replace(' ', '_') + ".csv"
     timeseriesdata_source_filepath = os.path.join(sim_results_folderpath, "eplusout.csv")
     shutil.move(timeseriesdata_source_filepath, timeseriesdata_csv_filepath)
-    
-    for filename in os.listdir(sim_results_folderpath):
-        source_filepath = os.path.join(sim_results_folderpath, filename)
-        destination_filepath = os.path.join(sim_results_folderpath, 'OutputFiles', filename)
-        shutil.move(source_filepath, destination_filepath)
+    organize_output_files(sim_results_folderpath)
     
     # Delete the Edited IDF File
     os.remove(Edited_IDFFile_Path)
@@ -179,13 +452,359 @@ def simulate_variable(simulation_settings, idf_filepath, weather_filepath, sim_r
     
     return timeseriesdata_csv_filepath, eiofilepath
 
+# =============================================================================
+# Tail Output ESO While EnergyPlus Runs
+# =============================================================================
+
+# Reporting frequencies whose rows tail_eso_rows reads, their ESO time stamps (report code 2) carry the minutes
+STREAM_REPORTING_FREQUENCIES = ['timestep', 'hourly', 'detailed']
+
+# Report codes 1 to 6 are the environment and time stamp lines, output variables are numbered from 7
+ESO_STAMP_CODES = ['1', '2', '3', '4', '5', '6']
+
+def can_stream(simulation_settings):
+    """
+    Returns True if the reporting frequency can be uploaded from eplusout.eso while EnergyPlus runs, see tail_eso_rows.
+    """
+    
+    return str(simulation_settings["sim_output_variable_reporting_frequency"]).lower() in STREAM_REPORTING_FREQUENCIES
+
+def tail_lines(filepath, is_running, poll_interval=0.5):
+    """
+    Follows a text file while another process writes it and yields the complete lines added since the last poll.
+
+    The file may not exist yet when tailing starts. A line is only yielded once its newline has been written, 
+    so partially written lines are held back until the next poll; after the writer has finished, a last line 
+    without newline is yielded too.
+
+    Args:
+        filepath (str): The file, e.g. eplusout.eso in the simulation folder.
+        is_running (callable): Returns True while the writer is still running.
+        poll_interval (float): Seconds between polls. Default is 0.5.
+
+    Yields:
+        list: The new lines, without line endings.
+    """
+    
+    position = 0
+    buffer = ''
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    
+    while True:
+        # Sample before reading, so that everything written before the writer ended is read in this pass
+        running = is_running()
+        
+        if os.path.exists(filepath):
+            with open(filepath, 'rb') as file:
+                file.seek(position)
+                data = file.read()
+            position += len(data)
+            buffer += decoder.decode(data, final=not running)
+        
+        lines = buffer.split('\n')
+        buffer = lines.pop() # Partial line, completed by a later read
+        if not running and buffer:
+            lines.append(buffer)
+            buffer = ''
+        
+        lines = [line.rstrip('\r') for line in lines if line.strip()]
+        if lines: yield lines
+        
+        if not running:
+            return
+        
+        time.sleep(poll_interval)
+
+def parse_eso_lines(lines, eso_state):
+    """
+    Parses lines of an eplusout.eso file in order and returns the rows they complete.
+
+    The data dictionary maps each report code to a column named like in eplusout.csv, e.g. 
+    'ZONE 1:Zone Mean Air Temperature [C](TimeStep)'. In the data section every time stamp line (report code 2) 
+    starts a row and the following '<report code>,<value>' lines fill it. A row is complete at the next time stamp, 
+    environment line or 'End of Data'. Its 'Date/Time' is the end of the interval as written by ReadVarsESO, 
+    e.g. ' 01/01  24:00:00'.
+
+    Args:
+        lines (list): Lines of the file, continuing where the previous call stopped.
+        eso_state (dict): Parser state kept between calls, {} for a new file. 'columns' holds the column names 
+                          of the data dictionary in order.
+
+    Returns:
+        list: One dict per complete row, {'Date/Time': str, column name: float, ...}.
+    """
+    
+    if not eso_state:
+        eso_state.update({'in_dictionary': True, 'columns': {}, 'row': None})
+    
+    columns = eso_state['columns']
+    rows = []
+    
+    for line in lines:
+        fields = line.split(',')
+        
+        if eso_state['in_dictionary']:
+            if line.startswith('End of Data Dictionary'):
+                eso_state['in_dictionary'] = False
+            elif len(fields) >= 4 and fields[0].strip() not in ESO_STAMP_CODES and fields[0].strip().isdigit():
+                # <code>,<values>,<key>,<name> [<units>] !<frequency>
+                name, _, frequency = ','.join(fields[3:]).partition('!')
+                frequency = frequency.split()[0] if frequency.split() else ''
+                columns[fields[0].strip()] = fields[2].strip() + ':' + name.strip() + '(' + frequency + ')'
+            continue
+        
+        code = fields[0].strip()
+        
+        if code in ESO_STAMP_CODES or line.startswith('End of Data'):
+            if eso_state['row'] is not None: rows.append(eso_state['row'])
+            eso_state['row'] = None
+            
+            # 2,<day of simulation>,<month>,<day of month>,<dst>,<hour>,<start minute>,<end minute>,<day type>
+            if code == '2' and len(fields) >= 8:
+                month, day, hour, end_minute = int(fields[2]), int(fields[3]), int(fields[5]), int(float(fields[7]))
+                hour, minute = (hour, 0) if end_minute >= 60 else (hour - 1, end_minute)
+                eso_state['row'] = {'Date/Time': ' %02d/%02d  %02d:%02d:00' % (month, day, hour, minute)}
+        
+        elif eso_state['row'] is not None and code in columns and len(fields) >= 2:
+            eso_state['row'][columns[code]] = float(fields[1])
+    
+    return rows
+
+def tail_eso_rows(eso_filepath, is_running, poll_interval=0.5, max_rows=5000):
+    """
+    Follows eplusout.eso while EnergyPlus writes it and yields its complete rows in the eplusout.csv layout.
+
+    EnergyPlus writes the .eso file during the run (eplusout.csv is only converted from it by ReadVarsESO after 
+    EnergyPlus exits), so rows become available while the simulation is still running, up to EnergyPlus' own 
+    output buffering. Only rows stamped with report code 2 are read, see STREAM_REPORTING_FREQUENCIES.
+
+    Args:
+        eso_filepath (str): The eplusout.eso file in the simulation folder.
+        is_running (callable): Returns True while EnergyPlus is still running.
+        poll_interval (float): Seconds between polls. Default is 0.5.
+        max_rows (int): Maximum rows per yielded batch. Default is 5000.
+
+    Yields:
+        pandas.DataFrame: 'Date/Time' and one column per output variable and key, as in eplusout.csv.
+    """
+    
+    eso_state = {}
+    rows = []
+    
+    for lines in tail_lines(eso_filepath, is_running, poll_interval):
+        rows.extend(parse_eso_lines(lines, eso_state))
+        
+        while len(rows) >= max_rows:
+            yield pd.DataFrame(rows[:max_rows], columns=['Date/Time'] + list(eso_state['columns'].values()))
+            rows = rows[max_rows:]
+    
+    # A row still open when the file ends is complete
+    if eso_state and eso_state['row'] is not None: rows.append(eso_state['row'])
+    
+    for k in range(0, len(rows), max_rows):
+        yield pd.DataFrame(rows[k:k + max_rows], columns=['Date/Time'] + list(eso_state['columns'].values()))
+
+# =============================================================================
+# Time-Sharded Parallel Simulation
+# =============================================================================
+
+# Optional simulation_settings keys read by simulate_variable_sharded:
+# "sim_shards": number of shards the run period is split into, 1 simulates in one piece.
+# "sim_shard_warmup_days": days each shard simulates before its own period, discarded when stitching.
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def split_run_period(sim_start_datetime, sim_end_datetime, shards, warmup_days):
+    """
+    Splits a run period into consecutive shards of whole days, each with a warmup lead-in.
+
+    Args:
+        sim_start_datetime, sim_end_datetime (datetime): First and last simulated day (both included).
+        shards (int): Number of shards, reduced to the number of days if larger.
+        warmup_days (int): Lead-in days simulated before each shard's own period (not before the first shard).
+
+    Returns:
+        list of dict: Per shard 'run_start' (first simulated day, lead-in included), 'keep_start' and 'keep_end' 
+                      (first and last day kept in the stitched series).
+    """
+    
+    start_day = sim_start_datetime.replace(hour=0, minute=0, second=0, microsecond=0)
+    days = (sim_end_datetime.replace(hour=0, minute=0, second=0, microsecond=0) - start_day).days + 1
+    shards = max(1, min(shards, days))
+    
+    # Shard boundaries in days, as even as possible
+    boundaries = [round(k * days / shards) for k in range(shards + 1)]
+    
+    run_period_shards = []
+    for k in range(shards):
+        keep_start = start_day + timedelta(days=boundaries[k])
+        run_period_shards.append({'run_start': max(start_day, keep_start - timedelta(days=warmup_days)), 
+                                  'keep_start': keep_start, 
+                                  'keep_end': start_day + timedelta(days=boundaries[k + 1] - 1)})
+    
+    return run_period_shards
+
+def make_shard_idf(edited_idf_filepath, shard_idf_filepath, run_start, run_end, sim_start_datetime):
+    """
+    Copies an edited IDF file with its RunPeriod narrowed to one shard.
+
+    If the RunPeriod fixes the day of week of the start day, it is shifted with the shard's offset from the 
+    overall start so the shard follows the same calendar as an unsharded run.
+    """
+    
+    shard_idf = op.Epm.load(edited_idf_filepath)
+    
+    shard_runperiod = shard_idf.RunPeriod.one()
+    shard_runperiod['begin_day_of_month'] = run_start.day
+    shard_runperiod['begin_month'] = run_start.month
+    shard_runperiod['end_day_of_month'] = run_end.day
+    shard_runperiod['end_month'] = run_end.month
+    
+    try:
+        start_weekday = str(shard_runperiod['day_of_week_for_start_day']).capitalize()
+        if start_weekday in WEEKDAYS:
+            offset = (run_start.date() - sim_start_datetime.date()).days
+            shard_runperiod['day_of_week_for_start_day'] = WEEKDAYS[(WEEKDAYS.index(start_weekday) + offset) % 7]
+    except Exception:
+        pass
+    
+    shard_idf.save(shard_idf_filepath)
+
+def simulate_shard(simulation_settings, shard, shard_index, edited_idf_filepath, weather_filepath, sim_results_folderpath, variablename):
+    """
+    Simulates one shard in Shards/Shard_<k> of the results folder.
+
+    Returns:
+        pandas.DataFrame: The shard's output variable CSV with an added 'DateTime' column of formatted datetimes.
+    """
+    
+    shard_folderpath = os.path.join(sim_results_folderpath, 'Shards', 'Shard_' + str(shard_index))
+    shard_results_folderpath = os.path.join(shard_folderpath, 'Results')
+    if not os.path.exists(shard_folderpath): os.makedirs(shard_folderpath)
+    
+    shard_idf_filepath = os.path.join(shard_folderpath, os.path.basename(edited_idf_filepath))
+    make_shard_idf(edited_idf_filepath, shard_idf_filepath, shard['run_start'], shard['keep_end'], simulation_settings["sim_start_datetime"])
+    
+    timeseriesdata_csv_filepath, eiofilepath = simulate_variable(simulation_settings, shard_idf_filepath, weather_filepath, shard_results_folderpath, variablename)
+    
+    shard_df = pd.read_csv(timeseriesdata_csv_filepath)
+    sim_year = simulation_settings["sim_start_datetime"].year
+    shard_df['DateTime'] = pd.to_datetime([format_datetime(sim_year, datetime_str) for datetime_str in shard_df['Date/Time']])
+    
+    return shard_df
+
+def simulate_variable_sharded(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename, shards=None, warmup_days=None, max_workers=None):
+    """
+    Simulates a variable by splitting the run period into shards that are simulated in parallel, and stitches 
+    the shard outputs back into one continuous series. A drop-in replacement for simulate_variable: same 
+    arguments, same (timeseriesdata_csv_filepath, eiofilepath) return value and same results folder layout.
+
+    Every shard after the first starts warmup_days early, so its building state has settled by the time its own 
+    period begins; the lead-in rows are discarded. Shards run on a thread pool, each thread waits on its own 
+    EnergyPlus process.
+
+    The seams are checked in ProcessedData/<variablename>_Shard_Seam_Report.csv (kept with the processed data when 
+    the raw outputs are removed), with one row per seam and output column:
+    - 'Overlap Max Abs Diff': largest difference between the previous shard and the lead-in of the next shard on 
+      the last overlapping day, i.e. how far the lead-in is from converged.
+    - 'Seam Jump': absolute change across the seam, and 'Seam Jump Ratio' relative to the median absolute 
+      step change of the column. Ratios well above 1 point to a discontinuity.
+
+    Args:
+        simulation_settings (dict): Simulation settings, see make_edited_idf.
+        idf_filepath (str): The edited IDF file (see make_edited_idf).
+        weather_filepath (str): The weather file.
+        sim_results_folderpath (str): Results folder of the simulation.
+        variablename (str): The output variable.
+        shards (int, optional): Number of shards. Default is simulation_settings["sim_shards"], or 4.
+        warmup_days (int, optional): Lead-in days. Default is simulation_settings["sim_shard_warmup_days"], or 7.
+        max_workers (int, optional): Number of shards simulated at once. Default is all.
+
+    Returns:
+        tuple: (timeseriesdata_csv_filepath, eiofilepath).
+    """
+    
+    if shards is None: shards = simulation_settings.get("sim_shards", 4)
+    if warmup_days is None: warmup_days = simulation_settings.get("sim_shard_warmup_days", 7)
+    
+    run_period_shards = split_run_period(simulation_settings["sim_start_datetime"], simulation_settings["sim_end_datetime"], shards, warmup_days)
+    
+    with ThreadPoolExecutor(max_workers=max_workers or len(run_period_shards)) as executor:
+        futures = [executor.submit(simulate_shard, simulation_settings, shard, k, idf_filepath, weather_filepath, sim_results_folderpath, variablename) for k, shard in enumerate(run_period_shards)]
+        shard_dfs = [future.result() for future in futures]
+    
+    # Keep each shard's own period, timestamps mark the end of each interval so a day runs from (00:00, 24:00]
+    kept_dfs = []
+    for shard, shard_df in zip(run_period_shards, shard_dfs):
+        keep = (shard_df['DateTime'] > shard['keep_start']) & (shard_df['DateTime'] <= shard['keep_end'] + timedelta(days=1))
+        kept_dfs.append(shard_df[keep])
+    
+    value_columns = [c for c in shard_dfs[0].columns if c not in ('Date/Time', 'DateTime')]
+    
+    # Seam Report
+    seam_rows = []
+    for k in range(1, len(kept_dfs)):
+        previous_df, next_df, lead_in_df = kept_dfs[k - 1], kept_dfs[k], shard_dfs[k]
+        overlap_start = run_period_shards[k]['keep_start'] - timedelta(days=1)
+        previous_overlap = previous_df[previous_df['DateTime'] > overlap_start].set_index('DateTime')[value_columns]
+        lead_in_overlap = lead_in_df[(lead_in_df['DateTime'] > overlap_start) & (lead_in_df['DateTime'] <= run_period_shards[k]['keep_start'])].set_index('DateTime')[value_columns]
+        overlap_diff = (previous_overlap - lead_in_overlap).abs().max()
+        
+        seam_jump = (next_df[value_columns].iloc[0] - previous_df[value_columns].iloc[-1]).abs()
+        typical_step = pd.concat([previous_df[value_columns].diff().abs(), next_df[value_columns].diff().abs()]).median()
+        
+        for column in value_columns:
+            seam_rows.append({'Seam': str(run_period_shards[k]['keep_start']), 'Column': column, 
+                              'Overlap Max Abs Diff': overlap_diff.get(column, np.nan), 'Seam Jump': seam_jump[column], 
+                              'Seam Jump Ratio': seam_jump[column] / typical_step[column] if typical_step[column] > 0 else np.nan})
+    
+    seam_report_df = pd.DataFrame(seam_rows, columns=['Seam', 'Column', 'Overlap Max Abs Diff', 'Seam Jump', 'Seam Jump Ratio'])
+    if not os.path.exists(os.path.join(sim_results_folderpath, 'ProcessedData')): os.makedirs(os.path.join(sim_results_folderpath, 'ProcessedData'))
+    seam_report_df.to_csv(os.path.join(sim_results_folderpath, 'ProcessedData', variablename.replace(' ', '_') + '_Shard_Seam_Report.csv'), index=False)
+    
+    # Stitched CSV in the layout of simulate_variable
+    stitched_df = pd.concat(kept_dfs, ignore_index=True).drop(columns=['DateTime'])
+    
+    if not os.path.exists(os.path.join(sim_results_folderpath, 'TimeSeriesData')): os.makedirs(os.path.join(sim_results_folderpath, 'TimeSeriesData'))
+    if not os.path.exists(os.path.join(sim_results_folderpath, 'OutputFiles')): os.makedirs(os.path.join(sim_results_folderpath, 'OutputFiles'))
+    timeseriesdata_csv_filepath = os.path.join(sim_results_folderpath, 'TimeSeriesData', variablename).replace(' ', '_') + ".csv"
+    stitched_df.to_csv(timeseriesdata_csv_filepath, index=False)
+    
+    # The .eio and other output files of the first shard stand for the building
+    shard_outputfiles_folderpath = os.path.join(sim_results_folderpath, 'Shards', 'Shard_0', 'Results', 'OutputFiles')
+    for filename in os.listdir(shard_outputfiles_folderpath):
+        shutil.copy(os.path.join(shard_outputfiles_folderpath, filename), os.path.join(sim_results_folderpath, 'OutputFiles', filename))
+    
+    shutil.rmtree(os.path.join(sim_results_folderpath, 'Shards'), ignore_errors=True)
+    
+    eiofilepath = os.path.join(sim_results_folderpath, 'OutputFiles', 'eplusout.eio')
+    
+    print("Stitched " + str(len(run_period_shards)) + " Shards: " + variablename + ", largest seam jump ratio " + 
+          f"{seam_report_df['Seam Jump Ratio'].max():.2f}" + '\n')
+    
+    return timeseriesdata_csv_filepath, eiofilepath
+
 # =============================================================================
 # Convert and Save Output Variables .csv to.mat in Results Folder
 # =============================================================================    
 
+def read_timeseriesdata_file(filepath):
+    """
+    Reads one file of the TimeSeriesData folder into the eplusout.csv layout ('Date/Time' and one column per key):
+    a CSV written by simulate_variable, or an .npz capture written by EP_DataCapture.save_capture.
+    """
+    
+    if filepath.endswith('.npz'):
+        from EP_DataCapture import load_capture, capture_to_df # Imported here, EP_DataCapture imports this module
+        variablename = os.path.splitext(os.path.basename(filepath))[0].replace('_', ' ')
+        return capture_to_df(load_capture(filepath), variablename)
+    
+    return pd.read_csv(filepath)
+
 def Process_TimeSeriesData(simulation_settings, sim_results_folderpath):
     """
     Processes output variable time series data from multiple CSV files and saves the processed data into a single dictionary. Pickles the Dictionary.
+    Variables captured with the EnergyPlus API (.npz, see EP_DataCapture) are read through read_timeseriesdata_file.
 
     Parameters:
     CSV_Folderpath: Path to folder containing time series data in CSV format for multiple variables. 
@@ -221,7 +840,7 @@ def Process_TimeSeriesData(simulation_settings, sim_results_folderpath):
     # Get Filepath of all Time Series Data CSV's
     timeseriesdata_filepaths = []
     for filename in os.listdir(os.path.join(sim_results_folderpath, 'TimeSeriesData')):
-        if filename.endswith('.csv'):
+        if filename.endswith('.csv') or filename.endswith('.npz'):
             timeseriesdata_filepaths.append(os.path.join(sim_results_folderpath, 'TimeSeriesData', filename))
     
     # Initializing IDF_OutputVariable_Dict
@@ -236,7 +855,7 @@ def Process_TimeSeriesData(simulation_settings, sim_results_folderpath):
         
             if Is_First_FilePath == 1:
             
-                Current_DF = pd.read_csv(filepath)
+                Current_DF = read_timeseriesdata_file(filepath)
                 DateTime_List = []
                 DateTime_Column = Current_DF['Date/Time']
             
@@ -253,7 +872,7 @@ def Process_TimeSeriesData(simulation_settings, sim_results_folderpath):
             # ===== Processing Variable ====================================================== #
         
             # Reading .csv file into dataframe
-            if Is_First_FilePath == 0: Current_DF = pd.read_csv(filepath)
+            if Is_First_FilePath == 0: Current_DF = read_timeseriesdata_file(filepath)
         
             # Dropping DateTime Column
             Current_DF = Current_DF.drop(Current_DF.columns[[0]],axis=1)
@@ -262,7 +881,7 @@ def Process_TimeSeriesData(simulation_settings, sim_results_folderpath):
             IDF_OutputVariable_ColumnName_List.extend(Current_DF.columns)
 
             # Storing Current_DF in IDF_OutputVariable_Dict
-            VariableName = ((os.path.basename(filepath)).replace('_', ' ')).replace('.csv', '')
+            VariableName = os.path.splitext(os.path.basename(filepath).replace('_', ' '))[0]
             IDF_OutputVariable_Dict[VariableName] = Current_DF
         
             Is_First_FilePath = 0;
@@ -282,7 +901,7 @@ def Process_TimeSeriesData(simulation_settings, sim_results_folderpath):
 # Process .eio Output File and save in Results Folder
 # ============================================================================= 
 
-def Process_Eio_OutputFile(simulation_settings, sim_results_folderpath)Ligho:
+def Process_Eio_OutputFile(simulation_settings, sim_results_folderpath):
     """
     Processes the contents of an .eio file into a dictionary. Pickles the dictionary. 
 
@@ -23,6 +23,10 @@ import re
 import shutil
 import datetime
 import pickle
+import time
+import psycopg2
+import queue
+import threading
 
 #Internal Module
 from EP_DataGenerator import *
@@ -32,6 +36,11 @@ from Database_Creator import *
 from BuildingIds_DataUploader import *
 from BuildingTimeSeriesData_Uploader import *
 from EioTableData_DataUploader import * 
+from EP_DataValidator import validate_simulations, load_quarantine_list
+from EP_DataUploader2 import insert_df_rows, timeseriesdata_format_df
+from EP_DataCache import invalidate_building
+from EP_FileUtilities import replace_file
+from EP_DataCapture import can_capture, capture_variable, save_capture, capture_to_df
 
 # =============================================================================
 # Check Simulation Status
@@ -51,6 +60,10 @@ def check_simulation_status(sim_results_folderpath):
 # =============================================================================
 # Update Simulation Information CSV
 # =============================================================================
+
+# Serializes the read-modify-write updates of Simulation_Information.csv by concurrent threads (see pipelined_data_generation)
+SIMULATION_INFORMATION_LOCK = threading.Lock()
+
 def update_simulation_information(sim_results_folderpath, field, newvalue):
     """
     Updates a specific field in the Simulation_Information.csv file.
@@ -77,20 +90,104 @@ def update_simulation_information(sim_results_folderpath, field, newvalue):
     
     field_index = field_to_index[field]
 
-    # Read the file contents
-    with open(sim_information_filepath, 'r') as file:
-        lines = file.readlines()
+    with SIMULATION_INFORMATION_LOCK:
+        
+        # Read the file contents
+        with open(sim_information_filepath, 'r') as file:
+            lines = file.readlines()
+    
+        # Update the specific field for the matching row
+        for i in range(len(lines)):
+            line_fields = lines[i].strip().split(',')
+            if sim_results_folderpath == line_fields[3]:
+                line_fields[field_index] = newvalue
+                lines[i] = ','.join(line_fields) + '\n'
+    
+        # Write the updated content back to the file
+        replace_file(sim_information_filepath, lambda file: file.writelines(lines))
 
-    # Update the specific field for the matching row
-    for i in range(len(lines)):
-        line_fields = lines[i].strip().split(',')
-        if sim_results_folderpath == line_fields[3]:
-            line_fields[field_index] = newvalue
-            lines[i] = ','.join(line_fields) + '\n'
+# =============================================================================
+# Remove Stale Buildings
+# =============================================================================
 
-    # Write the updated content back to the file
-    with open(sim_information_filepath, 'w') as file:
-        file.writelines(lines)
+# Tables holding rows of a building, children before buildingids
+BUILDING_TABLES = ['aggregatedtimeseriesdata', 'aggregationzones', 'timeseriesdata', 'eiotabledata', 'buildingids']
+
+# Subfolders of a results folder written by a simulation and its processing
+SIMULATION_OUTPUT_SUBFOLDERS = ['TimeSeriesData', 'OutputFiles', 'ProcessedData', 'Sim_Aggregated_Data']
+
+def remove_stale_buildings(conn_information, stale_buildings_filepath=None):
+    """
+    Removes what is left of the simulations reset by Refresh_Simulation_Information (IDF or weather file changed), 
+    listed in Generated_Textfiles/Stale_Buildings.csv.
+
+    For every row with an old BuildingID, its rows are deleted from BUILDING_TABLES in one transaction, its cached 
+    retrievals are invalidated and its rows are dropped from TimeSeriesData_Information.csv. The outputs in the 
+    results folder (SIMULATION_OUTPUT_SUBFOLDERS) and the folder's rows in Aggregation_Information.csv are removed 
+    too. Each row is dropped from the file once cleaned, so an interrupted cleanup resumes where it stopped. The 
+    catalog statistics (EP_DataStatistics) are not updated and should be recomputed.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        stale_buildings_filepath (str, optional): Default is Generated_Textfiles/Stale_Buildings.csv.
+
+    Returns:
+        int: The number of cleaned rows.
+    """
+    
+    generated_textfiles_folderpath = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles')
+    if stale_buildings_filepath is None: stale_buildings_filepath = os.path.join(generated_textfiles_folderpath, 'Stale_Buildings.csv')
+    timeseriesdata_information_filepath = os.path.join(generated_textfiles_folderpath, 'TimeSeriesData_Information.csv')
+    aggregation_information_filepath = os.path.join(generated_textfiles_folderpath, 'Aggregation_Information.csv')
+    
+    if not os.path.exists(stale_buildings_filepath):
+        return 0
+    
+    with open(stale_buildings_filepath, 'r') as file:
+        lines = file.readlines()
+    header, stale_rows = lines[0], [line for line in lines[1:] if line.strip()]
+    
+    initialize_database_schema(conn_information)
+    
+    remaining_rows = list(stale_rows)
+    for line in stale_rows:
+        buildingid, idf_filepath, weather_filepath, sim_results_folderpath = line.strip().split(',')[:4]
+        print("Removing Stale Building: " + buildingid + " " + os.path.basename(sim_results_folderpath) + '\n')
+        
+        if buildingid != 'NA':
+            conn = psycopg2.connect(conn_information)
+            cur = conn.cursor()
+            try:
+                for tablename in BUILDING_TABLES:
+                    cur.execute("DELETE FROM " + tablename + " WHERE buildingid = %s", (int(buildingid),))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+                conn.close()
+            
+            invalidate_building(int(buildingid))
+            
+            with TIMESERIESDATA_INFORMATION_LOCK:
+                if os.path.exists(timeseriesdata_information_filepath):
+                    with open(timeseriesdata_information_filepath, 'r') as file:
+                        information_lines = [information_line for information_line in file.readlines() if information_line.split(',')[0] != buildingid]
+                    replace_file(timeseriesdata_information_filepath, lambda file: file.writelines(information_lines))
+        
+        for subfolder in SIMULATION_OUTPUT_SUBFOLDERS:
+            shutil.rmtree(os.path.join(sim_results_folderpath, subfolder), ignore_errors=True)
+        
+        if os.path.exists(aggregation_information_filepath):
+            with open(aggregation_information_filepath, 'r') as file:
+                information_lines = [information_line for information_line in file.readlines() if information_line.split(',')[0] != sim_results_folderpath]
+            replace_file(aggregation_information_filepath, lambda file: file.writelines(information_lines))
+        
+        remaining_rows.remove(line)
+        replace_file(stale_buildings_filepath, lambda file: file.writelines([header] + remaining_rows))
+    
+    return len(stale_rows)
 
 # =============================================================================
 # Generate and Upload One Variable - Reviewed
@@ -101,11 +198,24 @@ def generate_and_upload_variable(conn_information, simulation_settings, building
     timeseriesdata_information_filepath = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles', 'TimeSeriesData_Information.csv')
     simulation_information_filepath = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles', 'Simulation_Information.csv')
     
-    if not already_uploaded(timeseriesdata_information_filepath, simulation_settings, buildingid, variablename): 
+    if simulation_settings.get("sim_backend") == 'api' and can_capture(simulation_settings) and not already_uploaded(simulation_settings, buildingid, variablename):
+        
+        # Capture Variable In-Process and Upload it without Text Output
+        print("Capturing Variable with the EnergyPlus API: " + variablename + '\n')
+        timeseriesdata_csv_filepath, eiofilepath = capture_upload_variable(conn_information, simulation_settings, buildingid, idf_filepath, weather_filepath, sim_results_folderpath, variablename)
+        
+    elif simulation_settings.get("sim_stream_upload") and can_stream(simulation_settings) and not already_uploaded(simulation_settings, buildingid, variablename):
+        
+        # Simulate Variable and Upload its Rows while EnergyPlus Runs
+        print("Simulating and Streaming Variable: " + variablename + '\n')
+        timeseriesdata_csv_filepath, eiofilepath = stream_upload_variable(conn_information, simulation_settings, buildingid, idf_filepath, weather_filepath, sim_results_folderpath, variablename)
+        
+    elif not already_uploaded(simulation_settings, buildingid, variablename): 
         
         # Simulate Variable
         print("Simulating Variable: " + variablename + '\n')
-        timeseriesdata_csv_filepath, eiofilepath = simulate_variable(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename)
+        simulate_variable_function = simulate_variable_sharded if simulation_settings.get("sim_shards", 1) > 1 else simulate_variable
+        timeseriesdata_csv_filepath, eiofilepath = simulate_variable_function(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename)
         
         # Upload Variable
         print("Uploading Variable to TimeSeriesData Table: " + variablename + '\n')
@@ -115,6 +225,136 @@ def generate_and_upload_variable(conn_information, simulation_settings, building
     
     return timeseriesdata_csv_filepath, eiofilepath
         
+# =============================================================================
+# Capture One Variable with the EnergyPlus API
+# =============================================================================
+
+def capture_upload_variable(conn_information, simulation_settings, buildingid, idf_filepath, weather_filepath, sim_results_folderpath, variablename):
+    """
+    Simulates a variable with capture_variable (EnergyPlus API) and bulk uploads the captured arrays.
+
+    The capture is saved to TimeSeriesData/<variablename>.npz instead of a CSV, and goes to the database through
+    timeseriesdata_format_df and insert_df_rows in one transaction, so that errors are raised rather than printed. 
+    Completion is recorded in TimeSeriesData_Information.csv (see already_uploaded). Used when "sim_backend" is 'api' 
+    and can_capture is True.
+
+    Returns:
+        tuple: (timeseriesdata_npz_filepath, eiofilepath).
+    """
+    
+    update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Status', 'Upload Started')
+    start_time = time.time()
+    
+    capture, eiofilepath = capture_variable(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename)
+    timeseriesdata_npz_filepath = save_capture(sim_results_folderpath, variablename, capture)
+    
+    simulation_year = str(simulation_settings["sim_end_datetime"].year)
+    variable_df = timeseriesdata_format_df(capture_to_df(capture, variablename), buildingid, variablename, simulation_year, simulation_settings["sim_timestep"])
+    
+    conn = psycopg2.connect(conn_information)
+    cur = conn.cursor()
+    try:
+        insert_df_rows(cur, 'timeseriesdata', variable_df)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    
+    invalidate_building(buildingid)
+    
+    update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Status', 'Upload Completed')
+    update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Time', convert_seconds_to_hhmmss(time.time() - start_time))
+    
+    print("Captured " + str(capture['Values'].shape[0]) + " timesteps of " + variablename + " for " + str(capture['Values'].shape[1]) + " keys\n")
+    
+    return timeseriesdata_npz_filepath, eiofilepath
+
+# =============================================================================
+# Stream One Variable into the Database while Simulating
+# =============================================================================
+
+def stream_upload_variable(conn_information, simulation_settings, buildingid, idf_filepath, weather_filepath, sim_results_folderpath, variablename, batch_rows=5000):
+    """
+    Simulates a variable like simulate_variable while uploading its rows from eplusout.eso as EnergyPlus writes it.
+
+    EnergyPlus runs on a background thread. The calling thread tails eplusout.eso (see tail_eso_rows) and inserts 
+    each batch of complete rows through timeseriesdata_format_df and insert_df_rows, so the upload is nearly done 
+    when the simulation exits. All batches are one transaction, committed only once EnergyPlus has finished 
+    without error and rolled back otherwise, so a failed run leaves no partial rows and a retry no duplicates. 
+    Completion is recorded in TimeSeriesData_Information.csv (see already_uploaded). The CSV written by ReadVarsESO 
+    after the run is still organized into TimeSeriesData. Used when "sim_stream_upload" is set and can_stream is True.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        simulation_settings (dict): Simulation settings.
+        buildingid (int): The building the rows belong to.
+        idf_filepath, weather_filepath, sim_results_folderpath, variablename: See simulate_variable.
+        batch_rows (int, optional): Maximum rows (timestamps) per upload. Default is 5000.
+
+    Returns:
+        tuple: (timeseriesdata_csv_filepath, eiofilepath), as returned by simulate_variable.
+    """
+    
+    simulation_year = str(simulation_settings["sim_end_datetime"].year)
+    timeresolution = simulation_settings["sim_timestep"]
+    
+    update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Status', 'Upload Started')
+    start_time = time.time()
+    
+    def run_and_upload(edited_idf_filepath, weather_filepath, base_dir_path):
+        
+        eso_filepath = os.path.join(base_dir_path, 'eplusout.eso')
+        if os.path.exists(eso_filepath): os.remove(eso_filepath) # Left over from an interrupted run
+        
+        conn = psycopg2.connect(conn_information)
+        cur = conn.cursor()
+        
+        try:
+            uploaded_rows = stream_rows(cur, edited_idf_filepath, weather_filepath, base_dir_path, eso_filepath)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+        
+        print("Streamed " + str(uploaded_rows) + " rows of " + variablename + '\n')
+    
+    def stream_rows(cur, edited_idf_filepath, weather_filepath, base_dir_path, eso_filepath):
+        
+        simulation_error = []
+        def run():
+            try:
+                op.simulate(edited_idf_filepath, weather_filepath, base_dir_path=base_dir_path)
+            except BaseException as error:
+                simulation_error.append(error)
+        
+        simulation_thread = threading.Thread(target=run, daemon=True)
+        simulation_thread.start()
+        
+        uploaded_rows = 0
+        for variable_df in tail_eso_rows(eso_filepath, simulation_thread.is_alive, max_rows=batch_rows):
+            insert_df_rows(cur, 'timeseriesdata', timeseriesdata_format_df(variable_df, buildingid, variablename, simulation_year, timeresolution))
+            uploaded_rows += len(variable_df)
+        
+        simulation_thread.join()
+        if simulation_error: raise simulation_error[0]
+        
+        return uploaded_rows
+    
+    timeseriesdata_csv_filepath, eiofilepath = simulate_variable(simulation_settings, idf_filepath, weather_filepath, sim_results_folderpath, variablename, run_simulation=run_and_upload)
+    
+    invalidate_building(buildingid)
+    
+    update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Status', 'Upload Completed')
+    update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Time', convert_seconds_to_hhmmss(time.time() - start_time))
+    
+    return timeseriesdata_csv_filepath, eiofilepath
+
 # =============================================================================
 # Generate and Upload One Building 
 # =============================================================================
@@ -122,19 +362,10 @@ def generate_and_upload_variable(conn_information, simulation_settings, building
 def generate_and_upload_building(conn_information, simulation_settings, sim_results_folderpath, idf_filepath, weather_filepath, variable_list):  
     
     # Load Simulation Settings into IDF file
-    edited_idf_filepath = make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath)
+    edited_idf_filepath = make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath, weather_filepath)
 
-    # Check if BuildingIds Table already created. If not, create Table
-    table_exists, table_empty = check_table_exists(conn_information, "public", "buildingids")
-    if not table_exists: create_buildingids_table(conn_information)
-    
-    # Check if TimeSeriesData Table already created. If not, create Table
-    table_exists, table_empty = check_table_exists(conn_information, "public", "timeseriesdata")
-    if not table_exists: create_timeseriesdata_table(conn_information)
-    
-    # Check if EioTableData Table already created. If not, create Table
-    table_exists, table_empty = check_table_exists(conn_information, "public", "eiotabledata")
-    if not table_exists: create_eiotabledata_table(conn_information)
+    # Create BuildingIds, TimeSeriesData and EioTableData Tables if needed. Only runs once per process.
+    initialize_database_schema(conn_information)
     
     if not check_simulation_status(sim_results_folderpath) == 'Uploaded':
         
@@ -168,25 +399,316 @@ def generate_and_upload_building(conn_information, simulation_settings, sim_resu
 # Generate and Upload Multiple Buildings
 # =============================================================================
 
-def automated_data_generation(conn_information, simulation_settings, filepaths, variable_list, sim_information_csv_filepath):
+def create_timeseriesdata_information_csv(sim_information_csv_filepath):
     
     # Create Time Series Data Information CSV if it does not already exist
     timeseriesdata_csv_filepath = os.path.join(os.path.dirname(sim_information_csv_filepath), 'TimeSeriesData_Information.csv')
     if not os.path.exists(timeseriesdata_csv_filepath):
         with open(timeseriesdata_csv_filepath, 'w') as file:
             file.write('BuildingID,Variable Name,Variable Type,SubVariable Name,Sim Start Datetime,Last Uploaded Datetime\n')
+
+def automated_data_generation(conn_information, simulation_settings, filepaths, variable_list, sim_information_csv_filepath):
+    
+    create_timeseriesdata_information_csv(sim_information_csv_filepath)
     
     with open(sim_information_csv_filepath, 'r') as file:
         lines = file.readlines()
         lines = lines[1:]
+    
+    # IDF/weather pairs that failed validate_simulations
+    quarantine = load_quarantine_list()
         
     for line in lines:
         idf_filepath = line.split(',')[1]
         weather_filepath = line.split(',')[2]
         sim_results_folderpath = line.split(',')[3]
         
+        # Rows whose IDF or weather file left the libraries (see Refresh_Simulation_Information)
+        if line.strip().split(',')[4] == 'Removed': continue
+        
+        if (idf_filepath, weather_filepath) in quarantine:
+            print("Skipping Quarantined Building: " + os.path.basename(sim_results_folderpath) + '\n')
+            continue
+        
         generate_and_upload_building(conn_information, simulation_settings, sim_results_folderpath, idf_filepath, weather_filepath, variable_list) 
 
+# =============================================================================
+# Staged Simulate/Parse/Reshape/Upload Pipeline
+# =============================================================================
+
+# Worker threads per pipeline stage. Simulation workers each run one EnergyPlus process.
+PIPELINE_STAGE_WORKERS = {'simulate': 4, 'parse': 1, 'reshape': 2, 'upload': 2}
+
+# Maximum items waiting between two stages, bounds the memory held by parsed and reshaped variables
+PIPELINE_QUEUE_SIZE = 4
+
+def get_pending_simulations(sim_information_csv_filepath):
+    """
+    Returns (idf_filepath, weather_filepath, sim_results_folderpath) of every row of Simulation_Information.csv 
+    that is not Complete, Uploaded, Removed or quarantined.
+    """
+    
+    with open(sim_information_csv_filepath, 'r') as file:
+        lines = file.readlines()
+        lines = lines[1:]
+    
+    quarantine = load_quarantine_list()
+    
+    pending = []
+    for line in lines:
+        line_fields = line.strip().split(',')
+        if line_fields[4] in ('Complete', 'Uploaded', 'Removed') or (line_fields[1], line_fields[2]) in quarantine:
+            continue
+        pending.append((line_fields[1], line_fields[2], line_fields[3]))
+    
+    return pending
+
+def run_pipeline_stage(name, function, input_queue, output_queue, workers, statistics, errors):
+    """
+    Starts the worker threads of one pipeline stage.
+
+    Each worker takes items from input_queue, calls function(item, emit) and measures the time spent in 
+    function as busy time. function passes its results on with emit(result), which blocks while output_queue 
+    is full. A None item ends a worker; the last worker to end passes one None per next-stage worker on.
+
+    Returns:
+        list: The started threads.
+    """
+    
+    lock = threading.Lock()
+    remaining = [workers]
+    worker_state = threading.local()
+    statistics[name] = {'workers': workers, 'busy_seconds': 0.0, 'blocked_seconds': 0.0, 'items': 0}
+    
+    def emit(result):
+        start_time = time.time()
+        output_queue.put(result)
+        worker_state.blocked_seconds += time.time() - start_time
+    
+    def work():
+        while True:
+            item = input_queue.get()
+            if item is None:
+                break
+            
+            # Time blocked on a full output queue is not busy time
+            worker_state.blocked_seconds = 0.0
+            start_time = time.time()
+            try:
+                function(item, emit)
+            except Exception as error:
+                print("Pipeline " + name + " error: " + str(error) + '\n')
+                errors.append((name, item[0] if isinstance(item, tuple) else item, str(error)))
+            with lock:
+                statistics[name]['busy_seconds'] += time.time() - start_time - worker_state.blocked_seconds
+                statistics[name]['blocked_seconds'] += worker_state.blocked_seconds
+                statistics[name]['items'] += 1
+        
+        with lock:
+            remaining[0] -= 1
+            last_worker = remaining[0] == 0
+        if last_worker and output_queue is not None:
+            for _ in range(statistics['_next_workers'][name]):
+                output_queue.put(None)
+    
+    threads = [threading.Thread(target=work, name='pipeline_' + name + '_' + str(k), daemon=True) for k in range(workers)]
+    for thread in threads: thread.start()
+    
+    return threads
+
+def pipelined_data_generation(conn_information, simulation_settings, variable_list, sim_information_csv_filepath, stage_workers=None, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Generates and uploads every pending building like automated_data_generation, but as a staged pipeline so 
+    that EnergyPlus runs and database uploads overlap.
+
+    Stages are connected by bounded queues and each has its own number of worker threads:
+    - simulate: edits the IDF and registers the building, then simulates its variables one after the other 
+      and hands each finished variable on (buildings run in parallel, the variables of one building share its results folder).
+      Variables already uploaded (see already_uploaded) are skipped, so that a rerun only does what is missing.
+      Rows sharing a results folder (the weather pairings of one IDF) are serialized: the next one only starts 
+      once every variable of the previous one has been uploaded or has failed.
+    - parse: reads the variable's CSV.
+    - reshape: melts it into the timeseriesdata layout (timeseriesdata_format_df).
+    - upload: bulk inserts it in one transaction (insert_df_rows), records it in TimeSeriesData_Information.csv 
+      and invalidates the cached retrievals of the building, like stream_upload_variable. A failed insert is 
+      rolled back and the building is not marked Complete. When the last variable of a building is uploaded the 
+      building is marked Complete and its processed data is written if requested.
+
+    The busy time of each stage is reported as utilization = busy / (workers x wall time). A stage near 100 % 
+    is the bottleneck and needs more workers; 'blocked' is time spent waiting for a full downstream queue.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        simulation_settings (dict): Simulation settings.
+        variable_list (list): Output variables to simulate for every building.
+        sim_information_csv_filepath (str): Filepath of Simulation_Information.csv.
+        stage_workers (dict, optional): Workers per stage. Default is PIPELINE_STAGE_WORKERS.
+        queue_size (int, optional): Capacity of each queue between stages. Default is PIPELINE_QUEUE_SIZE.
+
+    Returns:
+        dict: Per stage 'workers', 'items', 'busy_seconds', 'blocked_seconds' and 'utilization', plus 
+              'wall_seconds' and 'errors' (list of (stage, item, message)).
+    """
+    
+    stage_workers = dict(PIPELINE_STAGE_WORKERS, **(stage_workers or {}))
+    stage_names = ['simulate', 'parse', 'reshape', 'upload']
+    
+    initialize_database_schema(conn_information)
+    create_timeseriesdata_information_csv(sim_information_csv_filepath)
+    
+    simulation_year = str(simulation_settings["sim_end_datetime"].year)
+    timeresolution = simulation_settings["sim_timestep"]
+    simulate_variable_function = simulate_variable_sharded if simulation_settings.get("sim_shards", 1) > 1 else simulate_variable
+    
+    # Variables of each simulation (idf, weather, folder) still to be uploaded, and simulations with a failed variable
+    remaining_variables = {}
+    failed_simulations = set()
+    remaining_lock = threading.Lock()
+    
+    # One lock per results folder, held from the start of a simulation until its last variable is finished. 
+    # Released by the thread finishing that variable, which is why it is a Lock and not an RLock.
+    pending = get_pending_simulations(sim_information_csv_filepath)
+    folder_locks = {sim_results_folderpath: threading.Lock() for _, _, sim_results_folderpath in pending}
+    
+    def finish_variables(simulation, count=1, failed=False):
+        sim_results_folderpath = simulation[2]
+        
+        with remaining_lock:
+            remaining_variables[simulation] -= count
+            if failed: failed_simulations.add(simulation)
+            simulation_done = remaining_variables[simulation] == 0
+            simulation_failed = simulation in failed_simulations
+        
+        if not simulation_done:
+            return
+        
+        try:
+            if not simulation_failed:
+                update_simulation_information(sim_results_folderpath, 'Simulation Status', 'Complete')
+                if simulation_settings.get("keepfiles") in ["Processed", "All"]:
+                    Process_TimeSeriesData(simulation_settings, sim_results_folderpath)
+                    Process_Eio_OutputFile(simulation_settings, sim_results_folderpath)
+        finally:
+            folder_locks[sim_results_folderpath].release()
+    
+    def simulate(simulation, emit):
+        idf_filepath, weather_filepath, sim_results_folderpath = simulation
+        
+        folder_locks[sim_results_folderpath].acquire()
+        with remaining_lock: remaining_variables[simulation] = len(variable_list)
+        handled = 0
+        
+        try:
+            edited_idf_filepath = make_edited_idf(simulation_settings, sim_results_folderpath, idf_filepath, weather_filepath)
+            update_simulation_information(sim_results_folderpath, 'Simulation Status', 'Incomplete')
+            with SIMULATION_INFORMATION_LOCK:
+                buildingid = upload_to_buildingids(conn_information, sim_results_folderpath)
+            
+            for variablename in variable_list:
+                if already_uploaded(simulation_settings, buildingid, variablename):
+                    handled += 1
+                    finish_variables(simulation)
+                    continue
+                print("Simulating Building: " + os.path.basename(sim_results_folderpath) + " Variable: " + variablename + '\n')
+                timeseriesdata_csv_filepath, eiofilepath = simulate_variable_function(simulation_settings, edited_idf_filepath, weather_filepath, sim_results_folderpath, variablename)
+                handled += 1
+                emit((simulation, buildingid, variablename, timeseriesdata_csv_filepath))
+            
+            if not variable_list: finish_variables(simulation, 0)
+        
+        except Exception:
+            # Variables that never reach the upload stage, releases the folder if none is in flight
+            if handled < len(variable_list): finish_variables(simulation, len(variable_list) - handled, failed=True)
+            raise
+    
+    def parse(item, emit):
+        simulation, buildingid, variablename, timeseriesdata_csv_filepath = item
+        try:
+            variable_df = pd.read_csv(timeseriesdata_csv_filepath)
+        except Exception:
+            finish_variables(simulation, failed=True)
+            raise
+        emit((simulation, buildingid, variablename, variable_df))
+    
+    def reshape(item, emit):
+        simulation, buildingid, variablename, variable_df = item
+        try:
+            timeseriesdata_df = timeseriesdata_format_df(variable_df, buildingid, variablename, simulation_year, timeresolution)
+        except Exception:
+            finish_variables(simulation, failed=True)
+            raise
+        emit((simulation, buildingid, variablename, timeseriesdata_df))
+    
+    def upload(item, emit):
+        simulation, buildingid, variablename, timeseriesdata_df = item
+        print("Uploading Building: " + str(buildingid) + " Variable: " + variablename + '\n')
+        
+        update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Status', 'Upload Started')
+        start_time = time.time()
+        
+        try:
+            conn = psycopg2.connect(conn_information)
+            cur = conn.cursor()
+            try:
+                insert_df_rows(cur, 'timeseriesdata', timeseriesdata_df)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+                conn.close()
+            
+            invalidate_building(buildingid)
+            
+            update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Status', 'Upload Completed')
+            update_timeseriesdata_information_csv(buildingid, variablename, 'Upload Time', convert_seconds_to_hhmmss(time.time() - start_time))
+        except Exception:
+            finish_variables(simulation, failed=True)
+            raise
+        finish_variables(simulation)
+    
+    functions = {'simulate': simulate, 'parse': parse, 'reshape': reshape, 'upload': upload}
+    
+    # Queue in front of every stage, the first one holds all pending buildings. Rows sharing a results folder are 
+    # spread out (round-robin over folders), so that simulation workers rarely wait for each other's folder.
+    folder_rows = {}
+    for simulation in pending: folder_rows.setdefault(simulation[2], []).append(simulation)
+    rounds = max((len(rows) for rows in folder_rows.values()), default=0)
+    
+    queues = [queue.Queue()] + [queue.Queue(maxsize=queue_size) for _ in stage_names[1:]]
+    for k in range(rounds):
+        for rows in folder_rows.values():
+            if k < len(rows): queues[0].put(rows[k])
+    for _ in range(stage_workers['simulate']): queues[0].put(None)
+    
+    statistics = {'_next_workers': {name: stage_workers[next_name] for name, next_name in zip(stage_names, stage_names[1:])}}
+    errors = []
+    
+    start_time = time.time()
+    
+    threads = []
+    for k, name in enumerate(stage_names):
+        output_queue = queues[k + 1] if k + 1 < len(queues) else None
+        threads.extend(run_pipeline_stage(name, functions[name], queues[k], output_queue, stage_workers[name], statistics, errors))
+    
+    for thread in threads: thread.join()
+    
+    wall_seconds = time.time() - start_time
+    del statistics['_next_workers']
+    
+    # Utilization Report
+    print("Pipeline finished " + str(len(pending)) + " buildings in " + f"{wall_seconds:.1f}" + " s\n")
+    for name in stage_names:
+        stage = statistics[name]
+        stage['utilization'] = stage['busy_seconds'] / (stage['workers'] * wall_seconds) if wall_seconds > 0 else 0.0
+        print(f"{name:>9}: {stage['workers']} workers, {stage['items']} items, utilization {100 * stage['utilization']:.0f} %, blocked {stage['blocked_seconds']:.1f} s\n")
+    
+    statistics['wall_seconds'] = wall_seconds
+    statistics['errors'] = errors
+    
+    return statistics
+
 # =============================================================================
 # Input Dictionaries Used
 # =============================================================================
@@ -200,7 +722,13 @@ simulation_settings = {
     "sim_end_datetime": sim_end_datetime,    # Example end datetime
     "sim_timestep": 5,                           # Example timestep in minutes
     "sim_output_variable_reporting_frequency": 'timestep', # Example reporting frequency
-    "keepfile": "all"
+    "keepfile": "all",
+    "sim_sizing": 'default',     # 'skip' or 'reuse' (hard-size from cached design-day results) shortens short runs
+    "sim_warmup_days": None,     # e.g. (1, 6) minimum and maximum warmup days
+    "sim_shards": 1,             # > 1 splits long run periods into shards simulated in parallel
+    "sim_shard_warmup_days": 7,  # lead-in days of each shard, discarded when stitching
+    "sim_stream_upload": False,  # upload eplusout.eso rows while EnergyPlus is still running
+    "sim_backend": 'opyplus'     # 'api' captures variables in-process with pyenergyplus if available
 }
 
 # Filepaths dictionary
@@ -227,6 +755,9 @@ conn_information = "dbname=EP_DataManagement_Application user=kasey password=Off
 
 variable_list = ['Facility Total HVAC Electric Demand Power']
 
+# Create Tables if they do not already exist
+initialize_database_schema(conn_information)
+
 # Empty Time Series Data
 table_exists, table_empty = check_table_exists(conn_information, "public", "timeseriesdata")
 if not table_empty: empty_table(conn_information, "public", "timeseriesdata")
@@ -235,6 +766,12 @@ if not table_empty: empty_table(conn_information, "public", "timeseriesdata")
 table_exists, table_empty = check_table_exists(conn_information, "public", "buildingids")
 if not table_empty: empty_table(conn_information, "public", "buildingids")
 
+# Clean up simulations reset by Refresh_Simulation_Information
+remove_stale_buildings(conn_information)
+
+# Quarantine broken IDFs before scheduling
+validate_simulations(sim_information_filepath)
+
 automated_data_generation(conn_information, simulation_settings, filepaths, variable_list, sim_information_filepath)     
 
 # =============================================================================
@@ -4,63 +4,34 @@
 # =============================================================================
 
 import os
+import io
+import time
+import uuid
+import numpy as np
 import pandas as pd
 import pickle
 from re import S
 import psycopg2
 
 # =============================================================================
-# Retreive data for specified time range, building, and variable
+# Build TimeSeriesData Query
 # =============================================================================
 
-def retrieve_timeseriesdata(conn_information, buildingid=None, startdatetime=None, enddatetime=None, timeresolution=None, variable=None, subvariabletype=None, subvariable=None):
+def build_timeseriesdata_query(buildingid=None, startdatetime=None, enddatetime=None, timeresolution=None, variable=None, subvariabletype=None, subvariable=None):
     """
-    Retrieve time series data for a specified building, time range, and variable.
+    Build the filtered SELECT query on the timeseriesdata table shared by the retrieval functions.
 
     Parameters:
     -----------
-    conn_information : str
-        Database connection string containing the necessary information to connect to the database.
-    buildingid : int, optional
-        Identifier for the building from which data is to be retrieved.
-    startdatetime : datetime, optional
-        Start of the time range for which data is to be retrieved.
-    enddatetime : datetime, optional
-        End of the time range for which data is to be retrieved.
-    timeresolution : int, optional
-        The time resolution of the data in minutes.
-    variable : str, optional
-        The name of the variable for which data is to be retrieved.
-    subvariabletype : str, optional
-        The type of subvariable to filter the data by (e.g., 'schedulename', 'zonename', 'surfacename', 'systemnodename').
-    subvariable : str, optional
-        The name of the subvariable to filter the data by.
+    Same filters as retrieve_timeseriesdata.
 
     Returns:
     --------
-    pandas.DataFrame
-        A DataFrame with the relevant columns based on the query, including:
-        - 'timeseriesdataid': The unique identifier for each data point.
-        - 'datetime': The timestamp of each data point.
-        - 'value': The corresponding value for the specified variable at each timestamp.
-        - Additional columns depending on the parameters provided.
-
-    Example:
-    --------
-    df = retrieve_data(conn_info, buildingid=1, startdatetime='2024-01-01 00:00:00', enddatetime='2024-01-02 00:00:00', 
-                       timeresolution=5, variable='Facility Total HVAC Electric Demand Power')
-                       
-    Warning:
-    --------
-    Lack of filters could cause the query to return a large amount of data, which could cause performance issues. 
-    Need to figure out how much data retreival is too much at once - determined by RAM 
-    
+    tuple
+        (query, params, select_columns) where query is the SQL string, params the list of query 
+        parameters and select_columns the list of selected column names.
     """
 
-    # Connect to the database
-    conn = psycopg2.connect(conn_information)
-    cur = conn.cursor()
-
     # Initialize subvariable parameters with default values
     schedulename = 'NA'
     zonename = 'NA'
@@ -84,7 +55,7 @@ def retrieve_timeseriesdata(conn_information, buildingid=None, startdatetime=Non
         select_columns.append("buildingid")
     
     if variable is None:
-        select_columns.append("variable")
+        select_columns.append("variablename")
     
     if schedulename != 'NA':
         select_columns.append("schedulename")
@@ -126,7 +97,7 @@ def retrieve_timeseriesdata(conn_information, buildingid=None, startdatetime=Non
         params.append(timeresolution)
     
     if variable:
-        query += " AND variable = %s"
+        query += " AND variablename = %s"
         params.append(variable)
     
     if schedulename != 'NA':
@@ -145,27 +116,86 @@ def retrieve_timeseriesdata(conn_information, buildingid=None, startdatetime=Non
         query += " AND systemnodename = %s"
         params.append(systemnodename)
 
-    # Execute the query
-    cur.execute(query, params)
-    data = cur.fetchall()
+    return query, params, select_columns
 
-    # Close the connection
-    cur.close()
-    conn.close()
+# =============================================================================
+# Push Downsampling into the Query
+# =============================================================================
 
-    # Convert the data to a DataFrame with dynamic columns
-    df = pd.DataFrame(data, columns=select_columns)
+# SQL aggregate used for each supported aggregation
+RESAMPLE_AGGREGATIONS = {'mean': 'AVG', 'min': 'MIN', 'max': 'MAX', 'sum': 'SUM'}
 
-    # Return the DataFrame
-    return df
+# Resample periods handled by date_trunc, anything else is passed to date_bin as an interval
+DATE_TRUNC_PERIODS = ['minute', 'hour', 'day', 'week', 'month', 'year']
+
+# Columns telling apart the series of one building and variable
+SUBVARIABLE_COLUMNS = ['schedulename', 'zonename', 'surfacename', 'systemnodename']
+
+def apply_resample(query, params, select_columns, resample=None, aggregation='mean'):
+    """
+    Wrap a timeseriesdata query so the database groups the rows into time buckets and aggregates each bucket.
+
+    Only the reduced rows cross the wire. Buckets are labelled with their start time in the same 
+    'YYYY-MM-DD HH:MM:SS' text format as the stored datetimes.
+
+    EnergyPlus stamps each value at the end of its interval (the last step of a day is stamped 00:00 of the next 
+    day), so rows are bucketed on datetime minus their timeresolution (minutes), i.e. on the interval start. 
+    Subvariable columns that the query does not filter on are added to the grouping (and to the returned columns), 
+    so that e.g. the zones of a zone variable are aggregated separately rather than averaged together.
+
+    Parameters:
+    -----------
+    query, params, select_columns : 
+        As returned by build_timeseriesdata_query or build_timeseriesdata_batch_query.
+    resample : str, optional
+        'minute', 'hour', 'day', 'week', 'month' or 'year' (grouped with date_trunc), or any PostgreSQL interval 
+        such as '15 minutes' (grouped with date_bin, PostgreSQL 14+). If None the query is returned unchanged.
+    aggregation : str, optional
+        'mean', 'min', 'max' or 'sum'. Default is 'mean'.
+
+    Returns:
+    --------
+    tuple
+        (query, params, select_columns) of the aggregated query. timeseriesdataid is dropped from the columns and 
+        the missing subvariable columns are added before datetime.
+    """
+    
+    if resample is None:
+        return query, params, select_columns
+    
+    if aggregation not in RESAMPLE_AGGREGATIONS:
+        raise ValueError("aggregation must be one of " + str(list(RESAMPLE_AGGREGATIONS)) + ", got " + repr(aggregation))
+    
+    # Start of each row's interval, timeresolution is stored as text minutes
+    interval_start = "(datetime::timestamp - (CASE WHEN resample_timeresolution ~ '^[0-9]+$' THEN resample_timeresolution::integer ELSE 0 END) * interval '1 minute')"
+    
+    if resample in DATE_TRUNC_PERIODS:
+        bucket = f"date_trunc('{resample}', {interval_start})"
+        bucket_params = []
+    else:
+        bucket = f"date_bin(%s::interval, {interval_start}, TIMESTAMP '2000-01-01')"
+        bucket_params = [resample]
+    
+    # Select the interval length and the unfiltered subvariable columns in the inner query as well
+    missing_columns = [c for c in SUBVARIABLE_COLUMNS if c not in select_columns]
+    query = query.replace("SELECT ", "SELECT " + "".join(c + ", " for c in missing_columns) + "timeresolution AS resample_timeresolution, ", 1)
+    
+    group_columns = [c for c in select_columns if c not in ('timeseriesdataid', 'datetime', 'value')] + missing_columns
+    
+    resampled_columns = group_columns + [f"to_char({bucket}, 'YYYY-MM-DD HH24:MI:SS') AS datetime", f"{RESAMPLE_AGGREGATIONS[aggregation]}(value)::real AS value"]
+    group_positions = ", ".join(str(i + 1) for i in range(len(group_columns) + 1))
+    
+    resampled_query = f"SELECT {', '.join(resampled_columns)} FROM ({query}) AS filtered GROUP BY {group_positions} ORDER BY {group_positions}"
+    
+    return resampled_query, bucket_params + list(params), group_columns + ['datetime', 'value']
 
 # =============================================================================
-# Retreive eiotabledata for specified buildingid, tablename, zonename, variablename
+# Retreive data for specified time range, building, and variable
 # =============================================================================
 
-def retrieve_eiotabledata(conn_information, buildingid=None, tablename=None, zonename=None, variablename=None):
+def retrieve_timeseriesdata(conn_information, buildingid=None, startdatetime=None, enddatetime=None, timeresolution=None, variable=None, subvariabletype=None, subvariable=None, copy_format=None, resample=None, aggregation='mean'):
     """
-    Retrieve data from the eiotabledata table for a specified building, table, zone, and variable.
+    Retrieve time series data for a specified building, time range, and variable.
 
     Parameters:
     -----------
@@ -173,37 +203,93 @@ def retrieve_eiotabledata(conn_information, buildingid=None, tablename=None, zon
         Database connection string containing the necessary information to connect to the database.
     buildingid : int, optional
         Identifier for the building from which data is to be retrieved.
-    tablename : str, optional
-        The name of the table from which data is to be retrieved.
-    zonename : str, optional
-        The name of the zone from which data is to be retrieved.
-    variablename : str, optional
+    startdatetime : datetime, optional
+        Start of the time range for which data is to be retrieved.
+    enddatetime : datetime, optional
+        End of the time range for which data is to be retrieved.
+    timeresolution : int, optional
+        The time resolution of the data in minutes.
+    variable : str, optional
         The name of the variable for which data is to be retrieved.
+    subvariabletype : str, optional
+        The type of subvariable to filter the data by (e.g., 'schedulename', 'zonename', 'surfacename', 'systemnodename').
+    subvariable : str, optional
+        The name of the subvariable to filter the data by.
+    copy_format : str, optional
+        If 'csv', run the query through COPY (SELECT ...) TO STDOUT and parse the output directly into typed 
+        NumPy columns instead of building the DataFrame from fetchall() tuples. Default is None (fetchall path).
+    resample : str, optional
+        Downsample in the database to 'hour', 'day', ... or an interval such as '15 minutes' (see apply_resample). 
+        The result then has no 'timeseriesdataid' column. Default is None (no downsampling).
+    aggregation : str, optional
+        How each resample bucket is reduced: 'mean', 'min', 'max' or 'sum'. Default is 'mean'.
 
     Returns:
     --------
     pandas.DataFrame
         A DataFrame with the relevant columns based on the query, including:
-        - 'buildingid': The identifier for the building.
-        - 'tablename': The name of the table.
-        - 'zonename': The name of the zone.
-        - 'variablename': The name of the variable.
-        - 'stringvalue': The corresponding string value for the specified variable (if applicable).
-        - 'floatvalue': The corresponding float value for the specified variable (if applicable).
+        - 'timeseriesdataid': The unique identifier for each data point.
+        - 'datetime': The timestamp of each data point.
+        - 'value': The corresponding value for the specified variable at each timestamp.
+        - Additional columns depending on the parameters provided.
 
     Example:
     --------
-    df = retrieve_eiotabledata(conn_info, buildingid=1, tablename='ZoneInfo', zonename='Zone1', variablename='Area')
-
+    df = retrieve_data(conn_info, buildingid=1, startdatetime='2024-01-01 00:00:00', enddatetime='2024-01-02 00:00:00', 
+                       timeresolution=5, variable='Facility Total HVAC Electric Demand Power')
+                       
     Warning:
     --------
     Lack of filters could cause the query to return a large amount of data, which could cause performance issues. 
+    Need to figure out how much data retreival is too much at once - determined by RAM 
+    
     """
 
+    # Build the query
+    query, params, select_columns = build_timeseriesdata_query(buildingid, startdatetime, enddatetime, timeresolution, variable, subvariabletype, subvariable)
+    query, params, select_columns = apply_resample(query, params, select_columns, resample, aggregation)
+
+    # Fast path: COPY TO STDOUT straight into NumPy columns
+    if copy_format is not None:
+        return pd.DataFrame(copy_query_to_numpy(conn_information, query, params, select_columns, copy_format), columns=select_columns)
+
     # Connect to the database
     conn = psycopg2.connect(conn_information)
     cur = conn.cursor()
-    
+
+    # Execute the query
+    cur.execute(query, params)
+    data = cur.fetchall()
+
+    # Close the connection
+    cur.close()
+    conn.close()
+
+    # Convert the data to a DataFrame with dynamic columns
+    df = pd.DataFrame(data, columns=select_columns)
+
+    # Return the DataFrame
+    return df
+
+# =============================================================================
+# Build EioTableData Query
+# =============================================================================
+
+def build_eiotabledata_query(buildingid=None, tablename=None, zonename=None, variablename=None):
+    """
+    Build the filtered SELECT query on the eiotabledata table shared by the retrieval functions.
+
+    Parameters:
+    -----------
+    Same filters as retrieve_eiotabledata.
+
+    Returns:
+    --------
+    tuple
+        (query, params, select_columns) where query is the SQL string, params the list of query 
+        parameters and select_columns the list of selected column names.
+    """
+
     # Build the SELECT part of the query
     select_columns = []
 
@@ -246,6 +332,56 @@ def retrieve_eiotabledata(conn_information, buildingid=None, tablename=None, zon
         query += " AND variablename = %s"
         params.append(variablename)
 
+    return query, params, select_columns
+
+# =============================================================================
+# Retreive eiotabledata for specified buildingid, tablename, zonename, variablename
+# =============================================================================
+
+def retrieve_eiotabledata(conn_information, buildingid=None, tablename=None, zonename=None, variablename=None):
+    """
+    Retrieve data from the eiotabledata table for a specified building, table, zone, and variable.
+
+    Parameters:
+    -----------
+    conn_information : str
+        Database connection string containing the necessary information to connect to the database.
+    buildingid : int, optional
+        Identifier for the building from which data is to be retrieved.
+    tablename : str, optional
+        The name of the table from which data is to be retrieved.
+    zonename : str, optional
+        The name of the zone from which data is to be retrieved.
+    variablename : str, optional
+        The name of the variable for which data is to be retrieved.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        A DataFrame with the relevant columns based on the query, including:
+        - 'buildingid': The identifier for the building.
+        - 'tablename': The name of the table.
+        - 'zonename': The name of the zone.
+        - 'variablename': The name of the variable.
+        - 'stringvalue': The corresponding string value for the specified variable (if applicable).
+        - 'floatvalue': The corresponding float value for the specified variable (if applicable).
+
+    Example:
+    --------
+    df = retrieve_eiotabledata(conn_info, buildingid=1, tablename='ZoneInfo', zonename='Zone1', variablename='Area')
+
+    Warning:
+    --------
+    Lack of filters could cause the query to return a large amount of data, which could cause performance issues. 
+    """
+
+    # Build the query
+    query, params, select_columns = build_eiotabledata_query(buildingid, tablename, zonename, variablename)
+
+    # Connect to the database
+    conn = psycopg2.connect(conn_information)
+    cur = conn.cursor()
+
     # Execute the query
     cur.execute(query, params)
     data = cur.fetchall()
@@ -258,4 +394,624 @@ def retrieve_eiotabledata(conn_information, buildingid=None, tablename=None, zon
     df = pd.DataFrame(data, columns=select_columns)
 
     # Return the DataFrame
-    return df
\ No newline at end of file
+    return df
+
+# =============================================================================
+# NumPy Types of Numeric Columns
+# =============================================================================
+
+# Every column not listed here is TEXT and is returned as an object array
+NUMERIC_COLUMN_DTYPES = {'value': np.float32, 'floatvalue': np.float32, 'timeseriesdataid': np.int64, 'buildingid': np.int64}
+
+# =============================================================================
+# Convert Fetched Rows to NumPy Columns
+# =============================================================================
+
+def rows_to_numpy(rows, select_columns):
+    """
+    Convert a list of fetched row tuples into a dictionary of NumPy column arrays.
+
+    Parameters:
+    -----------
+    rows : list of tuple
+        Rows as returned by cursor.fetchmany() or cursor.fetchall().
+    select_columns : list of str
+        Column names in the order they appear in each row.
+
+    Returns:
+    --------
+    dict
+        Maps each column name to a NumPy array. 'value' and 'floatvalue' are float32, id columns are int64 
+        and all other columns are object arrays.
+    """
+    
+    columns = {}
+    transposed = list(zip(*rows)) if rows else [()] * len(select_columns)
+    
+    # NULL values become NaN in the float columns
+    for columnname, column in zip(select_columns, transposed):
+        columns[columnname] = np.array(column, dtype=NUMERIC_COLUMN_DTYPES.get(columnname, object))
+    
+    return columns
+
+# =============================================================================
+# Stream Query Results with a Server-Side Cursor
+# =============================================================================
+
+def stream_query(conn_information, query, params, select_columns, chunksize=100000, as_numpy=False, conn=None):
+    """
+    Run a query through a named (server-side) cursor and yield the results chunk by chunk.
+
+    Only one chunk is held in client memory at a time, so the full result set never has to fit in RAM.
+
+    Parameters:
+    -----------
+    conn_information : str
+        Database connection string containing the necessary information to connect to the database.
+    query : str
+        The SELECT query to run.
+    params : list
+        The query parameters.
+    select_columns : list of str
+        Names of the selected columns.
+    chunksize : int, optional
+        Number of rows per chunk. Default is 100000.
+    as_numpy : bool, optional
+        If True, yield dictionaries of NumPy arrays (see rows_to_numpy) instead of DataFrames.
+    conn : psycopg2 connection, optional
+        An already open connection to use, e.g. one taken from a connection pool. It is left open and 
+        returned to the caller in an idle state. Default is None (open and close a new connection).
+
+    Yields:
+    -------
+    pandas.DataFrame or dict
+        One chunk of at most chunksize rows.
+    """
+    
+    owns_connection = conn is None
+    if owns_connection: conn = psycopg2.connect(conn_information)
+    
+    # Named cursors live on the server, rows are transferred itersize at a time
+    cur = conn.cursor(name='stream_' + uuid.uuid4().hex)
+    cur.itersize = chunksize
+    
+    try:
+        cur.execute(query, params)
+        
+        while True:
+            rows = cur.fetchmany(chunksize)
+            if not rows:
+                break
+            
+            if as_numpy:
+                yield rows_to_numpy(rows, select_columns)
+            else:
+                yield pd.DataFrame(rows, columns=select_columns)
+    finally:
+        # Runs on exhaustion, on error and when the consumer closes the generator early
+        cur.close()
+        conn.rollback()
+        if owns_connection: conn.close()
+
+# =============================================================================
+# Stream timeseriesdata for specified time range, building, and variable
+# =============================================================================
+
+def stream_timeseriesdata(conn_information, buildingid=None, startdatetime=None, enddatetime=None, timeresolution=None, variable=None, subvariabletype=None, subvariable=None, chunksize=100000, as_numpy=False, resample=None, aggregation='mean'):
+    """
+    Streaming variant of retrieve_timeseriesdata that yields the result in chunks of constant size.
+
+    Parameters:
+    -----------
+    Same filters as retrieve_timeseriesdata, plus:
+    chunksize : int, optional
+        Number of rows per chunk. Default is 100000.
+    as_numpy : bool, optional
+        If True, yield dictionaries of NumPy arrays instead of DataFrames.
+    resample, aggregation : optional
+        Downsample in the database, see retrieve_timeseriesdata.
+
+    Yields:
+    -------
+    pandas.DataFrame or dict
+        Chunks with the same columns retrieve_timeseriesdata would return.
+
+    Example:
+    --------
+    for chunk in stream_timeseriesdata(conn_info, variable='Zone Air Temperature', chunksize=500000):
+        running_total += chunk['value'].sum()
+    """
+    
+    query, params, select_columns = build_timeseriesdata_query(buildingid, startdatetime, enddatetime, timeresolution, variable, subvariabletype, subvariable)
+    query, params, select_columns = apply_resample(query, params, select_columns, resample, aggregation)
+    
+    yield from stream_query(conn_information, query, params, select_columns, chunksize, as_numpy)
+
+# =============================================================================
+# Stream eiotabledata for specified buildingid, tablename, zonename, variablename
+# =============================================================================
+
+def stream_eiotabledata(conn_information, buildingid=None, tablename=None, zonename=None, variablename=None, chunksize=100000, as_numpy=False):
+    """
+    Streaming variant of retrieve_eiotabledata that yields the result in chunks of constant size.
+
+    Parameters:
+    -----------
+    Same filters as retrieve_eiotabledata, plus:
+    chunksize : int, optional
+        Number of rows per chunk. Default is 100000.
+    as_numpy : bool, optional
+        If True, yield dictionaries of NumPy arrays instead of DataFrames.
+
+    Yields:
+    -------
+    pandas.DataFrame or dict
+        Chunks with the same columns retrieve_eiotabledata would return.
+    """
+    
+    query, params, select_columns = build_eiotabledata_query(buildingid, tablename, zonename, variablename)
+    
+    yield from stream_query(conn_information, query, params, select_columns, chunksize, as_numpy)
+
+# =============================================================================
+# Run Query through COPY TO STDOUT into NumPy Columns
+# =============================================================================
+
+def copy_query_to_numpy(conn_information, query, params, select_columns, copy_format='csv'):
+    """
+    Run a SELECT query through COPY (SELECT ...) TO STDOUT and parse the result into typed NumPy columns.
+
+    Parameters:
+    -----------
+    conn_information : str
+        Database connection string containing the necessary information to connect to the database.
+    query : str
+        The SELECT query to run.
+    params : list
+        The query parameters. COPY does not accept bind parameters, so they are inlined with mogrify.
+    select_columns : list of str
+        Names of the selected columns.
+    copy_format : str, optional
+        'csv', parsed by the pandas C parser. Default is 'csv'.
+
+    Returns:
+    --------
+    dict
+        Maps each column name to a NumPy array, typed as in NUMERIC_COLUMN_DTYPES. As in the fetchall path, 
+        NULL is NaN in float columns and None in text columns; an id column containing NULL is float64 with NaN.
+    """
+    
+    if copy_format != 'csv':
+        raise ValueError("copy_format must be 'csv', got " + repr(copy_format))
+    
+    conn = psycopg2.connect(conn_information)
+    cur = conn.cursor()
+    
+    buffer = io.BytesIO()
+    
+    try:
+        inlined_query = cur.mogrify(query, params).decode('utf-8')
+        # NULL is written as an unquoted \N, told apart from empty strings (which COPY writes as "")
+        cur.copy_expert(f"COPY ({inlined_query}) TO STDOUT WITH (FORMAT csv, NULL '\\N')", buffer)
+    finally:
+        cur.close()
+        conn.close()
+    
+    buffer.seek(0)
+    
+    return parse_copy_csv(buffer, select_columns)
+    
+def parse_copy_csv(buffer, select_columns):
+    """
+    Parse the output of COPY ... TO STDOUT WITH (FORMAT csv, NULL '\\N') into typed NumPy columns, see copy_query_to_numpy.
+
+    Quoted fields (commas, quotes and newlines in text) are unquoted and an empty string ("") stays an empty string.
+    A text value that is literally \\N cannot be told apart from NULL and is read as None.
+
+    Parameters:
+    -----------
+    buffer : file-like
+        The COPY output, positioned at its start.
+    select_columns : list of str
+        Names of the selected columns.
+
+    Returns:
+    --------
+    dict
+        Maps each column name to a NumPy array, as returned by copy_query_to_numpy.
+    """
+    
+    # Text columns keep the literal 'NA' used by the uploaders, integer columns are read as nullable Int64
+    dtypes = {columnname: 'Int64' if NUMERIC_COLUMN_DTYPES.get(columnname) == np.int64 else NUMERIC_COLUMN_DTYPES.get(columnname, object) for columnname in select_columns}
+    na_values = {columnname: ['\\N'] for columnname in select_columns}
+    
+    df = pd.read_csv(buffer, header=None, names=select_columns, dtype=dtypes, keep_default_na=False, na_values=na_values)
+    
+    columns = {}
+    for columnname in select_columns:
+        column = df[columnname]
+        null = column.isna().to_numpy()
+        if dtypes[columnname] == 'Int64':
+            columns[columnname] = column.to_numpy(dtype=np.float64, na_value=np.nan) if null.any() else column.to_numpy(dtype=np.int64)
+        elif dtypes[columnname] is object:
+            columns[columnname] = column.to_numpy(dtype=object)
+            columns[columnname][null] = None
+        else:
+            columns[columnname] = column.to_numpy()
+    
+    return columns
+    
+# =============================================================================
+# Test COPY CSV Parsing against the Fetchall Path
+# =============================================================================
+
+def test_parse_copy_csv():
+    """
+    Checks without a database that parse_copy_csv reads NULL (\\N) and quoted fields the same way as rows_to_numpy
+    reads the rows psycopg2 fetches for the same result. Raises AssertionError on a difference.
+    """
+    
+    select_columns = ['timeseriesdataid', 'buildingid', 'datetime', 'variablename', 'zonename', 'value']
+    
+    # The same result as fetched by psycopg2 and as written by COPY (FORMAT csv, NULL '\N')
+    rows = [
+        (1, 7, '2013-01-01 00:05:00', 'Zone Air Temperature', 'ZONE, "A"', 21.5),
+        (2, 7, '2013-01-01 00:10:00', 'Zone Air Temperature', None, None),
+        (3, 7, '2013-01-01 00:15:00', 'Zone\nAir Temperature', '', 0.001),
+        (4, 7, '2013-01-01 00:20:00', 'NA', 'NA', -1.25)]
+    copy_output = (b'1,7,2013-01-01 00:05:00,Zone Air Temperature,"ZONE, ""A""",21.5\n'
+                   b'2,7,2013-01-01 00:10:00,Zone Air Temperature,\\N,\\N\n'
+                   b'3,7,2013-01-01 00:15:00,"Zone\nAir Temperature","",0.001\n'
+                   b'4,7,2013-01-01 00:20:00,NA,NA,-1.25\n')
+    
+    expected = rows_to_numpy(rows, select_columns)
+    columns = parse_copy_csv(io.BytesIO(copy_output), select_columns)
+    
+    for columnname in select_columns:
+        assert columns[columnname].dtype == expected[columnname].dtype, columnname + ': ' + str(columns[columnname].dtype) + ' != ' + str(expected[columnname].dtype)
+        if columnname in NUMERIC_COLUMN_DTYPES:
+            assert np.allclose(columns[columnname].astype(np.float64), expected[columnname].astype(np.float64), equal_nan=True), columnname
+        else:
+            assert list(columns[columnname]) == list(expected[columnname]), columnname + ': ' + repr(list(columns[columnname]))
+    
+    # An id column with NULL, which rows_to_numpy cannot convert, is float64 with NaN
+    columns = parse_copy_csv(io.BytesIO(b'1,\\N\n2,7\n'), ['timeseriesdataid', 'buildingid'])
+    assert columns['timeseriesdataid'].dtype == np.int64 and columns['buildingid'].dtype == np.float64
+    assert np.isnan(columns['buildingid'][0]) and columns['buildingid'][1] == 7
+    
+    print("parse_copy_csv matches the fetchall path\n")
+    
+# =============================================================================
+# Benchmark Retrieval Paths
+# =============================================================================
+
+def benchmark_retrieval(conn_information, repeats=3, **filters):
+    """
+    Compare the throughput and results of the fetchall and COPY retrieval paths of retrieve_timeseriesdata.
+
+    Parameters:
+    -----------
+    conn_information : str
+        Database connection string containing the necessary information to connect to the database.
+    repeats : int, optional
+        Number of timed runs per path, the best run is reported. Default is 3.
+    **filters
+        Filters passed through to retrieve_timeseriesdata (buildingid, variable, ...).
+
+    Returns:
+    --------
+    dict
+        For each path ('fetchall', 'csv'): best time in seconds, rows per second and whether 
+        the result matches the fetchall path.
+
+    Example:
+    --------
+    benchmark_retrieval(conn_info, buildingid=1, variable='Zone Air Temperature')
+    """
+    
+    test_parse_copy_csv()
+    
+    results = {}
+    reference_df = None
+    
+    for copy_format in [None, 'csv']:
+        
+        pathname = copy_format or 'fetchall'
+        best_time = None
+        
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            df = retrieve_timeseriesdata(conn_information, copy_format=copy_format, **filters)
+            elapsed_time = time.perf_counter() - start_time
+            if best_time is None or elapsed_time < best_time: best_time = elapsed_time
+        
+        # Rows come back in no particular order
+        df = df.sort_values('timeseriesdataid', ignore_index=True)
+        
+        if reference_df is None:
+            reference_df = df
+        
+        # The fetchall path returns Python floats, compare at REAL precision
+        matches = len(df) == len(reference_df) and all(
+            np.allclose(df[c].to_numpy(dtype=np.float64), reference_df[c].to_numpy(dtype=np.float64), equal_nan=True) if c in NUMERIC_COLUMN_DTYPES 
+            else (df[c].to_numpy() == reference_df[c].to_numpy()).all() 
+            for c in reference_df.columns)
+        
+        results[pathname] = {'seconds': best_time, 'rows_per_second': len(df) / best_time if best_time else float('inf'), 'matches_fetchall': bool(matches)}
+        print(pathname + ": " + str(len(df)) + " rows in " + f"{best_time:.3f}" + " s\n")
+    
+    return results
+    
+# =============================================================================
+# Build Batch TimeSeriesData Query
+# =============================================================================
+
+def build_timeseriesdata_batch_query(buildingids=None, variables=None, subvariabletype=None, subvariables=None, startdatetime=None, enddatetime=None, timeresolution=None):
+    """
+    Build a set-based SELECT query on the timeseriesdata table that filters on lists of values with = ANY(%s).
+
+    Parameters:
+    -----------
+    buildingids : list of int, optional
+        Buildings to include. None includes all buildings, an empty list none.
+    variables : list of str, optional
+        Variable names to include.
+    subvariabletype : str, optional
+        Subvariable column to select ('schedulename', 'zonename', 'surfacename', 'systemnodename').
+    subvariables : list of str, optional
+        Subvariable names to include. Requires subvariabletype.
+    startdatetime, enddatetime, timeresolution : optional
+        Same as retrieve_timeseriesdata.
+
+    Returns:
+    --------
+    tuple
+        (query, params, select_columns). The selected columns are always buildingid, variablename, the 
+        subvariable column (if given), datetime and value.
+    """
+    
+    if subvariabletype not in (None, 'schedulename', 'zonename', 'surfacename', 'systemnodename'):
+        raise ValueError("Unknown subvariabletype: " + str(subvariabletype))
+    
+    select_columns = ["buildingid", "variablename"]
+    if subvariabletype is not None:
+        select_columns.append(subvariabletype)
+    select_columns.append("datetime")
+    select_columns.append("value")
+    
+    query = f"SELECT {', '.join(select_columns)} FROM timeseriesdata WHERE 1=1"
+    params = []
+    
+    # An empty list selects no building (rather than all of them)
+    if buildingids is not None:
+        query += " AND buildingid = ANY(%s::integer[])"
+        params.append([int(b) for b in buildingids])
+    
+    if variables:
+        query += " AND variablename = ANY(%s)"
+        params.append(list(variables))
+    
+    if subvariables:
+        query += f" AND {subvariabletype} = ANY(%s)"
+        params.append(list(subvariables))
+    
+    if startdatetime:
+        query += " AND datetime >= %s"
+        params.append(str(startdatetime))
+    
+    if enddatetime:
+        query += " AND datetime <= %s"
+        params.append(str(enddatetime))
+    
+    if timeresolution:
+        query += " AND timeresolution = %s"
+        params.append(str(timeresolution))
+    
+    return query, params, select_columns
+
+# =============================================================================
+# Pivot Long Columns into a Wide Matrix
+# =============================================================================
+
+def pivot_to_matrix(columns, key_columns):
+    """
+    Pivot long-format columns into a time-aligned (datetime x series) matrix.
+
+    Each distinct combination of key_columns becomes one series (matrix column). Values are scattered into a 
+    preallocated float32 array in one fancy-indexing assignment, missing timesteps are NaN.
+
+    Parameters:
+    -----------
+    columns : dict
+        Column name to NumPy array, must contain 'datetime', 'value' and every entry of key_columns.
+    key_columns : list of str
+        Columns identifying a series, e.g. ['buildingid', 'variablename', 'zonename'].
+
+    Returns:
+    --------
+    tuple
+        (matrix, datetime_index, series_keys) where matrix has shape (len(datetime_index), len(series_keys)), 
+        datetime_index is a datetime64 array and series_keys is a list of tuples of key values.
+    """
+    
+    # ISO formatted text timestamps sort chronologically
+    datetime_labels, time_codes = np.unique(columns['datetime'].astype(str), return_inverse=True)
+    
+    # Combine the integer code of each key column into one series code. None/NaN keys get a code of their own 
+    # instead of -1, which would index the last series.
+    series_codes = np.zeros(len(columns['value']), dtype=np.int64)
+    key_uniques = []
+    for columnname in key_columns:
+        codes, uniques = pd.factorize(columns[columnname], use_na_sentinel=False)
+        series_codes = series_codes * len(uniques) + codes
+        key_uniques.append(uniques)
+    
+    series_labels, series_codes = np.unique(series_codes, return_inverse=True)
+    
+    # Decode each series code back into its key tuple
+    series_keys = []
+    for label in series_labels:
+        key = []
+        for uniques in reversed(key_uniques):
+            label, code = divmod(label, len(uniques))
+            key.append(uniques[code])
+        series_keys.append(tuple(reversed(key)))
+    
+    matrix = np.full((len(datetime_labels), len(series_labels)), np.nan, dtype=np.float32)
+    matrix[time_codes, series_codes] = columns['value']
+    
+    datetime_index = pd.to_datetime(datetime_labels).to_numpy()
+    
+    return matrix, datetime_index, series_keys
+
+# =============================================================================
+# Retrieve Wide Time Series Matrix
+# =============================================================================
+
+def retrieve_timeseriesdata_matrix(conn_information, buildingids=None, variables=None, subvariabletype='zonename', subvariables=None, startdatetime=None, enddatetime=None, timeresolution=None, as_dataframe=False, copy_format='csv', resample=None, aggregation='mean'):
+    """
+    Retrieve time series data as a wide, time-aligned matrix with one column per building, variable and subvariable.
+
+    Spans several buildings and variables in a single query and pivots in a preallocated array, so callers do 
+    not need to pivot the long output of retrieve_timeseriesdata themselves.
+
+    Parameters:
+    -----------
+    conn_information : str
+        Database connection string containing the necessary information to connect to the database.
+    buildingids : int or list of int, optional
+        Buildings to include.
+    variables : str or list of str, optional
+        Variable names to include.
+    subvariabletype : str, optional
+        The subvariable column that spans the matrix columns ('zonename', 'surfacename', 'systemnodename', 
+        'schedulename'). Default is 'zonename'.
+    subvariables : list of str, optional
+        Restrict the matrix to these subvariables.
+    startdatetime, enddatetime, timeresolution : optional
+        Same as retrieve_timeseriesdata.
+    as_dataframe : bool, optional
+        If True, return a DataFrame indexed by datetime with (buildingid, variablename, subvariable) 
+        MultiIndex columns. Default is False.
+    copy_format : str, optional
+        Transfer format passed to copy_query_to_numpy. Default is 'csv'.
+    resample, aggregation : optional
+        Downsample in the database, see retrieve_timeseriesdata.
+
+    Returns:
+    --------
+    tuple or pandas.DataFrame
+        (matrix, datetime_index, series_keys) as returned by pivot_to_matrix, or a DataFrame if as_dataframe is True.
+
+    Example:
+    --------
+    matrix, datetimes, keys = retrieve_timeseriesdata_matrix(conn_info, buildingids=[1, 2], variables=['Zone Air Temperature'])
+    """
+    
+    if isinstance(buildingids, int): buildingids = [buildingids]
+    if isinstance(variables, str): variables = [variables]
+    
+    query, params, select_columns = build_timeseriesdata_batch_query(buildingids, variables, subvariabletype, subvariables, startdatetime, enddatetime, timeresolution)
+    query, params, select_columns = apply_resample(query, params, select_columns, resample, aggregation)
+    
+    columns = copy_query_to_numpy(conn_information, query, params, select_columns, copy_format)
+    
+    key_columns = [c for c in select_columns if c not in ('datetime', 'value')]
+    matrix, datetime_index, series_keys = pivot_to_matrix(columns, key_columns)
+    
+    if as_dataframe:
+        return pd.DataFrame(matrix, index=pd.DatetimeIndex(datetime_index, name='datetime'), columns=pd.MultiIndex.from_tuples(series_keys, names=key_columns))
+    
+    return matrix, datetime_index, series_keys
+
+# =============================================================================
+# Retrieve Time Series Data for Many Buildings at Once
+# =============================================================================
+
+def retrieve_timeseriesdata_batch(conn_information, buildingids, variables=None, subvariabletype=None, subvariables=None, startdatetime=None, enddatetime=None, timeresolution=None, output='slices', copy_format='csv', resample=None, aggregation='mean'):
+    """
+    Retrieve time series data for lists of buildings, variables and subvariables with one set-based query.
+
+    Replaces one retrieve_timeseriesdata call (and connection) per building with a single = ANY(%s) query.
+
+    Parameters:
+    -----------
+    conn_information : str
+        Database connection string containing the necessary information to connect to the database.
+    buildingids : list of int
+        Buildings to retrieve.
+    variables : list of str, optional
+        Variable names to include.
+    subvariabletype : str, optional
+        Subvariable column to return ('schedulename', 'zonename', 'surfacename', 'systemnodename').
+    subvariables : list of str, optional
+        Subvariable names to include. Requires subvariabletype.
+    startdatetime, enddatetime, timeresolution, resample, aggregation : optional
+        Same as retrieve_timeseriesdata.
+    output : str, optional
+        'slices' returns a dictionary {buildingid: DataFrame}. 'array' returns a 3-D buildings x time x series 
+        array. Default is 'slices'.
+    copy_format : str, optional
+        Transfer format passed to copy_query_to_numpy. Default is 'csv'.
+
+    Returns:
+    --------
+    dict or tuple
+        For 'slices', a dictionary mapping each building id to a DataFrame with columns variablename, 
+        the subvariable column (if given), datetime and value. Buildings without data map to empty DataFrames.
+        For 'array', (array, buildingids, datetime_index, series_keys) where array has shape 
+        (len(buildingids), len(datetime_index), len(series_keys)), series_keys are (variablename, subvariable) 
+        tuples and missing values are NaN.
+
+    Example:
+    --------
+    slices = retrieve_timeseriesdata_batch(conn_info, buildingids=list(range(1, 1501)), variables=['Facility Total HVAC Electric Demand Power'])
+    """
+    
+    if output not in ('slices', 'array'):
+        raise ValueError("output must be 'slices' or 'array', got " + repr(output))
+    
+    # Drop duplicates, keep the requested order
+    buildingids = list(dict.fromkeys(int(b) for b in buildingids))
+    
+    query, params, select_columns = build_timeseriesdata_batch_query(buildingids, variables, subvariabletype, subvariables, startdatetime, enddatetime, timeresolution)
+    query, params, select_columns = apply_resample(query, params, select_columns, resample, aggregation)
+    
+    columns = copy_query_to_numpy(conn_information, query, params, select_columns, copy_format)
+    
+    building_column = columns['buildingid'].astype(np.int64)
+    slice_columns = [c for c in select_columns if c != 'buildingid']
+    
+    if output == 'slices':
+        
+        # One stable sort, then split at the building boundaries
+        order = np.argsort(building_column, kind='stable')
+        sorted_buildings = building_column[order]
+        starts = np.searchsorted(sorted_buildings, buildingids, side='left')
+        ends = np.searchsorted(sorted_buildings, buildingids, side='right')
+        
+        slices = {}
+        for buildingid, start, end in zip(buildingids, starts, ends):
+            rows = order[start:end]
+            slices[buildingid] = pd.DataFrame({c: columns[c][rows] for c in slice_columns}, columns=slice_columns)
+        
+        return slices
+    
+    # Building axis in the order requested
+    building_codes = np.searchsorted(np.sort(buildingids), building_column)
+    building_codes = np.argsort(buildingids)[building_codes]
+    
+    series_key_columns = [c for c in slice_columns if c not in ('datetime', 'value')]
+    
+    # Time and series codes are shared across buildings
+    datetime_labels, time_codes = np.unique(columns['datetime'].astype(str), return_inverse=True)
+    series_index = pd.MultiIndex.from_arrays([columns[c] for c in series_key_columns])
+    series_keys = series_index.unique()
+    series_codes = series_keys.get_indexer(series_index)
+    
+    array = np.full((len(buildingids), len(datetime_labels), len(series_keys)), np.nan, dtype=np.float32)
+    array[building_codes, time_codes, series_codes] = columns['value']
+    
+    datetime_index = pd.to_datetime(datetime_labels).to_numpy()
+    
+    return array, buildingids, datetime_index, list(series_keys)
@@ -0,0 +1,419 @@
+# =============================================================================
+# Import Required Modules
+# =============================================================================
+
+import json
+import time
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Custom Modules
+from Database_Creator import initialize_database_schema
+from EP_DataRetrieval import build_timeseriesdata_batch_query, stream_query
+
+# =============================================================================
+# Statistics Settings
+# =============================================================================
+
+# Relative accuracy of the quantile sketch, every reported quantile is within 1 % of a true value
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+
+# Values with a smaller magnitude are counted as zero by the sketch
+SKETCH_MIN_MAGNITUDE = 1e-9
+
+# Quantiles stored in the variablestatistics table
+STATISTICS_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+# =============================================================================
+# Mergeable Quantile Sketch
+# =============================================================================
+
+def new_sketch():
+    """
+    Returns an empty quantile sketch.
+
+    The sketch is a histogram over logarithmically spaced buckets: value x > 0 falls in bucket ceil(log_gamma(x)),
+    negative values are bucketed by magnitude and near-zero values are counted separately. Bucket counts simply
+    add up, so sketches of chunks, buildings or whole previous runs merge exactly.
+    """
+
+    return {'positive': {}, 'negative': {}, 'zero': 0}
+
+def sketch_bucket_indices(magnitudes):
+    """
+    Returns the bucket index of every magnitude (all >= SKETCH_MIN_MAGNITUDE).
+    """
+
+    return np.ceil(np.log(magnitudes) / np.log(SKETCH_GAMMA)).astype(np.int64)
+
+def sketch_add_counts(buckets, indices, counts):
+    """
+    Adds bucket counts in place.
+    """
+
+    for index, count in zip(indices.tolist(), counts.tolist()):
+        buckets[index] = buckets.get(index, 0) + count
+
+def sketch_add(sketch, values):
+    """
+    Adds a chunk of values (NaN already removed) to a sketch in place, with one np.unique per sign.
+    """
+
+    magnitudes = np.abs(values)
+    nonzero = magnitudes >= SKETCH_MIN_MAGNITUDE
+    sketch['zero'] += int(np.count_nonzero(~nonzero))
+
+    for name, mask in (('positive', nonzero & (values > 0)), ('negative', nonzero & (values < 0))):
+        if mask.any():
+            indices, counts = np.unique(sketch_bucket_indices(magnitudes[mask].astype(np.float64)), return_counts=True)
+            sketch_add_counts(sketch[name], indices, counts)
+
+def sketch_merge(sketch, other):
+    """
+    Merges sketch `other` into `sketch` in place.
+    """
+
+    sketch['zero'] += other['zero']
+    for name in ('positive', 'negative'):
+        for index, count in other[name].items():
+            sketch[name][int(index)] = sketch[name].get(int(index), 0) + count
+
+def sketch_quantiles(sketch, quantiles):
+    """
+    Estimates quantiles from a sketch.
+
+    Args:
+        sketch (dict): See new_sketch.
+        quantiles (list of float): Quantiles between 0 and 1.
+
+    Returns:
+        list of float: One estimate per quantile, NaN if the sketch is empty.
+    """
+
+    negative = sorted(sketch['negative'].items(), reverse=True)
+    positive = sorted(sketch['positive'].items())
+
+    # Bucket representatives in ascending value order
+    gamma = SKETCH_GAMMA
+    values = np.array([-2 * gamma ** int(i) / (gamma + 1) for i, _ in negative] + [0.0] + [2 * gamma ** int(i) / (gamma + 1) for i, _ in positive])
+    counts = np.array([c for _, c in negative] + [sketch['zero']] + [c for _, c in positive], dtype=np.float64)
+
+    total = counts.sum()
+    if total == 0:
+        return [float('nan')] * len(quantiles)
+
+    cumulative = np.cumsum(counts)
+    positions = np.searchsorted(cumulative, np.asarray(quantiles) * (total - 1), side='right')
+
+    return values[np.minimum(positions, len(values) - 1)].tolist()
+
+def sketch_to_json(sketch):
+    """
+    Serializes a sketch for the variablestatistics table.
+    """
+
+    return json.dumps(sketch)
+
+def sketch_from_json(text):
+    """
+    Reverses sketch_to_json, JSON object keys come back as strings and are restored to integers.
+    """
+
+    sketch = json.loads(text)
+    for name in ('positive', 'negative'):
+        sketch[name] = {int(index): count for index, count in sketch[name].items()}
+
+    return sketch
+
+# =============================================================================
+# Streaming Moments (Welford)
+# =============================================================================
+
+def new_statistics_state():
+    """
+    Returns an empty running statistics state: count, mean, sum of squared deviations (m2), min, max,
+    the set of contributing buildings and a quantile sketch.
+    """
+
+    return {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': float('inf'), 'max': float('-inf'), 'buildings': set(), 'sketch': new_sketch()}
+
+def merge_moments(state, count, mean, m2, minimum, maximum):
+    """
+    Merges the moments of another set of values into a state in place, with the parallel form of Welford's update
+    (Chan et al.), which is exact and numerically stable in any merge order.
+    """
+
+    if count == 0:
+        return
+
+    total = state['count'] + count
+    delta = mean - state['mean']
+
+    state['mean'] += delta * count / total
+    state['m2'] += m2 + delta * delta * state['count'] * count / total
+    state['count'] = total
+    state['min'] = min(state['min'], minimum)
+    state['max'] = max(state['max'], maximum)
+
+def update_statistics(state, values):
+    """
+    Adds one chunk of values to a state in place. The chunk moments are computed vectorized and merged with
+    merge_moments, NaN values are ignored.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return
+
+    mean = values.mean()
+    merge_moments(state, len(values), mean, float(np.square(values - mean).sum()), float(values.min()), float(values.max()))
+    sketch_add(state['sketch'], values)
+
+def merge_statistics(state, other):
+    """
+    Merges state `other` into `state` in place.
+    """
+
+    merge_moments(state, other['count'], other['mean'], other['m2'], other['min'], other['max'])
+    state['buildings'] |= other['buildings']
+    sketch_merge(state['sketch'], other['sketch'])
+
+def finalize_statistics(state):
+    """
+    Converts a state into the reported statistics.
+
+    Returns:
+        dict: 'buildingcount', 'valuecount', 'mean', 'std' (population), 'min', 'max' and 'quantiles'
+              ({quantile: value} for STATISTICS_QUANTILES).
+    """
+
+    count = state['count']
+
+    return {'buildingcount': len(state['buildings']),
+            'valuecount': count,
+            'mean': state['mean'] if count else float('nan'),
+            'std': float(np.sqrt(state['m2'] / count)) if count else float('nan'),
+            'min': state['min'] if count else float('nan'),
+            'max': state['max'] if count else float('nan'),
+            'quantiles': dict(zip(STATISTICS_QUANTILES, sketch_quantiles(state['sketch'], STATISTICS_QUANTILES)))}
+
+# =============================================================================
+# Compute Statistics of One Building
+# =============================================================================
+
+def compute_building_statistics(conn_information, buildingid, variables=None, timeresolution=None, chunksize=500000):
+    """
+    Computes the running statistics of every variable of one building client-side, streaming the values
+    chunk by chunk through a server-side cursor. Memory is bounded by chunksize.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        buildingid (int): The building.
+        variables (list of str, optional): Variable names to include. Default is all.
+        timeresolution (str, optional): Only include this time resolution.
+        chunksize (int): Rows per chunk. Default is 500000.
+
+    Returns:
+        dict: {variablename: state} (see new_statistics_state).
+    """
+
+    query, params, select_columns = build_timeseriesdata_batch_query([buildingid], variables, timeresolution=timeresolution)
+    states = {}
+
+    for chunk in stream_query(conn_information, query, params, select_columns, chunksize, as_numpy=True):
+
+        # Group the chunk by variable with one sort
+        names, codes = np.unique(chunk['variablename'].astype(str), return_inverse=True)
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        values = chunk['value'][order]
+
+        for k, variablename in enumerate(names):
+            state = states.setdefault(variablename, new_statistics_state())
+            update_statistics(state, values[boundaries[k]:boundaries[k + 1]])
+
+    for state in states.values():
+        if state['count']: state['buildings'].add(int(buildingid))
+
+    return states
+
+def compute_building_statistics_in_database(conn_information, buildingid, variables=None, timeresolution=None):
+    """
+    Server-side variant of compute_building_statistics. The database computes the moments and the sketch bucket
+    counts with two GROUP BY queries, so only a few rows per variable are transferred.
+
+    Args and Returns: See compute_building_statistics.
+    """
+
+    where = " WHERE buildingid = %s AND value IS NOT NULL AND value <> 'NaN'"
+    params = [int(buildingid)]
+
+    if variables:
+        where += " AND variablename = ANY(%s)"
+        params.append(list(variables))
+
+    if timeresolution:
+        where += " AND timeresolution = %s"
+        params.append(str(timeresolution))
+
+    moments_query = "SELECT variablename, COUNT(value), AVG(value), VAR_POP(value), MIN(value), MAX(value) FROM timeseriesdata" + where + " GROUP BY variablename"
+
+    # Same bucketing as sketch_add
+    buckets_query = ("SELECT variablename, sign, bucket, COUNT(*) FROM ("
+                     "SELECT variablename, "
+                     "CASE WHEN ABS(value) < %s THEN 0 ELSE SIGN(value)::INTEGER END AS sign, "
+                     "CASE WHEN ABS(value) < %s THEN 0 ELSE CEIL(LN(ABS(value)) / LN(%s))::INTEGER END AS bucket "
+                     "FROM timeseriesdata" + where + ") AS buckets GROUP BY variablename, sign, bucket")
+    buckets_params = [SKETCH_MIN_MAGNITUDE, SKETCH_MIN_MAGNITUDE, SKETCH_GAMMA] + params
+
+    states = {}
+
+    conn = psycopg2.connect(conn_information)
+    cur = conn.cursor()
+
+    try:
+        cur.execute(moments_query, params)
+        for variablename, count, mean, variance, minimum, maximum in cur.fetchall():
+            state = states.setdefault(variablename, new_statistics_state())
+            merge_moments(state, int(count), float(mean), float(variance) * int(count), float(minimum), float(maximum))
+            state['buildings'].add(int(buildingid))
+
+        cur.execute(buckets_query, buckets_params)
+        for variablename, sign, bucket, count in cur.fetchall():
+            sketch = states.setdefault(variablename, new_statistics_state())['sketch']
+            if sign == 0:
+                sketch['zero'] += int(count)
+            else:
+                sketch_add_counts(sketch['positive' if sign > 0 else 'negative'], np.array([bucket]), np.array([int(count)]))
+    finally:
+        cur.close()
+        conn.close()
+
+    return states
+
+def building_statistics_task(conn_information, buildingid, variables, timeresolution, server_side):
+    """
+    Process pool task computing the statistics of one building, see compute_catalog_statistics.
+    """
+
+    if server_side:
+        return compute_building_statistics_in_database(conn_information, buildingid, variables, timeresolution)
+
+    return compute_building_statistics(conn_information, buildingid, variables, timeresolution)
+
+# =============================================================================
+# Compute and Store Statistics over the Catalog
+# =============================================================================
+
+def compute_catalog_statistics(conn_information, buildingids=None, variables=None, timeresolution=None, server_side=True, max_workers=None, upload=True):
+    """
+    Computes mean, std, min, max and quantiles of every variable across all buildings in one pass over the data.
+
+    Buildings are processed in parallel (one process pool task each), either server-side with
+    compute_building_statistics_in_database or client-side with compute_building_statistics, and their states
+    are merged as they complete. No building's data is ever held in memory as a whole.
+
+    On Windows the calling script must guard this call with `if __name__ == '__main__':`.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        buildingids (list of int, optional): Buildings to include. Default is every building in buildingids.
+        variables (list of str, optional): Variable names to include. Default is all.
+        timeresolution (str, optional): Only include this time resolution. Default is all.
+        server_side (bool): Compute moments and sketches in the database. Default is True.
+        max_workers (int, optional): Number of worker processes. Default is the number of CPUs.
+        upload (bool): Store the results in the variablestatistics table. Default is True.
+
+    Returns:
+        dict: {variablename: statistics} (see finalize_statistics).
+    """
+
+    initialize_database_schema(conn_information)
+
+    if buildingids is None:
+        with psycopg2.connect(conn_information) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT buildingid FROM buildingids ORDER BY buildingid")
+                buildingids = [row[0] for row in cur.fetchall()]
+        conn.close()
+
+    states = {}
+    start_time = time.time()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+
+        futures = [executor.submit(building_statistics_task, conn_information, buildingid, variables, timeresolution, server_side) for buildingid in buildingids]
+
+        for future in as_completed(futures):
+            for variablename, state in future.result().items():
+                if variablename in states:
+                    merge_statistics(states[variablename], state)
+                else:
+                    states[variablename] = state
+
+    print("Computed statistics of " + str(len(states)) + " variables over " + str(len(buildingids)) + " buildings in " + f"{time.time() - start_time:.1f}" + " s\n")
+
+    if upload:
+        upload_statistics(conn_information, states, timeresolution)
+
+    return {variablename: finalize_statistics(state) for variablename, state in states.items()}
+
+def upload_statistics(conn_information, states, timeresolution=None):
+    """
+    Stores finalized statistics and sketches in the variablestatistics table, replacing existing rows of the
+    same variable and time resolution ('NA' when all resolutions were included).
+    """
+
+    initialize_database_schema(conn_information)
+
+    rows = []
+    for variablename, state in states.items():
+        statistics = finalize_statistics(state)
+        rows.append((variablename, timeresolution or 'NA', statistics['buildingcount'], statistics['valuecount'],
+                     statistics['mean'], statistics['std'], statistics['min'], statistics['max'],
+                     json.dumps({str(q): v for q, v in statistics['quantiles'].items()}), sketch_to_json(state['sketch'])))
+
+    with psycopg2.connect(conn_information) as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO variablestatistics (variablename, timeresolution, buildingcount, valuecount, mean, std, minvalue, maxvalue, quantiles, sketch) VALUES %s
+                ON CONFLICT (variablename, timeresolution) DO UPDATE SET
+                    buildingcount = EXCLUDED.buildingcount, valuecount = EXCLUDED.valuecount, mean = EXCLUDED.mean, std = EXCLUDED.std,
+                    minvalue = EXCLUDED.minvalue, maxvalue = EXCLUDED.maxvalue, quantiles = EXCLUDED.quantiles, sketch = EXCLUDED.sketch, updatedon = now()
+                """, rows)
+
+    conn.close()
+
+def load_statistics(conn_information, variables=None, timeresolution=None):
+    """
+    Reads stored statistics from the variablestatistics table, e.g. for normalizing a training dataset.
+
+    Args:
+        conn_information (str): The connection string or information required to connect to the PostgreSQL database.
+        variables (list of str, optional): Variable names to read. Default is all.
+        timeresolution (str, optional): Time resolution the statistics were computed for. Default is 'NA' (all).
+
+    Returns:
+        dict: {variablename: statistics} with the keys of finalize_statistics.
+    """
+
+    query = "SELECT variablename, buildingcount, valuecount, mean, std, minvalue, maxvalue, quantiles FROM variablestatistics WHERE timeresolution = %s"
+    params = [timeresolution or 'NA']
+
+    if variables:
+        query += " AND variablename = ANY(%s)"
+        params.append(list(variables))
+
+    with psycopg2.connect(conn_information) as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+    conn.close()
+
+    return {variablename: {'buildingcount': buildingcount, 'valuecount': valuecount, 'mean': mean, 'std': std, 'min': minvalue, 'max': maxvalue,
+                           'quantiles': {float(q): v for q, v in json.loads(quantiles).items()}}
+            for variablename, buildingcount, valuecount, mean, std, minvalue, maxvalue, quantiles in rows}
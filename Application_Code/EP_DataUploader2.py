@@ -2,11 +2,13 @@
 # Required Modules
 
 import os
+import numpy as np
 import pandas as pd
 import csv
 import pickle
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 
 import datetime as dt 
 import dateutil
@@ -15,6 +17,8 @@ import time
 
 import dask.dataframe as dd
 
+from EP_DataCache import invalidate_building
+
 # =============================================================================
 # Format Time
 # ============================================================================
@@ -146,6 +150,20 @@ def get_unique_rows(conn_information, tablename, df, conditions):
 # Upload Data to Database
 # =============================================================================
 
+def insert_df_rows(cur, tablename, df):
+    """
+    Inserts the rows of a DataFrame with execute_values on an open cursor, without committing. Lets callers 
+    upload several DataFrames in one transaction (see EP_DataManager.stream_upload_variable).
+    """
+    
+    columns_str = ', '.join(df.columns.tolist())
+    
+    # SQL INSERT query (dynamically constructed), execute_values fills in pages of rows
+    insert_query = f"INSERT INTO {tablename} ({columns_str}) VALUES %s"
+    
+    # One multi-row INSERT per page instead of one statement per row
+    execute_values(cur, insert_query, [tuple(x) for x in df.to_numpy()], page_size=10000)
+
 def upload_df_to_db(conn_information, tablename, df):
     """
     Upload a Pandas DataFrame to a PostgreSQL database table in bulk.
@@ -159,27 +177,19 @@ def upload_df_to_db(conn_information, tablename, df):
     - None
     """
   
-    # Prepare the SQL INSERT statement dynamically based on DataFrame column names
-    columns = df.columns.tolist()  # Get list of DataFrame column names
-    columns_str = ', '.join(columns)  # Convert column names to a string for SQL query
-    placeholders = ', '.join(['%s'] * len(columns))  # Create placeholders for values
-    
-    # SQL INSERT query (dynamically constructed)
-    insert_query = f"INSERT INTO {tablename} ({columns_str}) VALUES ({placeholders})"
-    
-    # Convert DataFrame to a list of tuples
-    rows = [tuple(x) for x in df.to_numpy()]
-    
     # Connect to the PostgreSQL database
     conn = psycopg2.connect(conn_information)
     cur = conn.cursor()
 
     try:
-        # Execute the bulk insert using executemany
-        cur.executemany(insert_query, rows)
+        # Execute the bulk insert
+        insert_df_rows(cur, tablename, df)
 
         # Commit the transaction to save the changes
         conn.commit()
+        
+        if 'buildingid' in df.columns and len(df) > 0:
+            invalidate_building(list(pd.unique(df['buildingid'])))
     except Exception as e:
         conn.rollback()  # Rollback if there's an error
         print(f"Error: {e}")
@@ -196,137 +206,60 @@ def timeseriesdata_format_df(df, buildingid, variablename, simulation_year, time
     """
     Formats time series data into a DataFrame suitable for further processing.
     
+    The wide EnergyPlus layout (one column per schedule, zone, surface or system node) is melted into the long 
+    timeseriesdata layout with array operations, column by column as before, and every distinct Date/Time 
+    string is formatted once.
+    
     Args:
     - df (pd.DataFrame): Original DataFrame to format.
     - buildingid (str): The ID of the building.
-    - variablename (str): The variable name for processing.
+    - variablename (str): The variable name for processing, with spaces or underscores.
     - simulation_year (int): The year of the simulation.
     
     Returns:
     - new_df (pd.DataFrame): A formatted DataFrame with proper structure.
     """
     
-    # Initialize a list to store rows instead of appending to a DataFrame in each loop
-    rows_list = []
+    variablename_value = variablename.replace('_', ' ').strip()
+    
+    # Subvariable column filled from the EnergyPlus column names, None for building-level variables
+    if variablename_value == 'Schedule Value':
+        subvariable_column = 'schedulename'
+    elif variablename_value.startswith('Facility') or variablename_value.startswith('Site'):
+        subvariable_column = None
+    elif variablename_value.startswith('Zone'):
+        subvariable_column = 'zonename'
+    elif variablename_value.startswith('Surface'):
+        subvariable_column = 'surfacename'
+    elif variablename_value.lower().startswith('system node'):
+        subvariable_column = 'systemnodename'
+    else:
+        return pd.DataFrame()
+    
+    if subvariable_column is None:
+        value_columns = [df.columns[1]] # Assuming data is in the second column
+    else:
+        value_columns = [c for c in df.columns if c != 'Date/Time']
+    
+    datetime_strings = df['Date/Time'].astype(str).str.strip()
+    formatted_datetimes = {datetime_str: format_datetime(simulation_year, datetime_str) for datetime_str in datetime_strings.unique()}
+    datetime_values = datetime_strings.map(formatted_datetimes).to_numpy()
+    
+    row_count = len(df)
+    new_df = pd.DataFrame({
+        'buildingid': buildingid,
+        'datetime': np.tile(datetime_values, len(value_columns)),
+        'timeresolution': str(timeresolution),
+        'variablename': variablename_value,
+        'schedulename': 'NA',
+        'zonename': 'NA',
+        'surfacename': 'NA',
+        'systemnodename': 'NA',
+        # Column by column, all rows of a column together
+        'value': df[value_columns].to_numpy().T.ravel()}, index=np.arange(row_count * len(value_columns)))
     
-    # Process based on the variable type
-    if variablename == 'Schedule_Value':
-        variablename_value = 'Schedule Value'
-        zonename_value = 'NA'
-        surfacename_value = 'NA'
-        systemnodename_value = 'NA'
-        schedulenames = df.columns.tolist()
-        schedulenames.remove('Date/Time')
-
-        for schedulename in schedulenames:
-            schedulename_value = schedulename.split(':')[0].strip()
-            for _, row in df.iterrows():
-                datetime_value = format_datetime(simulation_year, row['Date/Time'].strip())
-                table_cell_value = row[schedulename]
-                new_row = {'buildingid': buildingid, 
-                           'datetime': datetime_value, 
-                           'timeresolution': str(timeresolution),
-                           'variablename': variablename_value, 
-                           'schedulename': schedulename_value,
-                           'zonename': zonename_value,
-                           'surfacename': surfacename_value,
-                           'systemnodename': systemnodename_value,
-                           'value': table_cell_value}
-                rows_list.append(new_row)
-
-    elif variablename.startswith('Facility') or variablename.startswith('Site'):  
-        variablename_value = variablename.replace('_', ' ').strip()
-        schedulename_value = 'NA'
-        zonename_value = 'NA'
-        surfacename_value = 'NA'
-        systemnodename_value = 'NA'
-
-        for _, row in df.iterrows():
-            datetime_value = format_datetime(simulation_year, row['Date/Time'].strip())
-            columnname = df.columns[1]  # Assuming data is in the second column
-            table_cell_value = row[columnname]
-            new_row = {'buildingid': buildingid, 
-                           'datetime': datetime_value, 
-                           'timeresolution': str(timeresolution),
-                           'variablename': variablename_value, 
-                           'schedulename': schedulename_value,
-                           'zonename': zonename_value,
-                           'surfacename': surfacename_value,
-                           'systemnodename': systemnodename_value,
-                           'value': table_cell_value}
-            rows_list.append(new_row)
-            
-    elif variablename.startswith('Zone'):
-        variablename_value = variablename.replace('_', ' ').strip()
-        schedulename_value = 'NA'
-        surfacename_value = 'NA'
-        systemnodename_value = 'NA'
-
-        for columnname in df.columns:
-            if columnname != 'Date/Time':
-                zonename_value = columnname.split(':')[0].strip()
-                for _, row in df.iterrows():
-                    datetime_value = format_datetime(simulation_year, row['Date/Time'].strip())
-                    table_cell_value = row[columnname]
-                    new_row = {'buildingid': buildingid, 
-                           'datetime': datetime_value, 
-                           'timeresolution': str(timeresolution),
-                           'variablename': variablename_value, 
-                           'schedulename': schedulename_value,
-                           'zonename': zonename_value,
-                           'surfacename': surfacename_value,
-                           'systemnodename': systemnodename_value,
-                           'value': table_cell_value}
-                    rows_list.append(new_row)
-
-    elif variablename.startswith('Surface'):
-        variablename_value = variablename.replace('_', ' ').strip()
-        schedulename_value = 'NA'
-        zonename_value = 'NA'
-        systemnodename_value = 'NA'
-
-        for columnname in df.columns:
-            if columnname != 'Date/Time':
-                surfacename_value = columnname.split(':')[0].strip()
-                for _, row in df.iterrows():
-                    datetime_value = format_datetime(simulation_year, row['Date/Time'].strip())
-                    table_cell_value = row[columnname]
-                    new_row = {'buildingid': buildingid, 
-                           'datetime': datetime_value, 
-                           'timeresolution': str(timeresolution),
-                           'variablename': variablename_value, 
-                           'schedulename': schedulename_value,
-                           'zonename': zonename_value,
-                           'surfacename': surfacename_value,
-                           'systemnodename': systemnodename_value,
-                           'value': table_cell_value}
-                    rows_list.append(new_row)
-
-    elif variablename.startswith('System_node'):
-        variablename_value = variablename.replace('_', ' ').strip()
-        schedulename_value = 'NA'
-        zonename_value = 'NA'
-        surfacename_value = 'NA'
-
-        for columnname in df.columns:
-            if columnname != 'Date/Time':
-                systemnodename_value = columnname.split(':')[0].strip()
-                for _, row in df.iterrows():
-                    datetime_value = format_datetime(simulation_year, row['Date/Time'].strip())
-                    table_cell_value = row[columnname]
-                    new_row = {'buildingid': buildingid, 
-                           'datetime': datetime_value, 
-                           'timeresolution': str(timeresolution),
-                           'variablename': variablename_value, 
-                           'schedulename': schedulename_value,
-                           'zonename': zonename_value,
-                           'surfacename': surfacename_value,
-                           'systemnodename': systemnodename_value,
-                           'value': table_cell_value}
-                    rows_list.append(new_row)
-
-    # Convert the list of rows into a DataFrame
-    new_df = pd.DataFrame(rows_list)
+    if subvariable_column is not None:
+        new_df[subvariable_column] = np.repeat([columnname.split(':')[0].strip() for columnname in value_columns], row_count)
     
     return new_df
 
@@ -356,16 +289,18 @@ def upload_pickle(conn_information, buildingid, simulation_year, timeresolution,
 # Test 
 # =============================================================================
 
-pickle_filepath = "D:\Building_Modeling_Code\Results\Processed_BuildingSim_Data\ASHRAE_2013_Albuquerque_ApartmentHighRise\Sim_ProcessedData\IDF_OutputVariables_DictDF.pickle"
-conn_information = "dbname=Building_Models user=kasey password=OfficeLarge"
-simulation_year = '2013'
-buildingid = 1
-timeresolution = 5
-
-start_time = time.time()
-upload_pickle(conn_information, buildingid, simulation_year, timeresolution, pickle_filepath)
-end_time = time.time()
-elapsed_time = start_time - end_time
-print(elapsed_time)
+if __name__ == '__main__':
+
+    pickle_filepath = "D:\Building_Modeling_Code\Results\Processed_BuildingSim_Data\ASHRAE_2013_Albuquerque_ApartmentHighRise\Sim_ProcessedData\IDF_OutputVariables_DictDF.pickle"
+    conn_information = "dbname=Building_Models user=kasey password=OfficeLarge"
+    simulation_year = '2013'
+    buildingid = 1
+    timeresolution = 5
+
+    start_time = time.time()
+    upload_pickle(conn_information, buildingid, simulation_year, timeresolution, pickle_filepath)
+    end_time = time.time()
+    elapsed_time = start_time - end_time
+    print(elapsed_time)
 
 
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-validation of the simulation catalog. Broken IDF/weather pairs are quarantined before scheduling so that
+no EnergyPlus launch is wasted on a model that will crash.
+
+"""
+
+# =============================================================================
+# Import Required Modules
+# =============================================================================
+
+# External Modules
+import os
+import re
+import shutil
+import opyplus as op
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# =============================================================================
+# Validation Settings
+# =============================================================================
+
+# IDF objects (lower-case) and the number of times they must occur: None = at least once.
+# make_edited_idf edits the one RunPeriod and one Timestep object.
+REQUIRED_IDF_OBJECTS = {'version': 1, 'building': 1, 'timestep': 1, 'runperiod': 1, 'zone': None}
+
+QUARANTINE_LIST_FILEPATH = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles', 'Quarantine_List.csv')
+
+# =============================================================================
+# Structural Check
+# =============================================================================
+
+def count_idf_objects(idf_text):
+    """
+    Counts the objects of every type in an IDF file's text, without building an object model.
+
+    Returns:
+        tuple: ({object type (lower-case): count}, trailing text after the last ';').
+    """
+
+    # Drop comments, objects are terminated by ';' and their type is the text before the first ','
+    idf_text = re.sub(r'!.*', '', idf_text)
+    objects = idf_text.split(';')
+
+    object_counts = {}
+    for idf_object in objects[:-1]:
+        object_type = idf_object.split(',')[0].strip().lower()
+        object_counts[object_type] = object_counts.get(object_type, 0) + 1
+
+    return object_counts, objects[-1].strip()
+
+def validate_structure(idf_filepath, weather_filepath):
+    """
+    Cheap structural check of one IDF/weather pair: both files are readable, every IDF object is terminated,
+    the objects required by the simulation pipeline are present and the weather file has an EPW header.
+
+    Args:
+        idf_filepath (str): The IDF file.
+        weather_filepath (str): The EPW file.
+
+    Returns:
+        list: Error messages, empty if the pair passed.
+    """
+
+    errors = []
+
+    try:
+        with open(idf_filepath, 'r', errors='replace') as file:
+            object_counts, trailing_text = count_idf_objects(file.read())
+    except OSError as error:
+        return ["IDF not readable: " + str(error)]
+
+    if trailing_text:
+        errors.append("Unterminated object at end of IDF: " + trailing_text[:40])
+    if '' in object_counts:
+        errors.append("Object without type")
+
+    for object_type, required_count in REQUIRED_IDF_OBJECTS.items():
+        count = object_counts.get(object_type, 0)
+        if count == 0:
+            errors.append("Missing " + object_type)
+        elif required_count is not None and count != required_count:
+            errors.append(str(count) + " " + object_type + " objects, expected " + str(required_count))
+
+    try:
+        with open(weather_filepath, 'r', errors='replace') as file:
+            if not file.readline().upper().startswith('LOCATION'):
+                errors.append("Weather file has no LOCATION header")
+    except OSError as error:
+        errors.append("Weather file not readable: " + str(error))
+
+    return errors
+
+# =============================================================================
+# Design-Day Smoke Run
+# =============================================================================
+
+def smoke_run(idf_filepath, weather_filepath, validation_folderpath):
+    """
+    Runs EnergyPlus on the sizing periods (design days) only, which takes seconds, and reports fatal errors.
+
+    Args:
+        idf_filepath (str): The IDF file.
+        weather_filepath (str): The EPW file.
+        validation_folderpath (str): Scratch folder, deleted afterwards.
+
+    Returns:
+        list: Error messages, empty if the run ended without a fatal error.
+    """
+
+    if not os.path.exists(validation_folderpath): os.makedirs(validation_folderpath)
+
+    try:
+        # Loading also validates the IDF against the opyplus schema
+        smoke_idf = op.Epm.load(idf_filepath)
+
+        simulation_controls = smoke_idf.SimulationControl.select()
+        if len(simulation_controls) == 0:
+            smoke_idf.SimulationControl.add(run_simulation_for_sizing_periods='Yes', run_simulation_for_weather_file_run_periods='No')
+        else:
+            simulation_control = simulation_controls.one()
+            simulation_control['run_simulation_for_sizing_periods'] = 'Yes'
+            simulation_control['run_simulation_for_weather_file_run_periods'] = 'No'
+
+        smoke_idf_filepath = os.path.join(validation_folderpath, os.path.basename(idf_filepath))
+        smoke_idf.save(smoke_idf_filepath)
+
+        op.simulate(smoke_idf_filepath, weather_filepath, base_dir_path=validation_folderpath)
+
+        err_filepath = os.path.join(validation_folderpath, 'eplusout.err')
+        if not os.path.exists(err_filepath):
+            return ["Smoke run produced no eplusout.err"]
+
+        with open(err_filepath, 'r', errors='replace') as file:
+            fatal_lines = [line.strip() for line in file if '** Fatal' in line]
+
+        return ["Smoke run: " + line for line in fatal_lines]
+
+    except Exception as error:
+        return ["Smoke run failed: " + str(error)]
+
+    finally:
+        shutil.rmtree(validation_folderpath, ignore_errors=True)
+
+# =============================================================================
+# Validate the Catalog in Parallel
+# =============================================================================
+
+def validate_simulation_task(idf_filepath, weather_filepath, sim_results_folderpath, run_smoke_test):
+    """
+    Thread pool task validating one catalog row, see validate_simulations.
+
+    Returns:
+        tuple: (idf_filepath, weather_filepath, list of error messages).
+    """
+
+    errors = validate_structure(idf_filepath, weather_filepath)
+
+    if not errors and run_smoke_test:
+        # Results folders are per IDF, the weather file stem keeps the pairings of one IDF apart
+        weather_name = os.path.splitext(os.path.basename(weather_filepath))[0]
+        validation_folderpath = os.path.abspath(os.path.join(sim_results_folderpath, '..', 'Validation_Folder', os.path.basename(sim_results_folderpath) + '_' + weather_name))
+        errors = smoke_run(idf_filepath, weather_filepath, validation_folderpath)
+
+    return idf_filepath, weather_filepath, errors
+
+def validate_simulations(sim_information_filepath=None, run_smoke_test=False, max_workers=None):
+    """
+    Validates every pending row of Simulation_Information.csv and writes the failures to Quarantine_List.csv,
+    which automated_data_generation skips. Replaces the hardcoded filename filters of remove_broken_idfs.
+
+    Rows that are Complete, Uploaded or Removed are not validated. Each row is a thread pool task running the
+    structural check and, if run_smoke_test is True and the check passed, a design-day smoke run. Threads are 
+    enough since the work is file reads and EnergyPlus subprocesses.
+
+    Args:
+        sim_information_filepath (str, optional): Defaults to Generated_Textfiles/Simulation_Information.csv.
+        run_smoke_test (bool, optional): Also run EnergyPlus on the design days. Default is False.
+        max_workers (int, optional): Number of worker threads. Default is the ThreadPoolExecutor default.
+
+    Returns:
+        dict: {(idf_filepath, weather_filepath): list of error messages} of the quarantined pairs.
+    """
+
+    if sim_information_filepath is None:
+        sim_information_filepath = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles', 'Simulation_Information.csv')
+
+    with open(sim_information_filepath, 'r') as file:
+        lines = file.readlines()
+        lines = lines[1:] # Exclude Column Headers
+
+    rows = [line.strip().split(',') for line in lines]
+    rows = [line_fields for line_fields in rows if len(line_fields) >= 5 and line_fields[4] not in ('Complete', 'Uploaded', 'Removed')]
+
+    quarantine = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        futures = [executor.submit(validate_simulation_task, line_fields[1], line_fields[2], line_fields[3], run_smoke_test) for line_fields in rows]
+
+        for future in as_completed(futures):
+            idf_filepath, weather_filepath, errors = future.result()
+            if errors:
+                print("Quarantining: " + os.path.basename(idf_filepath) + " - " + '; '.join(errors) + '\n')
+                quarantine[(idf_filepath, weather_filepath)] = errors
+
+    print("Validated " + str(len(rows)) + " simulations, quarantined " + str(len(quarantine)) + '\n')
+
+    write_quarantine_list(quarantine)
+
+    return quarantine
+
+# =============================================================================
+# Quarantine List
+# =============================================================================
+
+def write_quarantine_list(quarantine):
+    """
+    Writes Quarantine_List.csv with one row per quarantined IDF/weather pair and its reasons.
+    """
+
+    with open(QUARANTINE_LIST_FILEPATH, 'w') as file:
+        file.write('IDF Filepath,Weather Filepath,Reason\n')
+        for (idf_filepath, weather_filepath), errors in sorted(quarantine.items()):
+            file.write(idf_filepath + ',' + weather_filepath + ',' + '; '.join(errors).replace(',', ' ').replace('\n', ' ') + '\n')
+
+def load_quarantine_list():
+    """
+    Returns the quarantined pairs as a set of (idf_filepath, weather_filepath), empty if no validation has been run.
+    """
+
+    if not os.path.exists(QUARANTINE_LIST_FILEPATH):
+        return set()
+
+    with open(QUARANTINE_LIST_FILEPATH, 'r') as file:
+        lines = file.readlines()
+        lines = lines[1:] # Exclude Column Headers
+
+    return {tuple(line.split(',')[:2]) for line in lines if line.strip()}
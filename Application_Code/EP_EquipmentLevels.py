@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Equipment level computation from schedule values and EIO nominal internal gains.
+
+"""
+
+# =============================================================================
+# Import Required Modules
+# =============================================================================
+
+# External Modules
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+# =============================================================================
+# Equipment Settings
+# =============================================================================
+
+# EIO nominal gains table and nominal level column (without unit) for each equipment type
+EQUIPMENT_NOMINAL_COLUMNS = {
+    'People': 'Number of People',
+    'Lights': 'Lighting Level',
+    'ElectricEquipment': 'Equipment Level',
+    'GasEquipment': 'Equipment Level',
+    'HotWaterEquipment': 'Equipment Level',
+    'SteamEquipment': 'Equipment Level',
+    'OtherEquipment': 'Equipment Level'}
+
+# =============================================================================
+# Get Nominal Gains Table
+# =============================================================================
+
+def get_eio_columns(table):
+    """
+    Maps the column names of a processed EIO table without unit to the actual column names, which carry units
+    and stray spaces, e.g. 'Lighting Level' -> ' Lighting Level {W}'.
+    """
+
+    return {c.split('{')[0].strip(): c for c in table.columns}
+
+def get_nominal_gains(eio_outputfile_dict, equipment):
+    """
+    Extracts the schedule name, zone name and nominal level of every object of one equipment type from the processed EIO output.
+
+    Args:
+        eio_outputfile_dict (dict): The dictionary produced by EP_DataGenerator.Process_Eio_OutputFile.
+        equipment (str): One of EQUIPMENT_NOMINAL_COLUMNS, e.g. 'Lights'.
+
+    Returns:
+        pandas.DataFrame or None: Columns 'Schedule Name', 'Zone Name' (upper-case) and 'Nominal Level' (float),
+                                  or None if the building has no such equipment.
+    """
+
+    table = eio_outputfile_dict.get(equipment + ' Internal Gains Nominal')
+    if table is None or len(table) == 0:
+        return None
+
+    columns = get_eio_columns(table)
+
+    nominal_gains = pd.DataFrame({
+        'Schedule Name': table[columns['Schedule Name']].astype(str).str.strip().str.upper().to_numpy(),
+        'Zone Name': table[columns['Zone Name']].astype(str).str.strip().str.upper().to_numpy(),
+        'Nominal Level': pd.to_numeric(table[columns[EQUIPMENT_NOMINAL_COLUMNS[equipment]]], errors='coerce').to_numpy(dtype=np.float64)})
+
+    return nominal_gains
+
+# =============================================================================
+# Compute Equipment Levels
+# =============================================================================
+
+def compute_equipment_levels(schedule_df, eio_outputfile_dict, zone_names):
+    """
+    Computes the equipment level of every equipment type in every zone over time.
+
+    The level of an object is its schedule value times its nominal gain. For each equipment type the schedule
+    columns of all objects are gathered with one fancy index, scaled by the nominal gains with broadcasting and
+    summed into zones with one sparse (object x zone) product, with no per-zone loops.
+
+    Args:
+        schedule_df (pandas.DataFrame): The 'Schedule Value' time series, columns 'SCHEDULE NAME:Schedule Value [](TimeStep)'.
+        eio_outputfile_dict (dict): The dictionary produced by EP_DataGenerator.Process_Eio_OutputFile.
+        zone_names (list): Zone names (upper-case) defining the zone axis.
+
+    Returns:
+        dict: Array-backed result with keys
+            - 'Equipment_Names': array of the E equipment types present in the building.
+            - 'Equipment_Levels': float32 array (E, T, Z), '<Equipment>_Level' per zone (W, or people for People).
+            - 'Schedule_Values': float32 array (E, T, Z), 'Schedule_Value_<Equipment>' per zone, i.e. the level divided
+              by the zone's total nominal level. NaN where the zone has no such equipment.
+            - 'Nominal_Levels': float64 array (E, Z), total nominal level per zone.
+    """
+
+    schedule_values = schedule_df.to_numpy(dtype=np.float32)
+    schedule_position = {str(c).split(':')[0].strip().upper(): k for k, c in enumerate(schedule_df.columns)}
+    zone_position = {name: i for i, name in enumerate(zone_names)}
+
+    # Extra all-NaN column for objects whose schedule is not reported
+    schedule_values = np.hstack([schedule_values, np.full((schedule_values.shape[0], 1), np.nan, dtype=np.float32)])
+    missing_schedule = schedule_values.shape[1] - 1
+
+    equipment_names, equipment_levels, zone_schedule_values, nominal_levels = [], [], [], []
+
+    for equipment in EQUIPMENT_NOMINAL_COLUMNS:
+
+        nominal_gains = get_nominal_gains(eio_outputfile_dict, equipment)
+        if nominal_gains is None:
+            continue
+
+        # Objects in zones outside zone_names are dropped
+        zone_index = nominal_gains['Zone Name'].map(zone_position)
+        nominal_gains = nominal_gains[zone_index.notna().to_numpy()]
+        zone_index = zone_index.dropna().to_numpy(dtype=np.int64)
+
+        schedule_index = nominal_gains['Schedule Name'].map(schedule_position).fillna(missing_schedule).to_numpy(dtype=np.int64)
+        nominal_level = np.nan_to_num(nominal_gains['Nominal Level'].to_numpy())
+
+        # (T x objects) schedule values times nominal gains
+        object_levels = schedule_values[:, schedule_index] * nominal_level[np.newaxis, :]
+
+        # Sum objects into zones
+        incidence = scipy.sparse.csr_matrix((np.ones(len(zone_index)), (np.arange(len(zone_index)), zone_index)), shape=(len(zone_index), len(zone_names)))
+        zone_levels = np.asarray(incidence.T.dot(object_levels.T).T, dtype=np.float32)
+        zone_nominal = incidence.T.dot(nominal_level)
+
+        zone_schedule = np.divide(zone_levels, zone_nominal[np.newaxis, :], out=np.full_like(zone_levels, np.nan), where=zone_nominal[np.newaxis, :] != 0)
+
+        equipment_names.append(equipment)
+        equipment_levels.append(zone_levels)
+        zone_schedule_values.append(zone_schedule.astype(np.float32))
+        nominal_levels.append(zone_nominal)
+
+    time_steps = schedule_values.shape[0]
+
+    return {
+        'Equipment_Names': np.array(equipment_names),
+        'Equipment_Levels': np.stack(equipment_levels) if equipment_levels else np.empty((0, time_steps, len(zone_names)), dtype=np.float32),
+        'Schedule_Values': np.stack(zone_schedule_values) if zone_schedule_values else np.empty((0, time_steps, len(zone_names)), dtype=np.float32),
+        'Nominal_Levels': np.stack(nominal_levels) if nominal_levels else np.empty((0, len(zone_names)))}
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+File helpers shared by the uploaders, the cache and the information CSVs.
+
+"""
+
+# =============================================================================
+# Import Required Modules
+# =============================================================================
+
+# External Modules
+import os
+import tempfile
+
+# =============================================================================
+# Replace a File Atomically
+# =============================================================================
+
+def replace_file(filepath, write, mode='w'):
+    """
+    Writes a file through a uniquely named temporary file in the same folder, then moves it over `filepath` with
+    os.replace. Readers in other threads and processes see either the old or the new content, never a truncated
+    file, and concurrent writers never share a temporary file. The temporary file is removed if `write` raises.
+
+    Args:
+        filepath (str): The file to write.
+        write (callable): Called with the open temporary file, writes the new content.
+        mode (str, optional): 'w' for text, 'wb' for binary content. Default is 'w'.
+
+    Returns:
+        None
+    """
+
+    file_descriptor, temp_filepath = tempfile.mkstemp(prefix=os.path.basename(filepath) + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(filepath)))
+
+    try:
+        with os.fdopen(file_descriptor, mode) as file:
+            write(file)
+        os.replace(temp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(temp_filepath): os.remove(temp_filepath)
+        raise
@@ -6,6 +6,8 @@ import pandas as pd
 import dateutil
 from dateutil.parser import isoparse
 
+from EP_DataCache import invalidate_building
+
 # =============================================================================
 # Get Eio Table Data for One Building 
 # =============================================================================
@@ -83,6 +85,8 @@ def upload_eiotable_data(conn_information, buildingid, eio_outputfile_dict):
         
         cur.close()
         conn.close()
+        
+        invalidate_building(buildingid)
                         
     except Exception as e:
         
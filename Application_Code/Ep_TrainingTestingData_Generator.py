@@ -4,17 +4,24 @@
 
 # External Modules
 import os
+import json
+import queue
+import threading
 import pandas as pd
 import numpy as np
 import pickle
 import datetime
 import copy
+import scipy.sparse
+import psycopg2
 
 # For debugging
 import matplotlib.pyplot as plt
 
 # Custom Modules
 from EP_DataRetrieval import *
+from EP_DataAggregator import aggregate_building_in_database, retrieve_aggregatedtimeseriesdata, load_aggregation_result
+from EP_DataStatistics import load_statistics
 
 # =============================================================================
 # User Inputs
@@ -42,6 +49,727 @@ def retreivedata(conn_information, buildingid, startdatetime, enddatetime, aggre
     
     return df_combined
 
+# =============================================================================
+# Retrieve Data Aggregated inside the Database
+# =============================================================================
+
+def retreivedata_aggregated(conn_information, buildingid, startdatetime, enddatetime, aggregation_config, aggregation_type='AreaWeighted', aggregation_zonename=None, aggregate=True):
+    """
+    Retrieves aggregation-zone level data without pulling zone-level rows to the client.
+
+    The aggregation runs in PostgreSQL (see EP_DataAggregator.aggregate_building_in_database) using the aggregation 
+    zone mapping stored for aggregation_config, and only the aggregated rows are returned.
+
+    Args:
+        aggregate (bool): If False, skip the aggregation step and read previously aggregated rows.
+
+    Returns:
+        pandas.DataFrame: Columns aggregationzonename, variablename, datetime, timeresolution and value.
+    """
+    
+    if aggregate:
+        aggregate_building_in_database(conn_information, buildingid, aggregation_config, aggregation_type, startdatetime=startdatetime, enddatetime=enddatetime)
+    
+    return retrieve_aggregatedtimeseriesdata(conn_information, buildingid, aggregation_config, aggregation_type, aggregation_zonename, startdatetime=startdatetime, enddatetime=enddatetime)
+
+# =============================================================================
+# Get Simulation Paths for a Building
+# =============================================================================
+
+def get_simulation_paths(buildingid):
+    """
+    Looks up the IDF filepath and simulation results folderpath of a building in Simulation_Information.csv.
+
+    Returns:
+        tuple: (idf_filepath, sim_results_folderpath), or (None, None) if the building is not found.
+    """
+    
+    sim_information_filepath = os.path.join(os.path.dirname(__file__), '..', 'Generated_Textfiles', 'Simulation_Information.csv')
+    
+    with open(sim_information_filepath, 'r') as file:
+        lines = file.readlines()
+        lines = lines[1:] # Exclude Column Headers
+    
+    for line in lines:
+        line_fields = line.strip().split(',')
+        if line_fields[0] == str(buildingid):
+            return line_fields[1], line_fields[3]
+    
+    return None, None
+
+# =============================================================================
+# Read IDF Objects
+# =============================================================================
+
+def read_idf_objects(idf_filepath, class_names):
+    """
+    Reads the objects of the requested classes from an IDF file with a plain text scan (no opyplus load).
+
+    Args:
+        idf_filepath (str): The IDF file.
+        class_names (list of str): IDF classes to keep, e.g. ['BuildingSurface:Detailed'].
+
+    Returns:
+        dict: Maps each upper-case class name to a list of objects, each a list of stripped field values (class name excluded).
+    """
+    
+    wanted = {name.upper() for name in class_names}
+    objects = {name: [] for name in wanted}
+    
+    with open(idf_filepath, 'r', errors='ignore') as file:
+        # Drop comments, then split into objects at ';'
+        text = ''.join(line.split('!')[0] for line in file)
+    
+    for idf_object in text.split(';'):
+        fields = [field.strip() for field in idf_object.split(',')]
+        if fields and fields[0].upper() in wanted:
+            objects[fields[0].upper()].append(fields[1:])
+    
+    return objects
+
+# =============================================================================
+# Extract Surface and System Node to Zone Mapping
+# =============================================================================
+
+# Zone name field of each surface class that references its zone directly
+SURFACE_ZONE_FIELDS = {
+    'BUILDINGSURFACE:DETAILED': 3, 'WALL:DETAILED': 2, 'ROOFCEILING:DETAILED': 2, 'FLOOR:DETAILED': 2,
+    'WALL:EXTERIOR': 2, 'WALL:ADIABATIC': 2, 'WALL:UNDERGROUND': 2, 'WALL:INTERZONE': 2,
+    'ROOF': 2, 'CEILING:ADIABATIC': 2, 'CEILING:INTERZONE': 2,
+    'FLOOR:GROUNDCONTACT': 2, 'FLOOR:ADIABATIC': 2, 'FLOOR:INTERZONE': 2, 'INTERNALMASS': 2}
+
+# Parent surface field of each subsurface class
+SUBSURFACE_PARENT_FIELDS = {'FENESTRATIONSURFACE:DETAILED': 3, 'WINDOW': 2, 'DOOR': 2, 'GLAZEDDOOR': 2, 'WINDOW:INTERZONE': 2, 'DOOR:INTERZONE': 2, 'GLAZEDDOOR:INTERZONE': 2}
+
+def extract_zone_mapping(idf_filepath):
+    """
+    Extracts the surface -> zone and system node -> zone mappings of a building from its IDF file.
+
+    Surfaces are mapped through their zone name field, subsurfaces through their parent surface. Nodes are mapped through 
+    ZoneHVAC:EquipmentConnections (zone air node, inlet, exhaust and return nodes, resolving NodeList names). 
+    Nodes that do not belong to a zone (plant and air loop nodes) are not mapped.
+
+    Returns:
+        dict: {'Surface': {surface name: zone name}, 'System Node': {node name: zone name}}, all names upper-case.
+    """
+    
+    objects = read_idf_objects(idf_filepath, list(SURFACE_ZONE_FIELDS) + list(SUBSURFACE_PARENT_FIELDS) + ['ZoneHVAC:EquipmentConnections', 'NodeList'])
+    
+    surface_mapping = {}
+    for class_name, zone_field in SURFACE_ZONE_FIELDS.items():
+        for fields in objects[class_name]:
+            if len(fields) > zone_field:
+                surface_mapping[fields[0].upper()] = fields[zone_field].upper()
+    
+    for class_name, parent_field in SUBSURFACE_PARENT_FIELDS.items():
+        for fields in objects[class_name]:
+            if len(fields) > parent_field and fields[parent_field].upper() in surface_mapping:
+                surface_mapping[fields[0].upper()] = surface_mapping[fields[parent_field].upper()]
+    
+    node_lists = {fields[0].upper(): [node.upper() for node in fields[1:] if node] for fields in objects['NODELIST'] if fields}
+    
+    node_mapping = {}
+    for fields in objects['ZONEHVAC:EQUIPMENTCONNECTIONS']:
+        zone_name = fields[0].upper()
+        # Inlet node list, exhaust node list, zone air node, return air node(s)
+        for node in fields[2:6]:
+            node = node.upper()
+            for member in node_lists.get(node, [node]):
+                if member:
+                    node_mapping[member] = zone_name
+    
+    return {'Surface': surface_mapping, 'System Node': node_mapping}
+
+def get_zone_mapping(idf_filepath, sim_results_folderpath):
+    """
+    Returns the surface and node -> zone mapping of a building, extracting it from the IDF only once and caching 
+    it in ProcessedData/Zone_Mapping.pickle of the simulation results folder.
+    """
+    
+    mapping_filepath = os.path.join(sim_results_folderpath, 'ProcessedData', 'Zone_Mapping.pickle')
+    
+    if os.path.exists(mapping_filepath) and os.path.getmtime(mapping_filepath) >= os.path.getmtime(idf_filepath):
+        with open(mapping_filepath, 'rb') as file:
+            return pickle.load(file)
+    
+    zone_mapping = extract_zone_mapping(idf_filepath)
+    
+    if not os.path.exists(os.path.dirname(mapping_filepath)): os.makedirs(os.path.dirname(mapping_filepath))
+    with open(mapping_filepath, 'wb') as file:
+        pickle.dump(zone_mapping, file)
+    
+    return zone_mapping
+
+# =============================================================================
+# Roll Up Surface and System Node Series to Zones
+# =============================================================================
+
+def rollup_to_zones(matrix, series_keys, mapping, aggregation='mean'):
+    """
+    Reduces surface or system node series to zone series with one sparse matrix product.
+
+    Args:
+        matrix (numpy.ndarray): (time x series) array, e.g. from retrieve_timeseriesdata_matrix.
+        series_keys (list of tuple): Key of each series, the last element being the surface or node name 
+                                     (e.g. (buildingid, variablename, surfacename)).
+        mapping (dict): Surface or node name -> zone name, from get_zone_mapping.
+        aggregation (str): 'mean' or 'sum' over the series of each zone. Default is 'mean'.
+
+    Returns:
+        tuple: (zone_matrix, zone_keys) where zone_keys replace the surface or node name with the zone name. 
+               Series without a zone are dropped. NaN values are ignored in the mean and the sum, a zone whose 
+               series are all NaN at a timestep is NaN.
+    """
+    
+    if aggregation not in ('mean', 'sum'):
+        raise ValueError("aggregation must be 'mean' or 'sum', got " + repr(aggregation))
+    
+    rows, zone_keys, zone_position = [], [], {}
+    cols = []
+    for k, key in enumerate(series_keys):
+        zone_name = mapping.get(str(key[-1]).strip().upper())
+        if zone_name is None:
+            continue
+        zone_key = tuple(key[:-1]) + (zone_name,)
+        if zone_key not in zone_position:
+            zone_position[zone_key] = len(zone_keys)
+            zone_keys.append(zone_key)
+        rows.append(k)
+        cols.append(zone_position[zone_key])
+    
+    incidence = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(series_keys), len(zone_keys)))
+    
+    present = ~np.isnan(matrix)
+    zone_matrix = np.asarray(incidence.T.dot(np.where(present, matrix, 0).T).T, dtype=np.float32)
+    
+    # Zones without any value at a timestep are NaN in both the mean and the sum
+    counts = np.asarray(incidence.T.dot(present.T.astype(np.float32)).T)
+    if aggregation == 'mean':
+        zone_matrix = np.divide(zone_matrix, counts, out=np.full_like(zone_matrix, np.nan), where=counts != 0)
+    else:
+        zone_matrix = np.where(counts != 0, zone_matrix, np.float32(np.nan))
+    
+    return zone_matrix, zone_keys
+
+def retreivedata_zone_rollup(conn_information, buildingid, startdatetime, enddatetime, surface_variables=None, node_variables=None, aggregation='mean'):
+    """
+    Retrieves surface-based and system-node-based variables of a building already rolled up to zones, 
+    so that the number of surface and node series matches the number of zones.
+
+    Returns:
+        pandas.DataFrame: Indexed by datetime, with (buildingid, variablename, zonename) MultiIndex columns.
+    """
+    
+    idf_filepath, sim_results_folderpath = get_simulation_paths(buildingid)
+    zone_mapping = get_zone_mapping(idf_filepath, sim_results_folderpath)
+    
+    frames = []
+    for variables, subvariabletype, mapping in [(surface_variables, 'surfacename', zone_mapping['Surface']), (node_variables, 'systemnodename', zone_mapping['System Node'])]:
+        if not variables:
+            continue
+        matrix, datetime_index, series_keys = retrieve_timeseriesdata_matrix(conn_information, [buildingid], variables, subvariabletype, startdatetime=startdatetime, enddatetime=enddatetime)
+        zone_matrix, zone_keys = rollup_to_zones(matrix, series_keys, mapping, aggregation)
+        if not zone_keys:
+            continue
+        frames.append(pd.DataFrame(zone_matrix, index=pd.DatetimeIndex(datetime_index, name='datetime'), columns=pd.MultiIndex.from_tuples(zone_keys, names=['buildingid', 'variablename', 'zonename'])))
+    
+    return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+# =============================================================================
+# Per-Building Series Sources for the Dataset Builder
+# =============================================================================
+
+def normalize_columns(matrix, column_variables, statistics):
+    """
+    Standardizes each column of a (time x feature) matrix in place with the catalog mean and std of its variable.
+
+    Args:
+        matrix (numpy.ndarray): (T, F) float array.
+        column_variables (list of str): Variable name of each column.
+        statistics (dict): {variablename: statistics} as returned by EP_DataStatistics.load_statistics. 
+                           Columns of variables without statistics are left unchanged.
+
+    Returns:
+        numpy.ndarray: The normalized matrix.
+    """
+    
+    mean = np.array([statistics[v]['mean'] if v in statistics else 0.0 for v in column_variables], dtype=matrix.dtype)
+    std = np.array([statistics[v]['std'] if v in statistics and statistics[v]['std'] else 1.0 for v in column_variables], dtype=matrix.dtype)
+    
+    matrix -= mean
+    matrix /= std
+    
+    return matrix
+
+def iterate_database_series(conn_information, buildingids, variables, subvariabletype=None, subvariables=None, startdatetime=None, enddatetime=None, resample=None, normalize=False):
+    """
+    Yields the (time x series) matrix of each building from the database, one building in memory at a time.
+
+    The series of every building must line up (same variables and subvariables), e.g. building-level variables, 
+    so that all windows share one feature axis.
+
+    Args:
+        normalize (bool): Standardize every column with the statistics stored in the variablestatistics table 
+                          (see EP_DataStatistics.compute_catalog_statistics). Default is False.
+
+    Yields:
+        tuple: (buildingid, matrix) with matrix a float32 array of shape (T, F).
+    """
+    
+    statistics = load_statistics(conn_information, variables) if normalize else None
+    
+    for buildingid in buildingids:
+        matrix, datetime_index, series_keys = retrieve_timeseriesdata_matrix(conn_information, [buildingid], variables, subvariabletype, subvariables, startdatetime, enddatetime, resample=resample)
+        if statistics is not None:
+            # series_keys are (buildingid, variablename, subvariable)
+            normalize_columns(matrix, [key[1] for key in series_keys], statistics)
+        yield buildingid, matrix
+
+def iterate_aggregated_series(completed_simulation_folderpaths, aggregation_zone_name, aggregation_type):
+    """
+    Yields the aggregated zone variables of each building from the columnar store written by EP_DataAggregator, 
+    flattened to (time x (variable, aggregation zone)), followed by the building-level columns.
+
+    Yields:
+        tuple: (completed_simulation_folderpath, matrix) with matrix a float32 array of shape (T, F).
+    """
+    
+    for folderpath in completed_simulation_folderpaths:
+        result = load_aggregation_result(folderpath, aggregation_zone_name, aggregation_type)
+        aggregated = np.moveaxis(result['Aggregated_Values'], 0, 1).reshape(len(result['DateTime_List']), -1)
+        yield folderpath, np.hstack([aggregated, result['Building_Values']]).astype(np.float32, copy=False)
+
+# =============================================================================
+# Build Sliding Windows without Copying
+# =============================================================================
+
+def make_windows(matrix, input_length, target_length, stride=1, target_columns=None, drop_nan=True):
+    """
+    Builds sliding input/target windows over a (time x feature) matrix as strided views.
+
+    Args:
+        matrix (numpy.ndarray): (T, F) array.
+        input_length (int): Timesteps per input window.
+        target_length (int): Timesteps per target window, directly following the input window.
+        stride (int): Timesteps between consecutive windows. Default is 1.
+        target_columns (list of int, optional): Feature columns predicted as targets. Default is all.
+        drop_nan (bool): Drop windows containing NaN. Default is True.
+
+    Returns:
+        tuple: (inputs, targets, starts). inputs has shape (N, input_length, F) and targets (N, target_length, len(target_columns)). 
+               They are views of matrix unless NaN windows are dropped or target_columns is given. starts holds 
+               the time index of each window start.
+    """
+    
+    window_length = input_length + target_length
+    if matrix.shape[0] < window_length:
+        empty = np.empty((0, window_length, matrix.shape[1]), dtype=matrix.dtype)
+        return empty[:, :input_length], empty[:, input_length:], np.empty(0, dtype=np.int64)
+    
+    # (N, F, window_length) view -> (N, window_length, F)
+    windows = np.lib.stride_tricks.sliding_window_view(matrix, window_length, axis=0)[::stride].transpose(0, 2, 1)
+    starts = np.arange(0, matrix.shape[0] - window_length + 1, stride, dtype=np.int64)
+    
+    if drop_nan:
+        # Number of NaN rows before each timestep, a window is clean if the count does not change across it
+        nan_rows = np.concatenate([[0], np.cumsum(np.isnan(matrix).any(axis=1))])
+        clean = nan_rows[starts + window_length] == nan_rows[starts]
+        if not clean.all():
+            windows, starts = windows[clean], starts[clean]
+    
+    inputs = windows[:, :input_length]
+    targets = windows[:, input_length:]
+    if target_columns is not None:
+        targets = targets[:, :, target_columns]
+    
+    return inputs, targets, starts
+
+# =============================================================================
+# Build Memory-Mapped Windowed Dataset
+# =============================================================================
+
+def build_windowed_dataset(series_source, dataset_folderpath, input_length, target_length, stride=1, target_columns=None, windows_per_shard=100000, drop_nan=True):
+    """
+    Writes sliding-window input/target tensors of many buildings to sharded, memory-mapped .npy files.
+
+    Buildings are taken one at a time from series_source, windowed with strided views (see make_windows) and copied 
+    straight into the open shard files, so only one building is ever held in RAM. Shards are 
+    Inputs_<n>.npy (N, input_length, F) and Targets_<n>.npy (N, target_length, F_target). Dataset_Index.json describes 
+    the dataset, including the used rows of each shard (the last one is preallocated and only partly filled), 
+    and Window_Index.npy lists (shard, row, building position, start timestep) for every window.
+
+    Args:
+        series_source (iterable): Yields (building key, (T, F) matrix), e.g. iterate_database_series or iterate_aggregated_series.
+        dataset_folderpath (str): Output folder, created if needed.
+        input_length, target_length, stride, target_columns, drop_nan: See make_windows.
+        windows_per_shard (int): Maximum windows per shard file. Default is 100000.
+
+    Returns:
+        str: Filepath of Dataset_Index.json.
+    """
+    
+    if not os.path.exists(dataset_folderpath): os.makedirs(dataset_folderpath)
+    
+    shards, buildings, window_index = [], [], []
+    inputs_shard, targets_shard, shard_rows = None, None, 0
+    
+    def open_shard(feature_count, target_count, dtype):
+        shard_number = len(shards)
+        shards.append({'inputs': 'Inputs_' + str(shard_number) + '.npy', 'targets': 'Targets_' + str(shard_number) + '.npy', 'windows': 0})
+        inputs = np.lib.format.open_memmap(os.path.join(dataset_folderpath, shards[-1]['inputs']), mode='w+', dtype=dtype, shape=(windows_per_shard, input_length, feature_count))
+        targets = np.lib.format.open_memmap(os.path.join(dataset_folderpath, shards[-1]['targets']), mode='w+', dtype=dtype, shape=(windows_per_shard, target_length, target_count))
+        return inputs, targets
+    
+    feature_count = None
+    
+    for building_key, matrix in series_source:
+        
+        if feature_count is None:
+            feature_count = matrix.shape[1]
+            target_count = feature_count if target_columns is None else len(target_columns)
+            dtype = matrix.dtype
+        elif matrix.shape[1] != feature_count:
+            raise ValueError("Building " + str(building_key) + " has " + str(matrix.shape[1]) + " features, expected " + str(feature_count))
+        
+        inputs, targets, starts = make_windows(matrix, input_length, target_length, stride, target_columns, drop_nan)
+        buildings.append(str(building_key))
+        
+        written = 0
+        while written < len(starts):
+            if inputs_shard is None or shard_rows == windows_per_shard:
+                if inputs_shard is not None: inputs_shard.flush(); targets_shard.flush()
+                inputs_shard, targets_shard = open_shard(feature_count, target_count, dtype)
+                shard_rows = 0
+            
+            count = min(len(starts) - written, windows_per_shard - shard_rows)
+            inputs_shard[shard_rows:shard_rows + count] = inputs[written:written + count]
+            targets_shard[shard_rows:shard_rows + count] = targets[written:written + count]
+            
+            window_index.append(np.column_stack([np.full(count, len(shards) - 1), np.arange(shard_rows, shard_rows + count), np.full(count, len(buildings) - 1), starts[written:written + count]]))
+            
+            shard_rows += count
+            shards[-1]['windows'] = shard_rows
+            written += count
+    
+    if inputs_shard is not None:
+        inputs_shard.flush(); targets_shard.flush()
+        del inputs_shard, targets_shard
+    
+    window_index = np.concatenate(window_index).astype(np.int64) if window_index else np.empty((0, 4), dtype=np.int64)
+    np.save(os.path.join(dataset_folderpath, 'Window_Index.npy'), window_index)
+    
+    dataset_index = {'input_length': input_length, 'target_length': target_length, 'stride': stride, 
+                     'target_columns': target_columns, 'feature_count': feature_count, 'windows': int(len(window_index)), 
+                     'shards': shards, 'buildings': buildings}
+    
+    dataset_index_filepath = os.path.join(dataset_folderpath, 'Dataset_Index.json')
+    with open(dataset_index_filepath, 'w') as file:
+        json.dump(dataset_index, file, indent=1)
+    
+    return dataset_index_filepath
+
+# =============================================================================
+# Load Random Batches from the Windowed Dataset
+# =============================================================================
+
+def load_windowed_dataset(dataset_folderpath):
+    """
+    Opens a dataset written by build_windowed_dataset without reading the shards into RAM.
+
+    Returns:
+        dict: The dataset index plus 'window_index' (array) and memory-mapped 'inputs' and 'targets' lists, one per shard.
+    """
+    
+    with open(os.path.join(dataset_folderpath, 'Dataset_Index.json'), 'r') as file:
+        dataset = json.load(file)
+    
+    dataset['window_index'] = np.load(os.path.join(dataset_folderpath, 'Window_Index.npy'))
+    # Slicing a memmap keeps it a memmap, the unused tail of the last shard is never read
+    dataset['inputs'] = [np.load(os.path.join(dataset_folderpath, shard['inputs']), mmap_mode='r')[:shard['windows']] for shard in dataset['shards']]
+    dataset['targets'] = [np.load(os.path.join(dataset_folderpath, shard['targets']), mmap_mode='r')[:shard['windows']] for shard in dataset['shards']]
+    
+    return dataset
+
+def load_random_batch(dataset, batch_size, rng=None, window_ids=None):
+    """
+    Reads a random batch of windows from an opened dataset (see load_windowed_dataset). Only the requested rows are read from disk.
+
+    Args:
+        dataset (dict): As returned by load_windowed_dataset.
+        batch_size (int): Number of windows.
+        rng (numpy.random.Generator, optional): Random generator. Default is a new default_rng().
+        window_ids (numpy.ndarray, optional): Restrict sampling to these rows of dataset['window_index'].
+
+    Returns:
+        tuple: (inputs, targets) arrays of shape (batch_size, input_length, F) and (batch_size, target_length, F_target).
+    """
+    
+    if rng is None: rng = np.random.default_rng()
+    if window_ids is None: window_ids = np.arange(len(dataset['window_index']))
+    
+    selected = dataset['window_index'][rng.choice(window_ids, size=batch_size, replace=len(window_ids) < batch_size)]
+    
+    # Read shard by shard with sorted rows for sequential disk access
+    order = np.lexsort((selected[:, 1], selected[:, 0]))
+    selected = selected[order]
+    
+    inputs = np.concatenate([dataset['inputs'][shard][selected[selected[:, 0] == shard, 1]] for shard in np.unique(selected[:, 0])])
+    targets = np.concatenate([dataset['targets'][shard][selected[selected[:, 0] == shard, 1]] for shard in np.unique(selected[:, 0])])
+    
+    return inputs, targets
+
+# =============================================================================
+# Building-Stratified Train/Validation/Test Split
+# =============================================================================
+
+# buildingids columns defining the strata of split_buildings
+SPLIT_STRATA_COLUMNS = ['buildingtype', 'buildingclimatezone', 'buildingheatingtype']
+
+def retrieve_building_catalog(conn_information):
+    """
+    Reads the buildingids table.
+
+    Returns:
+        pandas.DataFrame: One row per building with the buildingids columns.
+    """
+    
+    with psycopg2.connect(conn_information) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT * FROM buildingids ORDER BY buildingid")
+            catalog = pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+    conn.close()
+    
+    return catalog
+
+def split_buildings(catalog, fractions=(0.7, 0.15, 0.15), strata_columns=None, seed=0):
+    """
+    Partitions buildings into train, validation and test sets, stratified by building type, climate zone and 
+    heating type so that every split sees the same mix of buildings. Whole buildings go to one split, so no 
+    building leaks between training and testing.
+
+    Within each stratum buildings are shuffled and every split gets the floor of its share. The remaining buildings 
+    (one per stratum and split at most) are allocated across strata, each to the split furthest below its overall 
+    target, so that the split sizes follow fractions even when the strata only hold a few buildings.
+
+    Args:
+        catalog (pandas.DataFrame): Building catalog, see retrieve_building_catalog.
+        fractions (tuple of float): Train, validation and test fractions. Default is (0.7, 0.15, 0.15).
+        strata_columns (list of str, optional): Catalog columns defining the strata. Default is SPLIT_STRATA_COLUMNS.
+        seed (int): Seed of the shuffle, the split is reproducible for a given catalog. Default is 0.
+
+    Returns:
+        dict: {'train': list of buildingid, 'val': list of buildingid, 'test': list of buildingid}.
+    """
+    
+    if strata_columns is None: strata_columns = SPLIT_STRATA_COLUMNS
+    
+    fractions = np.asarray(fractions, dtype=np.float64) / np.sum(fractions)
+    split_names = ['train', 'val', 'test']
+    splits = {name: [] for name in split_names}
+    rng = np.random.default_rng(seed)
+    
+    strata = []
+    for _, stratum in catalog.groupby([catalog[c].fillna('NA') for c in strata_columns], sort=True):
+        buildingids = rng.permutation(stratum['buildingid'].to_numpy())
+        exact = fractions * len(buildingids)
+        strata.append((buildingids, np.floor(exact).astype(int), exact - np.floor(exact)))
+    
+    # Floor allocation within the strata, then the leftovers against the overall targets
+    targets = fractions * len(catalog)
+    assigned = np.sum([counts for _, counts, _ in strata], axis=0) if strata else np.zeros(len(split_names))
+    
+    for buildingids, counts, remainders in strata:
+        remainders = remainders.copy()
+        for _ in range(len(buildingids) - counts.sum()):
+            # Split furthest below its target among those without a leftover of this stratum yet, 
+            # ties go to the larger remainder within the stratum
+            deficits = np.where(remainders >= 0, targets - assigned, -np.inf)
+            k = np.lexsort((-remainders, -deficits))[0]
+            counts[k] += 1
+            assigned[k] += 1
+            remainders[k] = -1
+    
+    for buildingids, counts, _ in strata:
+        for name, part in zip(split_names, np.split(buildingids, np.cumsum(counts)[:-1])):
+            splits[name].extend(int(b) for b in part)
+    
+    return splits
+
+# =============================================================================
+# Background Prefetching Batch Generators
+# =============================================================================
+
+def prefetch(generator, buffer_size=4):
+    """
+    Runs a generator on a background thread and yields its items, keeping up to buffer_size items ready.
+
+    Database and disk reads release the GIL, so the next batches load while the training loop works on the 
+    current one. Exceptions in the generator are re-raised in the consumer. Closing the returned generator 
+    (or breaking out of the loop) stops the background thread.
+
+    Args:
+        generator (iterable): Producer of items, e.g. iterate_batches.
+        buffer_size (int): Maximum number of prefetched items held in memory. Default is 4.
+
+    Yields:
+        The items of generator, in order.
+    """
+    
+    items = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    finished = object()
+    
+    def put(item):
+        # Give up when the consumer has stopped, instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in generator:
+                if not put(item):
+                    return
+            put(finished)
+        except BaseException as error:
+            put(error)
+    
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    
+    try:
+        while True:
+            item = items.get()
+            if item is finished:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def iterate_batches(series_source, input_length, target_length, batch_size, stride=1, target_columns=None, shuffle=True, seed=0):
+    """
+    Turns per-building series into fixed-size (inputs, targets) batches, holding only one building's windows at a time.
+
+    Windows of each building (see make_windows) are shuffled within the building when shuffle is True and 
+    the remainder of a building is carried over into the next batch. The final batch may be smaller.
+
+    Args:
+        series_source (iterable): Yields (building key, (T, F) matrix), e.g. iterate_database_series.
+        input_length, target_length, stride, target_columns: See make_windows.
+        batch_size (int): Windows per batch.
+        shuffle (bool): Shuffle windows within each building. Default is True.
+        seed (int): Seed of the shuffle. Default is 0.
+
+    Yields:
+        tuple: (inputs, targets) arrays of shape (batch_size, input_length, F) and (batch_size, target_length, F_target).
+    """
+    
+    rng = np.random.default_rng(seed)
+    carry_inputs, carry_targets = [], []
+    carried = 0
+    
+    for building_key, matrix in series_source:
+        
+        inputs, targets, starts = make_windows(matrix, input_length, target_length, stride, target_columns)
+        order = rng.permutation(len(starts)) if shuffle else np.arange(len(starts))
+        
+        position = 0
+        while position < len(order):
+            take = order[position:position + batch_size - carried]
+            carry_inputs.append(inputs[take])
+            carry_targets.append(targets[take])
+            carried += len(take)
+            position += len(take)
+            
+            if carried == batch_size:
+                yield np.concatenate(carry_inputs), np.concatenate(carry_targets)
+                carry_inputs, carry_targets, carried = [], [], 0
+    
+    if carried:
+        yield np.concatenate(carry_inputs), np.concatenate(carry_targets)
+
+def database_batch_generator(conn_information, buildingids, variables, input_length, target_length, batch_size, subvariabletype=None, subvariables=None, 
+                             startdatetime=None, enddatetime=None, resample=None, normalize=False, stride=1, target_columns=None, shuffle=True, seed=0, buffer_size=4):
+    """
+    Prefetching batch generator over the buildings of one split, reading from the database.
+
+    Example:
+    --------
+    splits = split_buildings(retrieve_building_catalog(conn_info))
+    for inputs, targets in database_batch_generator(conn_info, splits['train'], ['Site Outdoor Air Drybulb Temperature'], 24, 6, 256):
+        ...
+
+    Args: See iterate_database_series, iterate_batches and prefetch.
+
+    Yields:
+        tuple: (inputs, targets) batches, see iterate_batches.
+    """
+    
+    if shuffle:
+        buildingids = list(np.random.default_rng(seed).permutation(buildingids))
+    
+    series_source = iterate_database_series(conn_information, buildingids, variables, subvariabletype, subvariables, startdatetime, enddatetime, resample, normalize)
+    
+    yield from prefetch(iterate_batches(series_source, input_length, target_length, batch_size, stride, target_columns, shuffle, seed), buffer_size)
+
+def aggregated_batch_generator(buildingids, aggregation_zone_name, aggregation_type, input_length, target_length, batch_size, 
+                               stride=1, target_columns=None, shuffle=True, seed=0, buffer_size=4):
+    """
+    Prefetching batch generator over the buildings of one split, reading the columnar store of EP_DataAggregator.
+
+    Args: See iterate_aggregated_series, iterate_batches and prefetch. Buildings are located through 
+          Simulation_Information.csv.
+
+    Yields:
+        tuple: (inputs, targets) batches, see iterate_batches.
+    """
+    
+    if shuffle:
+        buildingids = list(np.random.default_rng(seed).permutation(buildingids))
+    
+    folderpaths = [get_simulation_paths(buildingid)[1] for buildingid in buildingids]
+    series_source = iterate_aggregated_series([f for f in folderpaths if f is not None], aggregation_zone_name, aggregation_type)
+    
+    yield from prefetch(iterate_batches(series_source, input_length, target_length, batch_size, stride, target_columns, shuffle, seed), buffer_size)
+
+def windowed_dataset_batch_generator(dataset, building_keys, batch_size, batches=None, seed=0, buffer_size=4):
+    """
+    Prefetching generator of random batches from a memory-mapped windowed dataset, restricted to the windows 
+    of one split's buildings.
+
+    Args:
+        dataset (dict): As returned by load_windowed_dataset.
+        building_keys (list): Buildings of the split, as passed to build_windowed_dataset (compared as strings).
+        batch_size (int): Windows per batch.
+        batches (int, optional): Number of batches. Default is one pass worth of windows.
+        seed (int): Seed of the random generator. Default is 0.
+        buffer_size (int): See prefetch.
+
+    Yields:
+        tuple: (inputs, targets) batches, see load_random_batch.
+    """
+    
+    building_keys = {str(b) for b in building_keys}
+    building_positions = [k for k, key in enumerate(dataset['buildings']) if key in building_keys]
+    window_ids = np.flatnonzero(np.isin(dataset['window_index'][:, 2], building_positions))
+    if len(window_ids) == 0:
+        return
+    
+    if batches is None: batches = int(np.ceil(len(window_ids) / batch_size))
+    rng = np.random.default_rng(seed)
+    
+    def produce():
+        for _ in range(batches):
+            yield load_random_batch(dataset, batch_size, rng, window_ids)
+    
+    yield from prefetch(produce(), buffer_size)
+
 # =============================================================================
 # Getting Required Data from Dataframe
 # =============================================================================
@@ -16,16 +16,21 @@ Created on Mon 20240617
 
 # External Modules
 import os
+import sys
 import numpy as np
 import pandas as pd
 import scipy.io
 import opyplus as op
-import re
 import shutil
 import datetime
 import pickle
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Custom Modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Application_Code')))
+from EP_FileUtilities import replace_file
     
 # =============================================================================
 # Get Location from Climate Zone
@@ -107,125 +112,289 @@ def get_simulation_name(IDF_Filepath):
     
     return Simulation_Name
 
+# =============================================================================
+# Prototype Libraries
+# =============================================================================
+
+SIMULATION_INFORMATION_HEADER = 'BuildingID,IDF Filepath,Weather Filepath,Completed Simulation FolderPath,Simulation Status\n'
+
+# Rows reset by Refresh_Simulation_Information whose old database rows and outputs are still to be removed, 
+# see EP_DataManager.remove_stale_buildings
+STALE_BUILDINGS_HEADER = 'BuildingID,IDF Filepath,Weather Filepath,Completed Simulation FolderPath\n'
+
+# Filename fixes applied before matching, so that multi-word locations match the simulation name
+COMMERCIAL_WEATHERFILE_REPLACEMENTS = [('San.Diego', 'SanDiego'), ('International.Falls', 'InternationalFalls'), ('Great.Falls', 'GreatFalls'), 
+                                       ('New.York', 'NewYork'), ('El.Paso', 'ElPaso'), ('Port.Angeles', 'PortAngeles')]
+MANUFACTURED_WEATHERFILE_REPLACEMENTS = [('San.Francisco', 'SanFrancisco'), ('El.Paso', 'ElPaso')]
+RESIDENTIAL_WEATHERFILE_REPLACEMENTS = COMMERCIAL_WEATHERFILE_REPLACEMENTS
+
+# (IDF folder, weather folder, weather filename replacements, position of the location in the simulation name)
+# IDF files are two subfolder levels below the IDF folder, e.g. Commercial_Prototypes/ASHRAE/90_1_2013
+PROTOTYPE_LIBRARIES = [
+    ("Commercial_Prototypes", "TMY3_WeatherFiles_Commercial", COMMERCIAL_WEATHERFILE_REPLACEMENTS, 2),
+    ("Manufactured_Prototypes", "TMY3_WeatherFiles_Manufactured", MANUFACTURED_WEATHERFILE_REPLACEMENTS, 1),
+    ("Residential_Prototypes", "TMY3_WeatherFiles_Residential", RESIDENTIAL_WEATHERFILE_REPLACEMENTS, 2)]
+
+# =============================================================================
+# Scan Folders
+# =============================================================================
+
+def scan_files(folderpath, extension, depth=0):
+    """
+    Lists the files with a given extension exactly `depth` subfolder levels below a folder, using os.scandir 
+    so that file types come from the directory listing without extra stat calls.
+
+    Args:
+        folderpath (str): Folder to scan.
+        extension (str): File extension, e.g. '.idf'.
+        depth (int): Subfolder levels below folderpath. Default is 0.
+
+    Returns:
+        list: Sorted filepaths.
+    """
+    
+    filepaths = []
+    
+    with os.scandir(folderpath) as entries:
+        for entry in entries:
+            if depth == 0 and entry.is_file() and entry.name.endswith(extension):
+                filepaths.append(entry.path)
+            elif depth > 0 and entry.is_dir():
+                filepaths.extend(scan_files(entry.path, extension, depth - 1))
+    
+    return sorted(filepaths)
+
+def build_weather_index(weatherfile_list, replacements, locations):
+    """
+    Builds the location -> weather filepaths dictionary of one library, once for all of its IDF files.
+
+    A weather file belongs to a location if the location appears in its filename after the replacements, which 
+    is what the per-IDF re.search used to test. Filepaths are the actual files on disk.
+
+    Args:
+        weatherfile_list (list): Weather filepaths.
+        replacements (list of tuple): (old, new) filename replacements.
+        locations (set): Locations occurring in the library's simulation names.
+
+    Returns:
+        dict: {location: list of weather filepaths}.
+    """
+    
+    weather_names = []
+    for weatherfilepath in weatherfile_list:
+        filename = os.path.basename(weatherfilepath)
+        for old, new in replacements:
+            filename = filename.replace(old, new)
+        weather_names.append((filename, weatherfilepath))
+    
+    return {location: [weatherfilepath for filename, weatherfilepath in weather_names if location in filename] for location in locations}
+
 # =============================================================================
 # Generate Simulation Information
 # =============================================================================
 
-def Generate_Simulation_Information(Data_FolderPath, Simulation_Results_FolderPath):
+def collect_simulation_pairs(Data_FolderPath, Simulation_Results_FolderPath, max_workers=None):
+    """
+    Finds every IDF file and matching weather file of the prototype libraries.
+
+    The IDF trees and weather folders of all libraries are scanned in a thread pool, each library's weather files 
+    are indexed by location once, and every IDF is matched with a dictionary lookup.
+
+    Args:
+        Data_FolderPath (str): Folder containing the prototype and weather folders of PROTOTYPE_LIBRARIES.
+        Simulation_Results_FolderPath (str): Folder in which every simulation gets its results folder.
+        max_workers (int, optional): Number of scanning threads. Default is one per folder.
+
+    Returns:
+        list of tuple: (idf_filepath, weather_filepath, simulation_results_folderpath) per simulation.
+    """
+    
+    with ThreadPoolExecutor(max_workers=max_workers or 2 * len(PROTOTYPE_LIBRARIES)) as executor:
+        idf_scans = [executor.submit(scan_files, os.path.join(Data_FolderPath, idf_foldername), ".idf", 2) for idf_foldername, _, _, _ in PROTOTYPE_LIBRARIES]
+        weather_scans = [executor.submit(scan_files, os.path.join(Data_FolderPath, weather_foldername), ".epw") for _, weather_foldername, _, _ in PROTOTYPE_LIBRARIES]
+        idf_file_lists = [scan.result() for scan in idf_scans]
+        weatherfile_lists = [scan.result() for scan in weather_scans]
+    
+    simulation_pairs = []
+    
+    for (_, _, replacements, location_position), idf_file_list, weatherfile_list in zip(PROTOTYPE_LIBRARIES, idf_file_lists, weatherfile_lists):
+        
+        simulation_names = [get_simulation_name(idf_filepath) for idf_filepath in idf_file_list]
+        locations = [simulation_name.split('_')[location_position] for simulation_name in simulation_names]
+        weather_index = build_weather_index(weatherfile_list, replacements, set(locations))
+        
+        for idf_filepath, simulation_name, location in zip(idf_file_list, simulation_names, locations):
+            simulation_results_folderpath = os.path.join(Simulation_Results_FolderPath, simulation_name)
+            for weatherfilepath in weather_index[location]:
+                simulation_pairs.append((idf_filepath, weatherfilepath, simulation_results_folderpath))
+    
+    return simulation_pairs
+
+def Generate_Simulation_Information(Data_FolderPath, Simulation_Results_FolderPath, max_workers=None):
+    """
+    Writes Simulation_Information.csv from scratch with one 'Not Started' row per IDF file and matching weather file, 
+    in a single write. Use Refresh_Simulation_Information to keep the progress of an existing manifest.
+
+    Args:
+        Data_FolderPath, Simulation_Results_FolderPath, max_workers: See collect_simulation_pairs.
+
+    Returns:
+        str: Filepath of Simulation_Information.csv.
+    """
       
     Automated_Generation_FolderPath = os.path.dirname(__file__)
     Simulation_Information_Filepath = os.path.join(Automated_Generation_FolderPath, '..', 'Generated_Textfiles', 'Simulation_Information.csv')
     
-    Simulation_Information = open(Simulation_Information_Filepath, 'w')
-
-    # =============================================================================
-    # Get List of Weather Files
-    # =============================================================================
-
-    commercial_weatherfolderpath = os.path.join(Data_FolderPath, "TMY3_WeatherFiles_Commercial")
-    manufactured_weatherfolderpath = os.path.join(Data_FolderPath, "TMY3_WeatherFiles_Manufactured")
-    residential_weatherfolderpath = os.path.join(Data_FolderPath, "TMY3_WeatherFiles_Residential")
-
-    commercial_weatherfile_list = []
-    for filename in os.listdir(commercial_weatherfolderpath):
-        filename = filename.replace('San.Diego', 'SanDiego')
-        filename = filename.replace('International.Falls', 'InternationalFalls')
-        filename = filename.replace('Great.Falls', 'GreatFalls')
-        filename = filename.replace('New.York', 'NewYork')
-        filename = filename.replace('El.Paso', 'ElPaso')
-        filename = filename.replace('Port.Angeles', 'PortAngeles')
-        filepath = os.path.join(commercial_weatherfolderpath, filename)
-        commercial_weatherfile_list.append(filepath)
-    
-    manufactured_weatherfile_list = []
-    for filename in os.listdir(manufactured_weatherfolderpath):
-        filename = filename.replace('San.Francisco', 'SanFrancisco')
-        filename = filename.replace('El.Paso', 'ElPaso')
-        filepath = os.path.join(manufactured_weatherfolderpath, filename)
-        manufactured_weatherfile_list.append(filepath)
-    
-    residential_weatherfile_list = []
-    for filename in os.listdir(residential_weatherfolderpath):
-        filename = filename.replace('San.Diego', 'SanDiego')
-        filename = filename.replace('International.Falls', 'InternationalFalls')
-        filename = filename.replace('Great.Falls', 'GreatFalls')
-        filename = filename.replace('New.York', 'NewYork')
-        filename = filename.replace('El.Paso', 'ElPaso')
-        filename = filename.replace('Port.Angeles', 'PortAngeles')
-        filepath = os.path.join(residential_weatherfolderpath, filename)
-        residential_weatherfile_list.append(filepath)
-
-    # =============================================================================
-    # Write IDF and Weather Filepath List
-    # =============================================================================
-
-    commercial_idf_folderpath = os.path.join(Data_FolderPath, "Commercial_Prototypes")
-    manufactured_idf_folderpath = os.path.join(Data_FolderPath, "Manufactured_Prototypes")
-    residential_idf_folderpath = os.path.join(Data_FolderPath, "Residential_Prototypes")
-
-    Simulation_Information = open(Simulation_Information_Filepath, 'w')
-    
-    Simulation_Information.write('BuildingID,IDF Filepath,Weather Filepath,Completed Simulation FolderPath,Simulation Status\n')
-
-    # Commercial IDF Files
-    for standard_subfolder in os.listdir(commercial_idf_folderpath):
-        standard_subfolder_path = os.path.join(commercial_idf_folderpath, standard_subfolder)
-        for year_subfolder in os.listdir(standard_subfolder_path):
-            year_subfolder_path = os.path.join(standard_subfolder_path, year_subfolder)
-            for file in os.listdir(year_subfolder_path):
-                if file.endswith(".idf"):
-                    idf_filepath = os.path.join(year_subfolder_path, file)
-                    simulation_name = get_simulation_name(os.path.basename(file))
-                    simulation_results_folderpath = os.path.join(Simulation_Results_FolderPath, simulation_name)
-                    # Write corresponding simulation name
-                    simulation_location = simulation_name.split('_')[2]
-                    # Write corresponding weather filename
-                    found_weatherfile = 0
-                    for weatherfilepath in commercial_weatherfile_list:
-                        if re.search(simulation_location, weatherfilepath): 
-                            Simulation_Information.write('NA,' + idf_filepath + ',' + weatherfilepath + ',' + simulation_results_folderpath + ',' + 'Not Started\n')
-                
-    # Manufactured IDF Files
-    for standard_subfolder in os.listdir(manufactured_idf_folderpath):
-        standard_subfolder_path = os.path.join(manufactured_idf_folderpath, standard_subfolder)
-        for location_subfolder in os.listdir(standard_subfolder_path):
-            location_subfolder_path = os.path.join(standard_subfolder_path, location_subfolder)
-            for file in os.listdir(location_subfolder_path):
-                if file.endswith(".idf"):
-                    idf_filepath = os.path.join(location_subfolder_path, file)
-                    simulation_name = get_simulation_name(os.path.basename(file))
-                    simulation_results_folderpath = os.path.join(Simulation_Results_FolderPath, simulation_name)
-                    # Write corresponding simulation name
-                    simulation_location = simulation_name.split('_')[1]
-                    # Write corresponding weather filename
-                    found_weatherfile = 0
-                    for weatherfilepath in manufactured_weatherfile_list:
-                        if re.search(simulation_location, weatherfilepath): 
-                            Simulation_Information.write('NA,' + idf_filepath + ',' + weatherfilepath + ',' + simulation_results_folderpath + ',' + 'Not Started\n')
-                
-    # Residential IDF Files
-    for standard_subfolder in os.listdir(residential_idf_folderpath):
-        standard_subfolder_path = os.path.join(residential_idf_folderpath, standard_subfolder)
-        for climateZone_subfolder in os.listdir(standard_subfolder_path):
-            climateZone_subfolder_path = os.path.join(standard_subfolder_path, climateZone_subfolder)
-            for file in os.listdir(climateZone_subfolder_path):
-                if file.endswith(".idf"):
-                    idf_filepath = os.path.join(climateZone_subfolder_path, file)
-                    simulation_name = get_simulation_name(os.path.basename(file))
-                    simulation_results_folderpath = os.path.join(Simulation_Results_FolderPath, simulation_name)
-                    # Write corresponding simulation name
-                    simulation_location = simulation_name.split('_')[2]
-                    # Write corresponding weather filename
-                    found_weatherfile = 0
-                    for weatherfilename in residential_weatherfile_list:
-                        if re.search(simulation_location, weatherfilepath):
-                            Simulation_Information.write('NA,' + idf_filepath + ',' + weatherfilepath + ',' + simulation_results_folderpath + ',' + 'Not Started\n')
-
-    # =============================================================================
-    # Close CSV
-    # =============================================================================
-
-    Simulation_Information.close()
+    rows = [SIMULATION_INFORMATION_HEADER]
+    for idf_filepath, weatherfilepath, simulation_results_folderpath in collect_simulation_pairs(Data_FolderPath, Simulation_Results_FolderPath, max_workers):
+        rows.append('NA,' + idf_filepath + ',' + weatherfilepath + ',' + simulation_results_folderpath + ',' + 'Not Started\n')
+    
+    replace_file(Simulation_Information_Filepath, lambda file: file.write(''.join(rows)))
+    
+    return Simulation_Information_Filepath
+
+# =============================================================================
+# File Fingerprints
+# =============================================================================
+
+def hash_file(filepath, blocksize=1024 * 1024):
+    """
+    Returns the SHA-1 digest of a file's content.
+    """
+    
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(blocksize), b''):
+            digest.update(block)
+    
+    return digest.hexdigest()
+
+def update_fingerprints(filepaths, fingerprints, max_workers=None):
+    """
+    Finds the files whose content changed since their stored fingerprint.
+
+    A file whose modification time and size match its stored fingerprint is unchanged without being read. 
+    Otherwise its content is hashed (in a thread pool) and it only counts as changed if the hash differs, so 
+    touched but identical files keep their progress. Files without a stored fingerprint are adopted as unchanged.
+
+    Args:
+        filepaths (iterable): Files to check.
+        fingerprints (dict): {filepath: {'mtime', 'size', 'sha1'}}, updated in place.
+        max_workers (int, optional): Number of hashing threads.
+
+    Returns:
+        set: The changed filepaths.
+    """
+    
+    to_hash = []
+    stats = {}
+    
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        stats[filepath] = stat
+        stored = fingerprints.get(filepath)
+        if stored is None or stored['mtime'] != stat.st_mtime or stored['size'] != stat.st_size:
+            to_hash.append(filepath)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hashes = dict(zip(to_hash, executor.map(hash_file, to_hash)))
+    
+    changed = set()
+    for filepath, sha1 in hashes.items():
+        stored = fingerprints.get(filepath)
+        if stored is not None and stored['sha1'] != sha1:
+            changed.add(filepath)
+        fingerprints[filepath] = {'mtime': stats[filepath].st_mtime, 'size': stats[filepath].st_size, 'sha1': sha1}
+    
+    return changed
+
+# =============================================================================
+# Refresh Simulation Information
+# =============================================================================
+
+def Refresh_Simulation_Information(Data_FolderPath, Simulation_Results_FolderPath, max_workers=None):
+    """
+    Updates Simulation_Information.csv incrementally instead of regenerating it.
+
+    - Rows whose IDF and weather files are unchanged keep their BuildingID and Simulation Status.
+    - New IDF/weather pairs are added as 'Not Started'.
+    - Pairs whose IDF or weather file changed (by mtime, size and content hash) are reset to 'NA' and 'Not Started'.
+      If they had been started, their old row is added to Generated_Textfiles/Stale_Buildings.csv: the old 
+      BuildingID's database rows, cached retrievals and outputs in the results folder are still there and must be 
+      removed with EP_DataManager.remove_stale_buildings before the pair is simulated again.
+    - Pairs whose files are gone are kept with status 'Removed', which the scheduler skips.
+
+    Fingerprints are stored in Generated_Textfiles/Simulation_Fingerprints.json. Without an existing manifest 
+    this is the same as Generate_Simulation_Information. All files are written with replace_file.
+
+    Args:
+        Data_FolderPath, Simulation_Results_FolderPath, max_workers: See collect_simulation_pairs.
+
+    Returns:
+        str: Filepath of Simulation_Information.csv.
+    """
+    
+    Automated_Generation_FolderPath = os.path.dirname(__file__)
+    Simulation_Information_Filepath = os.path.join(Automated_Generation_FolderPath, '..', 'Generated_Textfiles', 'Simulation_Information.csv')
+    Fingerprints_Filepath = os.path.join(Automated_Generation_FolderPath, '..', 'Generated_Textfiles', 'Simulation_Fingerprints.json')
+    Stale_Buildings_Filepath = os.path.join(Automated_Generation_FolderPath, '..', 'Generated_Textfiles', 'Stale_Buildings.csv')
+    
+    # Existing rows by (IDF, weather) pair
+    existing_rows = {}
+    if os.path.exists(Simulation_Information_Filepath):
+        with open(Simulation_Information_Filepath, 'r') as file:
+            for line in file.readlines()[1:]:
+                line_fields = line.strip().split(',')
+                if len(line_fields) >= 5:
+                    existing_rows[(line_fields[1], line_fields[2])] = line_fields
+    
+    fingerprints = {}
+    if os.path.exists(Fingerprints_Filepath):
+        with open(Fingerprints_Filepath, 'r') as file:
+            fingerprints = json.load(file)
+    
+    simulation_pairs = collect_simulation_pairs(Data_FolderPath, Simulation_Results_FolderPath, max_workers)
+    
+    changed = update_fingerprints({filepath for idf_filepath, weatherfilepath, _ in simulation_pairs for filepath in (idf_filepath, weatherfilepath)}, fingerprints, max_workers)
+    
+    rows = [SIMULATION_INFORMATION_HEADER]
+    stale_rows = []
+    counts = {'Unchanged': 0, 'New': 0, 'Changed': 0, 'Removed': 0}
+    
+    for idf_filepath, weatherfilepath, simulation_results_folderpath in simulation_pairs:
+        line_fields = existing_rows.pop((idf_filepath, weatherfilepath), None)
+        if line_fields is not None and idf_filepath not in changed and weatherfilepath not in changed and line_fields[4] != 'Removed':
+            counts['Unchanged'] += 1
+            rows.append(','.join(line_fields) + '\n')
+        else:
+            counts['New' if line_fields is None else 'Changed'] += 1
+            rows.append('NA,' + idf_filepath + ',' + weatherfilepath + ',' + simulation_results_folderpath + ',' + 'Not Started\n')
+            if line_fields is not None and (line_fields[0] != 'NA' or line_fields[4] != 'Not Started'):
+                stale_rows.append(','.join(line_fields[:4]) + '\n')
+    
+    # Pairs no longer in the libraries
+    for line_fields in existing_rows.values():
+        counts['Removed'] += 1
+        line_fields[4] = 'Removed'
+        rows.append(','.join(line_fields) + '\n')
+    
+    # Fingerprints of files no longer in the libraries are dropped
+    current_files = {filepath for idf_filepath, weatherfilepath, _ in simulation_pairs for filepath in (idf_filepath, weatherfilepath)}
+    fingerprints = {filepath: fingerprint for filepath, fingerprint in fingerprints.items() if filepath in current_files}
+    
+    # Stale rows of earlier refreshes not cleaned up yet are kept
+    if stale_rows:
+        if os.path.exists(Stale_Buildings_Filepath):
+            with open(Stale_Buildings_Filepath, 'r') as file:
+                stale_rows = file.readlines()[1:] + stale_rows
+        replace_file(Stale_Buildings_Filepath, lambda file: file.write(STALE_BUILDINGS_HEADER + ''.join(stale_rows)))
+    
+    replace_file(Simulation_Information_Filepath, lambda file: file.write(''.join(rows)))
+    replace_file(Fingerprints_Filepath, lambda file: json.dump(fingerprints, file))
+    
+    print("Refreshed Simulation Information: " + ', '.join(name + ' ' + str(count) for name, count in counts.items()) + '\n')
+    if stale_rows:
+        print("Stale Buildings to Remove (EP_DataManager.remove_stale_buildings): " + str(len(stale_rows)) + '\n')
     
     return Simulation_Information_Filepath
 
@@ -235,6 +404,8 @@ def Generate_Simulation_Information(Data_FolderPath, Simulation_Results_FolderPa
 
 def remove_broken_idfs(simulation_information_csv_filepath):
     
+    # Superseded by EP_DataValidator.validate_simulations, kept for manifests built with the old filters
+    
     with open(simulation_information_csv_filepath, 'r') as file:
         lines = file.readlines()
     
@@ -256,10 +427,12 @@ def remove_broken_idfs(simulation_information_csv_filepath):
 # Main
 # =============================================================================
 
-Data_FolderPath = r"D:\Building_Modeling_Code\Data"
+if __name__ == '__main__':
+
+    Data_FolderPath = r"D:\Building_Modeling_Code\Data"
 
-Automated_DataGeneration_filepath = os.path.dirname(__file__)
-Generated_Data_folderpath = os.path.abspath(os.path.join(Automated_DataGeneration_filepath, '..', 'Generated_Data'))
+    Automated_DataGeneration_filepath = os.path.dirname(__file__)
+    Generated_Data_folderpath = os.path.abspath(os.path.join(Automated_DataGeneration_filepath, '..', 'Generated_Data'))
 
-Simulation_Information_Filepath = Generate_Simulation_Information(Data_FolderPath, Generated_Data_folderpath)
-remove_broken_idfs(Simulation_Information_Filepath)
\ No newline at end of file
+    # Broken IDFs are quarantined by EP_DataValidator.validate_simulations before scheduling, instead of remove_broken_idfs
+    Simulation_Information_Filepath = Refresh_Simulation_Information(Data_FolderPath, Generated_Data_folderpath)
\ No newline at end of file